@@ -0,0 +1,46 @@
+"""add itinerary versions table
+
+Revision ID: 20261017_add_itinerary_versions
+Revises: aa7c9965a439
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20261017_add_itinerary_versions'
+down_revision: Union[str, Sequence[str], None] = 'aa7c9965a439'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'itinerary_versions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('itinerary_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('parent_version', sa.Integer(), nullable=True),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('data', postgresql.JSON(astext_type=sa.Text()), nullable=False),
+        sa.Column('source', sa.String(length=50), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['itinerary_id'], ['itineraries.itinerary_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('itinerary_id', 'version', name='uq_itinerary_versions_itinerary_version'),
+    )
+    op.create_index(op.f('ix_itinerary_versions_itinerary_id'), 'itinerary_versions', ['itinerary_id'], unique=False)
+
+    # Existing itineraries get their baseline snapshot on the first change (services/itinerary_versions.py)
+    op.add_column('itineraries', sa.Column('current_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('itineraries', 'current_version')
+    op.drop_index(op.f('ix_itinerary_versions_itinerary_id'), table_name='itinerary_versions')
+    op.drop_table('itinerary_versions')
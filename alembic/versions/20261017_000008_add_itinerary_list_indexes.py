@@ -0,0 +1,38 @@
+"""add keyset pagination indexes for the itinerary lists
+
+Revision ID: 20261017_add_itinerary_list_indexes
+Revises: 20261017_add_itinerary_versions
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20261017_add_itinerary_list_indexes'
+down_revision: Union[str, Sequence[str], None] = '20261017_add_itinerary_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+LIST_INDEXES = {
+    'ix_itineraries_user_created': 'user_id',
+    'ix_itineraries_session_created': 'session_id',
+    'ix_itineraries_visibility_created': 'visibility',
+}
+
+
+def upgrade() -> None:
+    # (owner, created_at, itinerary_id) of live rows: the list queries read a range of the index instead of an OFFSET scan
+    for name, column in LIST_INDEXES.items():
+        op.create_index(
+            name, 'itineraries', [column, 'created_at', 'itinerary_id'], unique=False,
+            postgresql_where=sa.text('deleted_at IS NULL'),
+        )
+
+
+def downgrade() -> None:
+    for name in LIST_INDEXES:
+        op.drop_index(name, table_name='itineraries')
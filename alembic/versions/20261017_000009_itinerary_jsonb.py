@@ -0,0 +1,57 @@
+"""store itinerary details and metadata as JSONB with GIN indexes
+
+Revision ID: 20261017_itinerary_jsonb
+Revises: 20261017_add_itinerary_list_indexes
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20261017_itinerary_jsonb'
+down_revision: Union[str, Sequence[str], None] = '20261017_add_itinerary_list_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+JSON_COLUMNS = ('details_itinerary', 'itinerary_metadata')
+
+
+def upgrade() -> None:
+    # Rewrites the table (JSONB is stored parsed; key order and duplicate keys are not kept)
+    for column in JSON_COLUMNS:
+        op.alter_column(
+            'itineraries', column,
+            type_=postgresql.JSONB(astext_type=sa.Text()),
+            existing_type=postgresql.JSON(astext_type=sa.Text()),
+            existing_nullable=True,
+            postgresql_using=f'{column}::jsonb',
+        )
+
+    # @> filters: destination city / country code, and the traveler profile of the metadata
+    op.create_index(
+        'ix_itineraries_destinos_gin', 'itineraries',
+        [sa.text("(details_itinerary -> 'destinos') jsonb_path_ops")], postgresql_using='gin',
+    )
+    op.create_index(
+        'ix_itineraries_metadata_gin', 'itineraries',
+        [sa.text('itinerary_metadata jsonb_path_ops')], postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_itineraries_metadata_gin', table_name='itineraries')
+    op.drop_index('ix_itineraries_destinos_gin', table_name='itineraries')
+
+    for column in JSON_COLUMNS:
+        op.alter_column(
+            'itineraries', column,
+            type_=postgresql.JSON(astext_type=sa.Text()),
+            existing_type=postgresql.JSONB(astext_type=sa.Text()),
+            existing_nullable=True,
+            postgresql_using=f'{column}::json',
+        )
@@ -3,14 +3,13 @@ agent_planner_graph.py
 This graph is used to create a react agent with a custom state and tools.
 """
 
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from utils.checkpointer import get_checkpointer
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langgraph.prebuilt import InjectedState
 from pydantic import Field
 from langchain_core.messages import AnyMessage
-from typing import Annotated, Any
+from typing import Annotated, Any, List
 from enum import Enum
 
 from langmem.short_term import SummarizationNode
@@ -20,23 +19,26 @@ from langgraph.types import Command
 from langchain_core.messages import ToolMessage
 
 from states.itinerary import ViajeState
+from states.daily_activities import DailyItineraryOutput
 
 from langgraph.types import interrupt
 
+from utils.llm import get_llm, get_openai_client, WEB_SEARCH_MODEL
+
 # Define model and checkpointer
-model = ChatOpenAI(model="gpt-4o")
-# model = llm
-web_search_model = "gpt-5-mini"
-checkpointer = MemorySaver()
+# The chat model is resolved on each call from the LLM registry (built lazily)
+web_search_model = WEB_SEARCH_MODEL
+checkpointer = get_checkpointer("activities_chat_agent")  # Postgres by default (CHECKPOINTER_BACKEND)
 
 # ==== Custom state ====
-summarization_node = SummarizationNode( 
-    token_counter=count_tokens_approximately,
-    model=model,
-    max_tokens=1500,
-    max_summary_tokens=500,
-    output_messages_key="llm_input_messages",
-)
+def get_summarization_node():
+    return SummarizationNode( 
+        token_counter=count_tokens_approximately,
+        model=get_llm("chat"),
+        max_tokens=1500,
+        max_summary_tokens=500,
+        output_messages_key="llm_input_messages",
+    )
 
 
 class CustomState(AgentState):
@@ -66,11 +68,13 @@ El itinerario de actividades actual está disponible en el estado del sistema.
 <Tools>
 - **web_search**: Busca información en tiempo real para ayudar al usuario con recomendaciones de actividades.
 - **modify_activities**: Modifica las actividades diarias del itinerario. 
-  - Input: `new_itinerary` (ViajeState completo con las modificaciones en itinerario_diario aplicadas)
+  - Input: `dias_modificados` (lista con el contenido COMPLETO de cada día que cambia, identificado por `dia`)
   - Input: `new_itinerary_modifications_summary` (resumen de los cambios realizados)
-  - Esta herramienta recibe el objeto ViajeState COMPLETO.
-  - Debes pasar TODO el itinerario con las modificaciones ya aplicadas en la sección itinerario_diario.
-  - NO modifiques destinos, cantidad_dias, transportes_entre_destinos, etc. SOLO itinerario_diario.
+  - Envía SOLO los días que cambian; los demás días no se tocan.
+  - Cada día enviado reemplaza al día con el mismo número `dia`: incluye todas sus actividades (Mañana, Tarde y Noche), no solo las nuevas.
+  - Para mover una actividad entre días, envía ambos días.
+  - No cambies la `ciudad` de un día (el servidor rechaza el cambio).
+  - Los días resumidos (clave `res`) solo muestran los títulos de sus actividades: no los envíes en `dias_modificados` sin antes pedir al usuario que confirme el día a modificar.
 </Tools>
 
 <STRICT_RULES>
@@ -154,9 +158,9 @@ Las preferencias generales del usuario guardalas como memoria del usuario, las p
 def prompt(
     state: CustomState
 ):
-    itinerary = state["itinerary"]
-    system_msg = f"{PROMPT} El itinerario actual es: {itinerary}"
-    return [{"role": "system", "content": system_msg}] + list(state["messages"])
+    from utils.itinerary_compact import build_itinerary_prompt
+
+    return build_itinerary_prompt("activities_chat_agent", PROMPT, state["itinerary"], state["messages"])
 
 
 # ==== Tools ====
@@ -181,20 +185,44 @@ def prompt(
 
 def modify_activities(
     tool_call_id: Annotated[str, InjectedToolCallId],
-    new_itinerary: ViajeState = Field(..., description="El itinerario COMPLETO actualizado, con todos los cambios en itinerario_diario aplicados"),
+    dias_modificados: List[DailyItineraryOutput] = Field(..., description="Contenido COMPLETO de cada dia que cambia (solo los dias modificados)"),
     new_itinerary_modifications_summary: str = Field(..., description="Resumen de las modificaciones realizadas en las actividades diarias"),
+    itinerary: Annotated[Any, InjectedState("itinerary")] = None,
+    messages: Annotated[list, InjectedState("messages")] = None,
 ) :
     """
     Modifica las actividades diarias del itinerario.
     
-    IMPORTANTE: Esta herramienta recibe el ViajeState COMPLETO con las modificaciones aplicadas.
-    Solo se debe usar para cambiar actividades diarias (itinerario_diario).
+    Recibe solo los dias modificados; cada uno reemplaza al dia con el mismo numero
+    en itinerario_diario. El resto del itinerario se mantiene en el servidor.
     NO modificar destinos, días totales, ni transportes.
     
     Args:
-        - new_itinerary: ViajeState completo con itinerario_diario actualizado
+        - dias_modificados: Lista con el contenido completo de cada dia modificado
         - new_itinerary_modifications_summary: Resumen de los cambios realizados
     """
+    from utils.itinerary_compact import summarized_days
+    from utils.itinerary_patch import ItineraryPatchError, itinerary_to_dict, replace_itinerary_days
+
+    # Validar antes de preguntar al usuario, asi un cambio invalido vuelve al modelo
+    try:
+        # Un dia resumido en el prompt solo mostraba los titulos: reescribirlo perderia sus actividades
+        resumidos = summarized_days(itinerary_to_dict(itinerary), messages) & {str(dia.dia).strip() for dia in dias_modificados}
+        if resumidos:
+            raise ItineraryPatchError(
+                f"los días {', '.join(sorted(resumidos, key=lambda dia: (len(dia), dia)))} están resumidos en el itinerario que ves "
+                "(solo títulos). Pide al usuario que confirme el día a modificar: al mencionarlo se muestra completo"
+            )
+        new_itinerary = replace_itinerary_days(itinerary, dias_modificados)
+    except ItineraryPatchError as e:
+        return Command(update={
+            "messages": [
+                ToolMessage(
+                    f"No se pudieron aplicar los cambios: {e}. Corrige los días y vuelve a intentarlo.",
+                    tool_call_id=tool_call_id
+                )
+            ]
+        })
 
     user_feedback = interrupt(  
         f"Se van a aplicar las siguientes modificaciones a tus actividades: {new_itinerary_modifications_summary}. "
@@ -234,8 +262,7 @@ def web_search(
     """
     Search the web for the query.
     """
-    from openai import OpenAI
-    client = OpenAI()
+    client = get_openai_client()
 
     response = client.responses.create(
         model=web_search_model,
@@ -250,11 +277,14 @@ tools = [web_search, modify_activities]
 
 
 # ==== Create agents ====
+def select_model(state, runtime):
+    return get_llm("chat").bind_tools(tools)
+
 activities_chat_agent = create_react_agent(
-    model,
+    select_model,
     tools=tools,
     prompt=prompt,
     checkpointer=checkpointer,
     state_schema=CustomState,
-    # pre_model_hook=summarization_node, 
+    # pre_model_hook=get_summarization_node(), 
 )
@@ -17,7 +17,7 @@ from tools.web_search import web_search
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain.chat_models import init_chat_model
+from utils.llm import get_llm
 
 
 class AttractionsData (BaseModel):
@@ -254,7 +254,7 @@ def get_feedback_provider_prompt(itinerary: str):
 def web_search_planner(state: State):
     print("\n\nweb_search_planner\n\n")
 
-    response = llm_with_tools.invoke(get_itinerary_prompt(state))
+    response = get_llm("openai_mini").bind_tools(tools).invoke(get_itinerary_prompt(state))
 
     return {"messages": [response]}
 
@@ -263,7 +263,7 @@ def initial_itinerary_agent(state: State):
     print("\n\ninitial_itinerary_agent\n\n")
     thread_id = config["configurable"]["thread_id"]
 
-    response = llm.invoke(get_itinerary_prompt(state) + state["messages"])
+    response = get_llm("openai_mini").invoke(get_itinerary_prompt(state) + state["messages"])
 
     city = state["city"]
     days = state["days"]
@@ -275,7 +275,7 @@ def initial_itinerary_agent(state: State):
 
 def feedback_provider_agent(state: State):
     print("\n\nfeedback_provider_agent\n\n")
-    response = llm.invoke(get_feedback_provider_prompt(state["tmp_itinerary"]))
+    response = get_llm("openai_mini").invoke(get_feedback_provider_prompt(state["tmp_itinerary"]))
     city = state["city"]
     days = state["days"]
     thread_id = config["configurable"]["thread_id"]
@@ -287,7 +287,7 @@ def feedback_provider_agent(state: State):
 
 def feedback_fixer_agent(state: State):
     print("\n\nfeedback_fixer_agent\n\n")
-    llm_structured = llm.with_structured_output(ItineraryDaily)
+    llm_structured = get_llm("openai_mini").with_structured_output(ItineraryDaily)
     response = llm_structured.invoke(get_feedback_fixer_prompt(state))
     city = state["city"]
     days = state["days"]
@@ -367,8 +367,6 @@ graph_builder.add_edge("initial_itinerary_agent", "feedback_provider_agent")
 graph_builder.add_edge("feedback_provider_agent", "feedback_fixer_agent")
 graph_builder.add_edge("feedback_fixer_agent", END)
 
-llm = init_chat_model("openai:gpt-5-mini")
-llm_with_tools = llm.bind_tools(tools)
 memory = InMemorySaver()
 
 # graph = graph_builder.compile(checkpointer=memory)
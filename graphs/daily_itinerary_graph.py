@@ -1,23 +1,20 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 from typing import Annotated
+import operator
+import os
 from langgraph.graph.message import add_messages
 from langchain_core.messages import AnyMessage
 from typing_extensions import TypedDict
 from graphs.activities_city import OUTPUT_TEMPLATE
-from tools.web_search import web_search
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
+from langgraph.types import Send
 from pydantic import Field, BaseModel
 from states.daily_activities import DailyItineraryOutput
+from schemas.itinerary import ItineraryPreferences
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-pro",
-    temperature=0.4,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+from utils.llm import cacheable_system_message
+from utils.llm_router import ainvoke_structured, choose_tier
+from utils.itinerary_validators import validate_city_daily_itinerary
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -30,21 +27,45 @@ class ItineraryOutput(BaseModel):
     actividades_extras: str = Field(..., description="Actividades no incluidas en el itinerario, que le pueden interesar al usuario")
 
 
+class CityItineraryOutput(BaseModel):
+    itinerario_diario: list[DailyItineraryOutput] = Field(..., description="Lista con el itinerario diario completo de cada dia en la ciudad")
+    resumen_ciudad: str = Field(..., description="Resumen del itinerario en la ciudad")
+    recomendaciones: str = Field(..., description="Recomendaciones practicas para la ciudad (transporte local, seguridad, apps, costumbres)")
+    actividades_extras: str = Field(..., description="Actividades en la ciudad no incluidas en el itinerario, que le pueden interesar al usuario")
+
+
 class CityState(TypedDict):
     city: str
     days: str
 
+class CityItineraryResult(TypedDict):
+    city_index: int
+    city: str
+    days: int
+    output: CityItineraryOutput
+
 class ItinerariesState(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
     itinerary_metadata: dict
     cities: list[CityState]
+    city_itineraries: Annotated[list[CityItineraryResult], operator.add]
     final_itinerary: ItineraryOutput
 
+class CityItineraryState(TypedDict):
+    city: str
+    days: str
+    city_index: int
+    first_day: int
+    cities: list[CityState]
+    itinerary_metadata: dict
 
-def get_itinerary_prompt(state: ItinerariesState):
-    print(f"\n\nstate['cities']: {state['cities']}\n\n")
-    return [
-        SystemMessage(content=f"""
+
+# Maximum number of cities generated at the same time (pass as `config` when invoking the graph)
+MAX_CONCURRENCY = int(os.getenv("DAILY_ITINERARY_MAX_CONCURRENCY", "4"))
+GRAPH_CONFIG = {"max_concurrency": MAX_CONCURRENCY}
+
+
+SYSTEM_PROMPT = f"""
 <System>
 Rol: Experto en planificacion de viajes y guia de viajes.
 </System>
@@ -102,13 +123,43 @@ Salida / restricciones:
 Limitaciones y fallbacks:
 - No incluir enlaces no oficiales para reservas de tours o entradas (evitar revendedores).
 </Reasoning>
-"""),
+"""
+
+
+def format_itinerary_metadata(itinerary_metadata: dict) -> str:
+    return f"\n".join([f"  - {key}: {value}" for key, value in itinerary_metadata.items() if value])
+
+
+def get_city_itinerary_prompt(state: CityItineraryState, profile: str = "main"):
+    cities = state["cities"]
+    city_index = state["city_index"]
+    days = int(state["days"])
+    first_day = state["first_day"]
+    last_day = first_day + days - 1
+
+    if city_index == 0:
+        arrival = "Es el primer destino del viaje: el primer día es el día de llegada."
+    else:
+        arrival = f"El primer día se llega desde {cities[city_index - 1]['city']} (día de cambio de destino)."
+
+    if city_index == len(cities) - 1:
+        departure = "Es el último destino del viaje: el último día es el día de regreso."
+    else:
+        departure = f"El último día se viaja hacia {cities[city_index + 1]['city']}."
+
+    return [
+        cacheable_system_message(SYSTEM_PROMPT, profile),
         HumanMessage(content=f"""
-Las ciudades del viaje son:
-{f"\n".join([f"  - {city['city']} ({city['days']} días)" for city in state['cities']])}
+Genera el itinerario diario SOLO para {state['city']} ({days} días), destino {city_index + 1} de {len(cities)} del viaje.
+Los días de este destino son del Día {first_day} al Día {last_day} del viaje completo; usa esa numeración en "dia" y en el titulo.
+{arrival}
+{departure}
+
+Las ciudades del viaje completo son:
+{f"\n".join([f"  - {city['city']} ({city['days']} días)" for city in cities])}
 
 Las preferencias del usuario son:
-{f"\n".join([f"  - {key}: {value}" for key, value in state['itinerary_metadata'].items() if value])}
+{format_itinerary_metadata(state['itinerary_metadata'])}
 """)
     ]
 
@@ -134,34 +185,79 @@ travel_pace: activo
     
     
 
-def web_search_planner(state: ItinerariesState):
-    return {"messages": [llm_with_tools.invoke(get_itinerary_prompt(state))]}
-
-
-def generate_itineraries(state: ItinerariesState):
-    result = llm_structured.invoke(get_itinerary_prompt(state) + state["messages"])
-    return {"final_itinerary": result}
-
-
+# ========= Map / reduce over cities ============
+
+def continue_to_cities(state: ItinerariesState):
+    """Send one generation per city, with the global day range of each city"""
+    sends = []
+    first_day = 1
+    for city_index, city in enumerate(state["cities"]):
+        sends.append(Send("generate_city_itinerary", {
+            "city": city["city"],
+            "days": city["days"],
+            "city_index": city_index,
+            "first_day": first_day,
+            "cities": state["cities"],
+            "itinerary_metadata": state.get("itinerary_metadata") or {},
+        }))
+        first_day += int(city["days"])
+    return sends
+
+
+async def generate_city_itinerary(state: CityItineraryState):
+    days = int(state["days"])
+
+    def validate(output: CityItineraryOutput) -> CityItineraryOutput:
+        validate_city_daily_itinerary(output.itinerario_diario, days, state["city"])
+        return output
+
+    # Short and simple trips start with the cheap model; a structural failure escalates to the main one.
+    # Same input as the route generation: the preferences, not the traveler profile keys of the metadata
+    trip_days = sum(int(city["days"]) for city in state["cities"])
+    itinerary_metadata = state.get("itinerary_metadata") or {}
+    preferences = {field: itinerary_metadata.get(field) for field in ItineraryPreferences.model_fields}
+    result = await ainvoke_structured(
+        "daily_city_itinerary", CityItineraryOutput, lambda profile: get_city_itinerary_prompt(state, profile),
+        validate=validate, tier=choose_tier(trip_days, preferences),
+    )
+    return {"city_itineraries": [CityItineraryResult(
+        city_index=state["city_index"],
+        city=state["city"],
+        days=int(state["days"]),
+        output=result,
+    )]}
+
+
+def merge_itineraries(state: ItinerariesState):
+    """Join the cities in route order and number the days of the whole trip"""
+    city_itineraries = sorted(state["city_itineraries"], key=lambda item: item["city_index"])
+
+    itinerario_diario = []
+    for item in city_itineraries:
+        # Keep only the days assigned to the city, in case the model returned extra ones
+        itinerario_diario.extend(item["output"].itinerario_diario[:item["days"]])
+
+    for numero_dia, dia in enumerate(itinerario_diario, start=1):
+        dia.dia = str(numero_dia)
+
+    final_itinerary = ItineraryOutput(
+        itinerario_diario=itinerario_diario,
+        resumen_itinerario="\n\n".join(f"**{item['city']}**: {item['output'].resumen_ciudad}" for item in city_itineraries),
+        recomendaciones_generales="\n\n".join(f"**{item['city']}**: {item['output'].recomendaciones}" for item in city_itineraries),
+        actividades_extras="\n\n".join(f"**{item['city']}**: {item['output'].actividades_extras}" for item in city_itineraries),
+    )
+    return {"final_itinerary": final_itinerary}
 
-llm_structured = llm.with_structured_output(ItineraryOutput)
-llm_with_tools = llm.bind_tools([web_search])
 
-# Tool node
-tools = [web_search]
-tool_node = ToolNode(tools=tools)
 
 # Nodes
 graph_builder = StateGraph(ItinerariesState)
-graph_builder.add_node("tools", tool_node)
-graph_builder.add_node("web_search_planner", web_search_planner)
-graph_builder.add_node("generate_itineraries", generate_itineraries)
+graph_builder.add_node("generate_city_itinerary", generate_city_itinerary)
+graph_builder.add_node("merge_itineraries", merge_itineraries)
 
 # Edges
-# graph_builder.add_edge(START, "web_search_planner")
-# graph_builder.add_edge("web_search_planner", "tools")
-# graph_builder.add_edge("tools", "generate_itineraries")
-graph_builder.add_edge(START, "generate_itineraries")
-graph_builder.add_edge("generate_itineraries", END)
+graph_builder.add_conditional_edges(START, continue_to_cities, ["generate_city_itinerary"])
+graph_builder.add_edge("generate_city_itinerary", "merge_itineraries")
+graph_builder.add_edge("merge_itineraries", END)
 
 graph = graph_builder.compile()
\ No newline at end of file
@@ -3,14 +3,13 @@ agent_planner_graph.py
 This graph is used to create a react agent with a custom state and tools.
 """
 
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from utils.checkpointer import get_checkpointer
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langgraph.prebuilt import InjectedState
 from pydantic import Field
 from langchain_core.messages import AnyMessage
-from typing import Annotated, Any
+from typing import Annotated, Any, List
 from enum import Enum
 
 from langmem.short_term import SummarizationNode
@@ -19,27 +18,27 @@ from langchain_core.tools import InjectedToolCallId
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage
 
-from states.itinerary import ViajeState
+from states.itinerary import ViajeState, ItineraryPatchOperationState
 
 from langgraph.types import interrupt
 
 
-from utils.llm import llm, llm_cheap
+from utils.llm import get_llm, get_openai_client, WEB_SEARCH_MODEL
 
 # Define model and checkpointer
-model = ChatOpenAI(model="gpt-4o")
-# model = llm
-web_search_model = "gpt-5-mini"
-checkpointer = MemorySaver()
+# The chat model is resolved on each call from the LLM registry (built lazily)
+web_search_model = WEB_SEARCH_MODEL
+checkpointer = get_checkpointer("itinerary_agent")  # Postgres by default (CHECKPOINTER_BACKEND)
 
 # ==== Custom state ====
-summarization_node = SummarizationNode( 
-    token_counter=count_tokens_approximately,
-    model=model,
-    max_tokens=1500,
-    max_summary_tokens=500,
-    output_messages_key="llm_input_messages",
-)
+def get_summarization_node():
+    return SummarizationNode( 
+        token_counter=count_tokens_approximately,
+        model=get_llm("chat"),
+        max_tokens=1500,
+        max_summary_tokens=500,
+        output_messages_key="llm_input_messages",
+    )
 
 
 class CustomState(AgentState):
@@ -56,14 +55,25 @@ Eres colaborativo y tienes un tono personal y agradable.
 <Instructions>
 1. Responde las dudas del cliente de forma clara y concisa.
 2. Puedes usar la herramienta `web_search` para buscar información en la web.
-3. Puedes usar la herramienta `apply_itinerary_modifications` para hacer modificaciones al itinerario.
-4. **ANTES de revertir cambios**: Revisa CUIDADOSAMENTE el itinerario actual en el estado del sistema para asegurarte de restaurar TODOS los elementos originales (destinos, días, transportes, actividades).
+3. Puedes usar la herramienta `patch_itinerary` para hacer modificaciones puntuales al itinerario.
+4. Usa `apply_itinerary_modifications` SOLO si el usuario pide rehacer el itinerario completo.
+5. **ANTES de revertir cambios**: Revisa CUIDADOSAMENTE el itinerario actual en el estado del sistema para asegurarte de restaurar TODOS los elementos originales (destinos, días, transportes, actividades).
 </Instructions>
 
 <Tools>
-Usa la herramienta apply_itinerary_modifications para modificar el itinerario. Con esta herramienta puedes aplicar modificaciones al itinerario.
+Usa la herramienta patch_itinerary para modificar el itinerario. Solo envías los campos que cambian, no el itinerario completo.
 - **web_search**: Busca información en tiempo real para ayudar al usuario con recomendaciones de viajes.
-- **apply_itinerary_modifications**: Modifica el itinerario completo del usuario.
+- **patch_itinerary**: Aplica cambios puntuales al itinerario con operaciones JSON Patch (RFC 6902).
+  - Input: `operations` (lista de operaciones: op, path, value, from_path)
+  - Input: `modifications_summary` (resumen de los cambios realizados)
+  - Ejemplos:
+    - Cambiar los días en un destino: {"op": "replace", "path": "/destinos/1/dias_en_destino", "value": 4}
+    - Agregar un destino al final: {"op": "add", "path": "/destinos/-", "value": {...DestinoState completo...}}
+    - Quitar un transporte: {"op": "remove", "path": "/transportes_entre_destinos/2"}
+    - Reordenar destinos: {"op": "move", "from_path": "/destinos/2", "path": "/destinos/0"}
+  - Si cambias destinos, actualiza también `cantidad_dias` y los transportes afectados.
+  - El servidor valida el resultado; si hay un error, corrige las operaciones y vuelve a intentarlo.
+- **apply_itinerary_modifications**: Reemplaza el itinerario completo del usuario (solo para rehacerlo desde cero).
   - Input: `new_itinerary` (ViajeState completo con las modificaciones aplicadas)
   - Input: `new_itinerary_modifications_summary` (resumen de los cambios realizados)
 </Tools>
@@ -108,9 +118,9 @@ Las preferencias generales del usuario guardalas como memoria del usuario, las p
 def prompt(
     state: CustomState
 ):
-    itinerary = state["itinerary"]
-    system_msg = f"{PROMPT} El itinerario actual es: {itinerary}"
-    return [{"role": "system", "content": system_msg}] + list(state["messages"])
+    from utils.itinerary_compact import build_itinerary_prompt
+
+    return build_itinerary_prompt("itinerary_agent", PROMPT, state["itinerary"], state["messages"])
 
 
 # ==== Tools ====
@@ -202,14 +212,86 @@ def apply_itinerary_modifications(
             ]
         })
 
+def patch_itinerary(
+    tool_call_id: Annotated[str, InjectedToolCallId],
+    operations: List[ItineraryPatchOperationState],
+    modifications_summary: str,
+    itinerary: Annotated[Any, InjectedState("itinerary")] = None,
+):
+    """
+    Apply JSON Patch operations to the current itinerary.
+
+    Only the changed fields are sent; the patch is applied and validated on the server.
+
+    input:
+        - operations: List[ItineraryPatchOperationState]
+        - modifications_summary: str
+    """
+    from utils.itinerary_patch import ItineraryPatchError, apply_itinerary_patch
+    from utils.itinerary_validators import validate_and_fix_itinerary
+
+    # Validate before asking the user, so an invalid patch goes back to the model.
+    # This part runs again when the graph resumes after interrupt(), so it must stay local (no LLM calls).
+    json_patch = [operation.to_json_patch() for operation in operations]
+    try:
+        new_itinerary = apply_itinerary_patch(itinerary, json_patch)
+        # The trip lasts what its destinations add up to: changed stays are not rebalanced back to the old total
+        total_dias = sum(max(1, destino.dias_en_destino) for destino in new_itinerary.destinos)
+        if any(op["path"] == "/cantidad_dias" for op in json_patch) and new_itinerary.cantidad_dias != total_dias:
+            raise ValueError(
+                f"cantidad_dias ({new_itinerary.cantidad_dias}) no coincide con la suma de dias_en_destino ({total_dias}). "
+                "Ajusta los días de los destinos para que sumen la duración pedida"
+            )
+        new_itinerary = validate_and_fix_itinerary(new_itinerary, total_dias, reparar_con_llm=False)
+    except ValueError as e:
+        return Command(update={
+            "messages": [
+                ToolMessage(
+                    f"No se pudieron aplicar las modificaciones: {e}. Corrige las operaciones y vuelve a intentarlo.",
+                    tool_call_id=tool_call_id
+                )
+            ]
+        })
+
+    user_feedback = interrupt(
+        f"Se van a aplicar las siguientes modificaciones al itinerario: {modifications_summary}. "
+        "¿Estás de acuerdo? [Si (s)] (Mencionar cambios si no estas de acuerdo)"
+    )
+
+    user_feedback = user_feedback["messages"].lower()
+
+    print(f"====\n \n User feedback (patch_itinerary): {user_feedback} \n ====")
+
+    if user_feedback == "s" or user_feedback == "si":
+        # Fields that could not be fixed locally are asked to the LLM once, after the confirmation
+        new_itinerary = validate_and_fix_itinerary(new_itinerary, new_itinerary.cantidad_dias)
+        return Command(update={
+            "itinerary": new_itinerary,
+            "messages": [
+                ToolMessage(
+                    "Successfully applied itinerary modifications",
+                    tool_call_id=tool_call_id
+                )
+            ]
+        })
+
+    else:
+        return Command(update={
+            "messages": [
+                ToolMessage(
+                    f"El usuario no aceptó las modificaciones al itinerario, esta fue su respuesta: {user_feedback}",
+                    tool_call_id=tool_call_id
+                )
+            ]
+        })
+
 def web_search(
     query: str
 ) -> str:
     """
     Search the web for the query.
     """
-    from openai import OpenAI
-    client = OpenAI()
+    client = get_openai_client()
 
     response = client.responses.create(
         model=web_search_model,
@@ -220,15 +302,18 @@ def web_search(
     return response.output[-1].content[0].text
 
 # tools = [replace_string_in_itinerary, web_search]
-tools = [web_search, apply_itinerary_modifications]
+tools = [web_search, patch_itinerary, apply_itinerary_modifications]
 
 
 # ==== Create agents ====
+def select_model(state, runtime):
+    return get_llm("chat").bind_tools(tools)
+
 itinerary_agent = create_react_agent(
-    model,
+    select_model,
     tools=tools,
     prompt=prompt,
     checkpointer=checkpointer,
     state_schema=CustomState,
-    # pre_model_hook=summarization_node, 
+    # pre_model_hook=get_summarization_node(), 
 )
@@ -1,9 +1,10 @@
-from langchain_openai import ChatOpenAI
 from prompts.itinerary_prompt import get_itinerary_prompt
 from schemas.itinerary import ItineraryGenerate
-from states.itinerary import ViajeState
-from utils.llm import llm
+from states.itinerary import ViajeState, DestinoState, TransporteEntreDestinosState
+from utils.llm import get_llm
+from utils.llm_router import choose_tier, invoke_structured
 from utils.itinerary_validators import validate_and_fix_itinerary, log_itinerary_structure
+from utils.itinerary_cache import get_itinerary_cache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,29 +15,129 @@ def generate_main_itinerary(state: ItineraryGenerate):
     Genera el itinerario principal usando IA y valida la estructura.
     
     Esta función:
-    1. Invoca la IA para generar el itinerario
+    1. Invoca la IA para generar el itinerario (el modelo economico para viajes
+       cortos y simples, escalando al principal si la validacion falla)
     2. Valida que los transportes sean secuenciales
     3. Auto-corrige si es necesario
     4. Retorna el itinerario validado
+
+    Los itinerarios validados se guardan en cache: una solicitud igual (o
+    similar, si esta habilitado) se responde sin volver a invocar la IA.
     """
-    
-    # Invocar la IA para generar el itinerario
-    llm_structured = llm.with_structured_output(ViajeState)
-    viaje_state = llm_structured.invoke(get_itinerary_prompt(state))
-    
-    # Log de la estructura generada (para debugging)
-    log_itinerary_structure(viaje_state)
-    
-    # Validar y corregir si es necesario
+
+    itinerary_cache = get_itinerary_cache()
+    if itinerary_cache is not None:
+        cached_state = itinerary_cache.get(state)
+        if cached_state is not None:
+            return cached_state
+
+    generados = []  # (tier, itinerario) de cada salida que se pudo interpretar
+
+    def validar(viaje_state: ViajeState) -> ViajeState:
+        # Log de la estructura generada (para debugging)
+        log_itinerary_structure(viaje_state)
+        # Validar y corregir si es necesario (un ValueError escala al modelo principal)
+        return validate_and_fix_itinerary(viaje_state, state.duration_days)
+
+    # Invocar la IA para generar el itinerario (modelo economico primero si el viaje es simple)
+    preferences = state.preferences.model_dump() if state.preferences else None
+    tier = choose_tier(state.duration_days, preferences)
     try:
-        viaje_state_validado = validate_and_fix_itinerary(viaje_state)
+        viaje_state_validado = invoke_structured(
+            "main_itinerary", ViajeState, lambda profile: get_itinerary_prompt(state, profile),
+            validate=validar, tier=tier, on_parsed=lambda tier_generado, viaje_state: generados.append((tier_generado, viaje_state)),
+        )
+        if itinerary_cache is not None:
+            itinerary_cache.set(state, viaje_state_validado)
         return viaje_state_validado
     except ValueError as e:
+        # La salida del modelo economico ya fallo la validacion: solo se retorna la del modelo principal
+        generados_principal = [viaje_state for tier_generado, viaje_state in generados if tier_generado == "main"]
+        if not generados_principal:
+            raise
         print(f"❌ ERROR CRÍTICO: No se pudo validar/corregir el itinerario: {e}")
         # En caso de error crítico, retornar el original y loggear el problema
         # En producción, podrías querer lanzar una excepción o reintentar
         print("⚠️ Retornando itinerario sin validar (REVISAR LOGS)")
-        return viaje_state
+        return generados_principal[-1]
+
+
+# Listas del itinerario que se emiten elemento por elemento durante el streaming
+STREAMED_LISTS = {
+    "destinos": ("destino", DestinoState),
+    "transportes_entre_destinos": ("transporte", TransporteEntreDestinosState),
+}
+
+
+def _completed_items(partial: dict, key: str) -> list:
+    """Elementos de la lista `key` que el modelo ya termino de escribir.
+
+    Un elemento esta completo cuando aparece el siguiente, o cuando el modelo
+    ya paso a otra clave del objeto.
+    """
+    items = partial.get(key) or []
+    keys = list(partial.keys())
+    list_closed = key in keys and keys[-1] != key
+    return items if list_closed else items[:-1]
+
+
+def stream_main_itinerary(state: ItineraryGenerate):
+    """
+    Version en streaming de `generate_main_itinerary`.
+
+    Genera eventos a medida que el modelo completa cada destino y cada
+    transporte, y al final el itinerario completo validado:
+        {"type": "destino", "index": 0, "data": {...}}
+        {"type": "transporte", "index": 0, "data": {...}}
+        {"type": "itinerary", "data": ViajeState}
+    """
+
+    itinerary_cache = get_itinerary_cache()
+    cached_state = itinerary_cache.get(state) if itinerary_cache is not None else None
+    if cached_state is not None:
+        for key, (event_type, _) in STREAMED_LISTS.items():
+            for index, item in enumerate(getattr(cached_state, key) or []):
+                yield {"type": event_type, "index": index, "data": item.model_dump(mode="json")}
+        yield {"type": "itinerary", "data": cached_state}
+        return
+
+    # json_mode devuelve texto JSON, que se puede parsear parcialmente mientras llega
+    llm_json = get_llm("main").with_structured_output(ViajeState.model_json_schema(), method="json_mode")
+
+    emitted = {key: 0 for key in STREAMED_LISTS}
+    partial = {}
+    for partial in llm_json.stream(get_itinerary_prompt(state)):
+        if not isinstance(partial, dict):
+            continue
+        for key, (event_type, item_model) in STREAMED_LISTS.items():
+            items = _completed_items(partial, key)
+            while emitted[key] < len(items):
+                try:
+                    item = item_model.model_validate(items[emitted[key]])
+                except ValueError:
+                    break
+                yield {"type": event_type, "index": emitted[key], "data": item.model_dump(mode="json")}
+                emitted[key] += 1
+
+    viaje_state = ViajeState.model_validate(partial)
+
+    # Elementos que quedaron sin emitir (el ultimo de cada lista, si el JSON termino ahi)
+    for key, (event_type, _) in STREAMED_LISTS.items():
+        items = getattr(viaje_state, key) or []
+        for index in range(emitted[key], len(items)):
+            yield {"type": event_type, "index": index, "data": items[index].model_dump(mode="json")}
+
+    log_itinerary_structure(viaje_state)
+
+    try:
+        viaje_state = validate_and_fix_itinerary(viaje_state, state.duration_days)
+        if itinerary_cache is not None:
+            itinerary_cache.set(state, viaje_state)
+    except ValueError as e:
+        print(f"❌ ERROR CRÍTICO: No se pudo validar/corregir el itinerario: {e}")
+        print("⚠️ Retornando itinerario sin validar (REVISAR LOGS)")
+
+    yield {"type": "itinerary", "data": viaje_state}
 
 
 # DEPRECATED
@@ -0,0 +1,72 @@
+"""
+Lazy access to the compiled LangGraph graphs.
+
+Importing a graph module compiles the graph and pulls in LangChain and the
+provider SDKs, which takes seconds. The API imports this module instead and
+compiles each graph on first use (or in the background warm-up started after
+the server is up), keeping the cold start fast.
+"""
+
+import importlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# name -> (module, attribute)
+GRAPHS: Dict[str, Tuple[str, str]] = {
+    "daily_itinerary": ("graphs.daily_itinerary_graph", "graph"),
+    "itinerary_agent": ("graphs.itinerary_chat_agent", "itinerary_agent"),
+    "activities_chat_agent": ("graphs.activities_chat_agent", "activities_chat_agent"),
+}
+
+_graphs: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_graph(name: str):
+    """Return a compiled graph, importing (and compiling) it on first use"""
+    graph = _graphs.get(name)
+    if graph is not None:
+        return graph
+
+    try:
+        module_name, attribute = GRAPHS[name]
+    except KeyError:
+        raise ValueError(f"Unknown graph: {name}")
+
+    with _lock:
+        if name not in _graphs:
+            _graphs[name] = getattr(importlib.import_module(module_name), attribute)
+        return _graphs[name]
+
+
+def get_graph_attribute(name: str, attribute: str):
+    """Return another attribute of a graph module (e.g. its invocation config)"""
+    module_name, _ = GRAPHS[name]
+    get_graph(name)
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def warm_up_graphs(names: Optional[Iterable[str]] = None) -> None:
+    """Compile the graphs ahead of the first request"""
+    for name in names or GRAPHS.keys():
+        started_at = time.perf_counter()
+        try:
+            get_graph(name)
+            print(f"Graph warm-up: {name} ready in {time.perf_counter() - started_at:.2f}s")
+        except Exception as e:
+            print(f"Graph warm-up: {name} failed: {e}")
+
+
+def start_graph_warm_up() -> Optional[threading.Thread]:
+    """Warm up the graphs in a background thread (disable with GRAPH_WARMUP=false)"""
+    if os.getenv("GRAPH_WARMUP", "true").lower() in ("0", "false", "no", "off"):
+        return None
+    thread = threading.Thread(target=warm_up_graphs, name="graph-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -2,7 +2,7 @@ from typing import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import interrupt
 import time
-from langchain_openai import ChatOpenAI
+from utils.llm import get_llm
 from langchain_core.messages import SystemMessage
 from pydantic import Field
 
@@ -15,8 +15,6 @@ class CitiesDayStructured(TypedDict):
     cities_day: dict[str, int] = Field(..., description="Ciudades y cantidad dedias para un viaje")
     cities_alternative: list[str] = Field(..., description="Ciudades alternativas para visitar en el viaje")
 
-model = ChatOpenAI(model="gpt-5-mini")
-model_structured = model.with_structured_output(CitiesDayStructured)
 
 class State(TypedDict):
     query: str
@@ -93,7 +91,7 @@ def join(state: State):
 
 def suggest_cities_and_days(state: State):
     
-    output = model_structured.invoke(get_cities_and_days_prompt(state))
+    output = get_llm("openai_mini").with_structured_output(CitiesDayStructured).invoke(get_cities_and_days_prompt(state))
     
     print(f"\n\nOutput: {output}\n\n")
     return {"cities_day": output['cities_day'], "cities_alternative": output['cities_alternative']}
@@ -1,6 +1,6 @@
 from states.route import RouteStateInput, RouteStateOutput
 from typing import List
-from langchain_openai import ChatOpenAI
+from utils.llm import get_llm
 from langchain_core.messages import SystemMessage
 from dotenv import load_dotenv
 
@@ -55,8 +55,7 @@ def generate_route(state: RouteStateInput):
 
     print(f"Initail State: {state}")
 
-    model = ChatOpenAI(model="gpt-5-mini")
-    structured_llm = model.with_structured_output(RouteStateOutput)
+    structured_llm = get_llm("openai_mini").with_structured_output(RouteStateOutput)
     results = structured_llm.invoke(
     # results = model.invoke(
         [
@@ -1,8 +1,8 @@
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes.travel_classifier_routes import travel_classifier_router
-from routes.document_analyzer_router import document_analyzer_router
+# from routes.travel_classifier_routes import travel_classifier_router
+# from routes.document_analyzer_router import document_analyzer_router
 from routes.itinerary import itinerary_router
 from routes.transportation import transportation_router
 from routes.accommodations import accommodations_router
@@ -14,6 +14,7 @@ from routes.traveler_test.question_option_score import router as question_option
 from routes.traveler_test.user_answers import router as user_answers_router
 from routes.auth_routes import auth_router
 from routes.user import user_router
+from routes.metrics import metrics_router
 from database import engine
 from database import get_db
 from models.itinerary import Base as ItineraryBase
@@ -24,7 +25,11 @@ from models.traveler_test.question_option import Base as QuestionOptionBase
 from models.traveler_test.question_option_score import Base as QuestionOptionScoreBase
 from models.traveler_test.user_answers import Base as UserAnswersBase
 from models.traveler_test.user_traveler_test import Base as UserTravelerTestBase
+from models.job import Base as JobBase
 from starlette.middleware.sessions import SessionMiddleware
+from graphs.loader import start_graph_warm_up
+from services.itinerary import reset_stale_generations
+from utils.checkpointer import get_checkpointer, start_checkpoint_pruning
 import os
 
 import uvicorn
@@ -42,6 +47,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Job-ID", "X-Next-Cursor"],  # Response headers the frontend reads (job id, next page cursor)
 )
 
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY"))
@@ -55,6 +61,7 @@ QuestionOptionBase.metadata.create_all(bind=engine)
 QuestionOptionScoreBase.metadata.create_all(bind=engine)
 UserAnswersBase.metadata.create_all(bind=engine)
 UserTravelerTestBase.metadata.create_all(bind=engine)
+JobBase.metadata.create_all(bind=engine)
 
 # Include routes
 app.include_router(auth_router)  # Authentication routes (/auth)
@@ -69,9 +76,26 @@ app.include_router(question_router)  # Question routes (/questions)
 app.include_router(question_option_router)  # Question option routes (/question-options)
 app.include_router(question_option_score_router)  # Question option score routes (/question-option-scores)
 app.include_router(user_answers_router)  # User answers routes (/user-answers)
+app.include_router(metrics_router)  # Metrics routes (/api/metrics)
 # app.include_router(travel_classifier_router)
 # app.include_router(document_analyzer_router)
 
+@app.on_event("startup")
+def warm_up_graphs():
+    # Graphs are compiled lazily; warm them up in the background so startup is not blocked
+    start_graph_warm_up()
+
+@app.on_event("startup")
+def open_checkpointer():
+    # Fail here (not on the first chat message) when the checkpoint store is unreachable
+    get_checkpointer()
+    start_checkpoint_pruning()
+
+@app.on_event("startup")
+def release_stale_generations():
+    # Daily plan jobs run in process memory: the ones of a previous process are lost
+    reset_stale_generations()
+
 @app.get("/", response_class=HTMLResponse)
 def home():
     with open("index.html", encoding="utf-8") as f:
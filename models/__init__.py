@@ -1,5 +1,6 @@
 from .user import User
 from .itinerary import Itinerary
+from .itinerary_version import ItineraryVersion
 from .transportation import Transportation
 from .accommodations import Accommodations
 
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, Boolean, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, Boolean, JSON, Index, literal_column, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -15,6 +15,7 @@ class VisibilityEnum(enum.Enum):
 
 class StatusEnum(enum.Enum):
     DRAFT = "draft"
+    GENERATING = "generating"
     CONFIRMED = "confirmed"
 
 
@@ -34,6 +35,15 @@ class TripTypeEnum(enum.Enum):
 
 class Itinerary(Base):
     __tablename__ = "itineraries"
+    __table_args__ = (
+        # Keyset pagination of the lists (newest first, live rows only), see utils/pagination.py
+        Index("ix_itineraries_user_created", "user_id", "created_at", "itinerary_id", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_itineraries_session_created", "session_id", "created_at", "itinerary_id", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_itineraries_visibility_created", "visibility", "created_at", "itinerary_id", postgresql_where=text("deleted_at IS NULL")),
+        # Containment (@>) filters on the destinations (city, country code) and on the metadata (traveler profile)
+        Index("ix_itineraries_destinos_gin", text("(details_itinerary -> 'destinos') jsonb_path_ops"), postgresql_using="gin"),
+        Index("ix_itineraries_metadata_gin", text("itinerary_metadata jsonb_path_ops"), postgresql_using="gin"),
+    )
 
     itinerary_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     user_id: Mapped[str] = mapped_column(String(255), nullable=True, index=True)
@@ -47,8 +57,9 @@ class Itinerary(Base):
     trip_type: Mapped[str] = mapped_column(String(20), nullable=True)
     tags: Mapped[JSON] = mapped_column(JSON, nullable=True)  # Store as JSON array
     notes: Mapped[Text] = mapped_column(Text, nullable=True)
-    details_itinerary: Mapped[JSON] = mapped_column(JSON, nullable=True)
-    itinerary_metadata: Mapped[JSON] = mapped_column(JSON, nullable=True)
+    details_itinerary: Mapped[JSONB] = mapped_column(JSONB, nullable=True)
+    itinerary_metadata: Mapped[JSONB] = mapped_column(JSONB, nullable=True)
+    current_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")  # Latest row of itinerary_versions
     trip_name: Mapped[str] = mapped_column(String(200), nullable=False)
     visibility: Mapped[str] = mapped_column(String(20), nullable=False, default=VisibilityEnum.PRIVATE.value)
     status: Mapped[str] = mapped_column(String(20), nullable=False, default=StatusEnum.DRAFT.value)
@@ -62,3 +73,8 @@ class Itinerary(Base):
 
     def __repr__(self):
         return f"<Itinerary(id={self.itinerary_id}, trip_name='{self.trip_name}', status='{self.status}')>"
+
+
+# details_itinerary -> 'destinos' with the key as a literal (not a bound parameter),
+# so the planner matches it with the ix_itineraries_destinos_gin expression index
+ITINERARY_DESTINATIONS = Itinerary.details_itinerary.op("->", return_type=JSONB)(literal_column("'destinos'"))
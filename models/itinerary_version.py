@@ -0,0 +1,33 @@
+from sqlalchemy import Integer, String, Text, DateTime, JSON, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import enum
+import uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Base
+
+
+class VersionKindEnum(enum.Enum):
+    SNAPSHOT = "snapshot"  # data is the full details_itinerary
+    DIFF = "diff"          # data is a JSON Patch from the previous version
+
+
+class ItineraryVersion(Base):
+    __tablename__ = "itinerary_versions"
+
+    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    itinerary_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("itineraries.itinerary_id", ondelete="CASCADE"), nullable=False, index=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    parent_version: Mapped[int] = mapped_column(Integer, nullable=True)  # Version this one was derived from (undo walks back through it)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    data: Mapped[JSON] = mapped_column(JSON, nullable=False)
+    source: Mapped[str] = mapped_column(String(50), nullable=False)
+    summary: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("itinerary_id", "version", name="uq_itinerary_versions_itinerary_version"),
+    )
+
+    def __repr__(self):
+        return f"<ItineraryVersion(itinerary_id={self.itinerary_id}, version={self.version}, kind='{self.kind}')>"
@@ -0,0 +1,38 @@
+from sqlalchemy import Integer, String, Text, DateTime, JSON, ForeignKey
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Base
+
+
+class JobRecord(Base):
+    """Background job shared by every API process (see services/jobs.py)"""
+    __tablename__ = "jobs"
+
+    job_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(100), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    result: Mapped[JSON] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    started_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    job_metadata: Mapped[JSON] = mapped_column("metadata", JSON, nullable=False, default=dict)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_retries: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<JobRecord(job_id={self.job_id}, kind='{self.kind}', status='{self.status}')>"
+
+
+class JobEventRecord(Base):
+    """Event of a job, read in insertion order by the job streams"""
+    __tablename__ = "job_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(String(36), ForeignKey("jobs.job_id", ondelete="CASCADE"), nullable=False, index=True)
+    event: Mapped[str] = mapped_column(String(50), nullable=False)
+    data: Mapped[JSON] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<JobEventRecord(job_id={self.job_id}, event='{self.event}')>"
@@ -1,7 +1,10 @@
+from langchain_core.messages import HumanMessage
+
 from schemas.itinerary import ItineraryGenerate
+from utils.llm import cacheable_system_message
 
-def get_itinerary_prompt(state: ItineraryGenerate):
-    PROMPT = f"""
+# Static part of the prompt: it must not depend on the request, so providers can cache it
+ITINERARY_SYSTEM_PROMPT = """
 
 Eres un agente de viajes experto con más de 25 años de experiencia en turismo personalizado. 
 Estás especializada en la creación de itinerarios únicos, eficientes y memorables, adaptados de forma óptima para las preferencias del viajero.
@@ -18,13 +21,7 @@ Estás especializada en la creación de itinerarios únicos, eficientes y memora
 - Realiza sugerencias de alojamiento en cada destino, indicando zonas de la ciudad donde se puede alojar y consejos.
 
 ## **Contexto**
-- Destino: {state.trip_name}
-- Duración: {state.duration_days}
-
-{f"""- Preferencias del usuario para este viaje: 
-{"\n".join([f"  - {key}: {value}" for key, value in state.preferences.model_dump().items() if value])} 
-(Estas son preferencias especificas para este viaje puntual, prioriza estas preferencias sobre la descripcion del perfil)"""
-if state.preferences else ""}
+- El destino, la duración y las preferencias del viajero se indican en el mensaje del usuario
 - Los viajeros buscan experiencias personalizadas que se ajusten a sus preferencias
 - La eficiencia en rutas y transportes es clave para maximizar el disfrute del viaje
 - La justificación de decisiones ayuda al viajero a entender y confiar en el itinerario propuesto
@@ -85,7 +82,28 @@ if state.preferences else ""}
 **Si tienes solo 1 destino:** NO generes ningún transporte (o genera un array vacío)
 """
 
-    return PROMPT
+
+def get_itinerary_context(state: ItineraryGenerate) -> str:
+    """Datos del viaje (parte dinamica del prompt)"""
+    context = f"""## **Contexto del viaje**
+- Destino: {state.trip_name}
+- Duración: {state.duration_days}
+"""
+    if state.preferences:
+        preferences = "\n".join([f"  - {key}: {value}" for key, value in state.preferences.model_dump().items() if value])
+        context += f"""- Preferencias del usuario para este viaje: 
+{preferences} 
+(Estas son preferencias especificas para este viaje puntual, prioriza estas preferencias sobre la descripcion del perfil)
+"""
+    return context
+
+
+def get_itinerary_prompt(state: ItineraryGenerate, profile: str = "main"):
+    # Static instructions first (cacheable prefix, in the format of the provider of `profile`), trip data last
+    return [
+        cacheable_system_message(ITINERARY_SYSTEM_PROMPT, profile),
+        HumanMessage(content=get_itinerary_context(state)),
+    ]
 
 def get_itinerary_prompt2(state: ItineraryGenerate):
     PROMPT = f"""
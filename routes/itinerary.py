@@ -1,22 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import uuid
-from database import get_db
-from services.itinerary import ItineraryService, get_itinerary_service
+from database import get_db, get_async_db
+from services.itinerary import ItineraryService, get_itinerary_service, get_async_itinerary_service
 from schemas.itinerary import (
     ItineraryCreate, 
     ItineraryUpdate, 
     ItineraryResponse, 
     ItineraryList,
-    ItineraryGenerate
+    ItineraryGenerate,
+    ItineraryVersionResponse,
+    ItineraryVersionDetail,
 )
 from dependencies import get_current_user_optional
 from utils.session import get_session_id_from_request
 from models.user import User
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from utils.responses import itinerary_response
+from utils.pagination import ListCursor, decode_cursor, next_cursor
+from schemas.jobs import JobResponse
+from services.jobs import get_job_manager, job_events_stream
 
-itinerary_router = APIRouter(prefix="/api/itineraries", tags=["itineraries"])
+# orjson for every route; itinerary_response() also skips re-validating the stored itinerary
+itinerary_router = APIRouter(prefix="/api/itineraries", tags=["itineraries"], default_response_class=ORJSONResponse)
+
+
+def get_list_cursor(
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page (keyset pagination)")
+) -> Optional[ListCursor]:
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def paginated(response: Response, itineraries: list, limit: int) -> list:
+    """Set the X-Next-Cursor header when there may be a next page"""
+    cursor = next_cursor(itineraries, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return itineraries
 
 
 @itinerary_router.post("/", response_model=ItineraryResponse, status_code=201)
@@ -33,9 +60,10 @@ def create_itinerary(
     session_id = None if current_user else get_session_id_from_request(request)
     
     try:
-        return service.create_itinerary(itinerary_data, current_user, session_id)
+        itinerary = service.create_itinerary(itinerary_data, current_user, session_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error creating itinerary: {str(e)}")
+    return itinerary_response(itinerary, status_code=201)
 
 
 @itinerary_router.post("/generate", response_model=ItineraryResponse)
@@ -51,74 +79,135 @@ def generate_itinerary(
     # Get session_id only if user is not authenticated
     session_id = None if current_user else get_session_id_from_request(request)
     
-    return service.generate_itinerary(itinerary_data, current_user, session_id)
+    return itinerary_response(service.generate_itinerary(itinerary_data, current_user, session_id))
+
+
+@itinerary_router.post("/generate/stream")
+def generate_itinerary_stream(
+    itinerary_data: ItineraryGenerate,
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db)
+):
+    """Generate an itinerary streaming each destination and transport as it is ready (SSE)"""
+    service = get_itinerary_service(db)
+
+    # Get session_id only if user is not authenticated
+    session_id = None if current_user else get_session_id_from_request(request)
+
+    return StreamingResponse(service.generate_itinerary_stream(itinerary_data, current_user, session_id), media_type="text/event-stream")
+
+
+@itinerary_router.post("/generate/jobs", response_model=JobResponse, status_code=202)
+def submit_generate_itinerary_job(
+    itinerary_data: ItineraryGenerate,
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db)
+):
+    """Queue an itinerary generation and return the job id immediately"""
+    service = get_itinerary_service(db)
+
+    # Get session_id only if user is not authenticated
+    session_id = None if current_user else get_session_id_from_request(request)
+
+    return service.submit_generate_itinerary_job(itinerary_data, current_user, session_id)
+
+
+@itinerary_router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    """Poll the status (and result) of a background job"""
+    job = get_job_manager().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@itinerary_router.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str):
+    """Stream the events of a background job (SSE) until it finishes"""
+    job_manager = get_job_manager()
+    if not job_manager.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_events_stream(job_manager, job_id), media_type="text/event-stream")
 
 
 @itinerary_router.get("/{itinerary_id}", response_model=ItineraryResponse)
-def get_itinerary(
+async def get_itinerary(
     itinerary_id: uuid.UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific itinerary by UUID"""
-    service = get_itinerary_service(db)
-    itinerary = service.get_itinerary_by_id(itinerary_id)
+    service = get_async_itinerary_service(db)
+    itinerary = await service.get_itinerary_by_id(itinerary_id)
     if not itinerary:
         raise HTTPException(status_code=404, detail="Itinerary not found")
-    return itinerary
+    return itinerary_response(itinerary)
 
 
 @itinerary_router.get("/slug/{slug}", response_model=ItineraryResponse)
-def get_itinerary_by_slug(
+async def get_itinerary_by_slug(
     slug: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific itinerary by slug"""
-    service = get_itinerary_service(db)
-    itinerary = service.get_itinerary_by_slug(slug)
+    service = get_async_itinerary_service(db)
+    itinerary = await service.get_itinerary_by_slug(slug)
     if not itinerary:
         raise HTTPException(status_code=404, detail="Itinerary not found")
-    return itinerary
+    return itinerary_response(itinerary)
 
 
 @itinerary_router.get("/", response_model=List[ItineraryList])
-def get_itineraries(
+async def get_itineraries(
+    response: Response,
     request: Request,
     current_user: Optional[User] = Depends(get_current_user_optional),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)", deprecated=True),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[ListCursor] = Depends(get_list_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get itineraries for current user or session"""
-    service = get_itinerary_service(db)
+    service = get_async_itinerary_service(db)
     
     if current_user:
-        return service.get_itineraries_by_user(str(current_user.id), skip, limit)
+        itineraries = await service.get_itineraries_by_user(str(current_user.id), skip, limit, cursor)
     else:
         session_id = get_session_id_from_request(request)
-        return service.get_itineraries_by_session(session_id, skip, limit)
+        itineraries = await service.get_itineraries_by_session(session_id, skip, limit, cursor)
+    return paginated(response, itineraries, limit)
 
 
 @itinerary_router.get("/public/list", response_model=List[ItineraryList])
-def get_public_itineraries(
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+async def get_public_itineraries(
+    response: Response,
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)", deprecated=True),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[ListCursor] = Depends(get_list_cursor),
+    city: Optional[str] = Query(None, min_length=2, description="Only itineraries with this destination city"),
+    country: Optional[str] = Query(None, min_length=2, description="Only itineraries with a destination in this country (ISO code or name)"),
+    traveler_profile: Optional[str] = Query(None, description="Only itineraries generated for this traveler profile name"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all public itineraries"""
-    service = get_itinerary_service(db)
-    return service.get_public_itineraries(skip, limit)
+    """Get all public itineraries, optionally filtered by destination or traveler profile"""
+    service = get_async_itinerary_service(db)
+    itineraries = await service.get_public_itineraries(skip, limit, cursor, city=city, country=country, traveler_profile=traveler_profile)
+    return paginated(response, itineraries, limit)
 
 
 @itinerary_router.get("/search/", response_model=List[ItineraryList])
-def search_itineraries(
+async def search_itineraries(
+    response: Response,
     q: str = Query(..., min_length=2, description="Search query for trip name or destination"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)", deprecated=True),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[ListCursor] = Depends(get_list_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Search public itineraries by trip name or destination"""
-    service = get_itinerary_service(db)
-    return service.search_itineraries(q, skip, limit)
+    service = get_async_itinerary_service(db)
+    return paginated(response, await service.search_itineraries(q, skip, limit, cursor), limit)
 
 
 @itinerary_router.put("/{itinerary_id}", response_model=ItineraryResponse)
@@ -132,7 +221,7 @@ def update_itinerary(
     updated_itinerary = service.update_itinerary(itinerary_id, itinerary_data)
     if not updated_itinerary:
         raise HTTPException(status_code=404, detail="Itinerary not found")
-    return updated_itinerary
+    return itinerary_response(updated_itinerary)
 
 
 @itinerary_router.delete("/{itinerary_id}", status_code=204)
@@ -171,21 +260,88 @@ def restore_itinerary(
     restored_itinerary = service.restore_itinerary(itinerary_id)
     if not restored_itinerary:
         raise HTTPException(status_code=404, detail="Itinerary not found or not deleted")
-    return restored_itinerary
+    return itinerary_response(restored_itinerary)
+
+
+@itinerary_router.get("/{itinerary_id}/versions", response_model=List[ItineraryVersionResponse])
+def get_itinerary_versions(
+    itinerary_id: uuid.UUID,
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
+    db: Session = Depends(get_db)
+):
+    """Get the version history of an itinerary (newest first)"""
+    service = get_itinerary_service(db)
+    return service.get_itinerary_versions(itinerary_id, skip, limit)
+
+
+@itinerary_router.get("/{itinerary_id}/versions/{version}", response_model=ItineraryVersionDetail)
+def get_itinerary_version(
+    itinerary_id: uuid.UUID,
+    version: int,
+    db: Session = Depends(get_db)
+):
+    """Get the itinerary details as they were at a given version"""
+    service = get_itinerary_service(db)
+    itinerary = service.get_itinerary_by_id(itinerary_id)
+    if not itinerary:
+        raise HTTPException(status_code=404, detail="Itinerary not found")
+    details = service.get_itinerary_version(itinerary_id, version)
+    if details is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return ItineraryVersionDetail(
+        itinerary_id=itinerary_id,
+        version=version,
+        current_version=itinerary.current_version,
+        details_itinerary=details,
+    )
+
+
+@itinerary_router.post("/{itinerary_id}/undo", response_model=ItineraryResponse)
+def undo_itinerary(
+    itinerary_id: uuid.UUID,
+    thread_id: Optional[str] = Query(None, description="Chat agent thread to keep in sync with the restored itinerary"),
+    db: Session = Depends(get_db)
+):
+    """Undo the last change of an itinerary (no LLM call)"""
+    service = get_itinerary_service(db)
+    itinerary, undone = service.undo_itinerary(itinerary_id, thread_id)
+    if not itinerary:
+        raise HTTPException(status_code=404, detail="Itinerary not found")
+    if not undone:
+        raise HTTPException(status_code=409, detail="Nothing to undo (the daily plan generation cannot be undone)")
+    return itinerary_response(itinerary)
+
+
+@itinerary_router.post("/{itinerary_id}/versions/{version}/restore", response_model=ItineraryResponse)
+def restore_itinerary_version(
+    itinerary_id: uuid.UUID,
+    version: int,
+    thread_id: Optional[str] = Query(None, description="Chat agent thread to keep in sync with the restored itinerary"),
+    db: Session = Depends(get_db)
+):
+    """Make a previous version of an itinerary the current one (no LLM call)"""
+    service = get_itinerary_service(db)
+    itinerary, restored = service.restore_itinerary_version(itinerary_id, version, thread_id)
+    if not itinerary:
+        raise HTTPException(status_code=404, detail="Itinerary not found")
+    if not restored:
+        raise HTTPException(status_code=409, detail="Version not found or already current")
+    return itinerary_response(itinerary)
 
 
 @itinerary_router.get("/stats/summary")
-def get_itinerary_stats(
+async def get_itinerary_stats(
     user_id: Optional[str] = Query(None, description="Get stats for specific Auth0 user"),
     session_id: Optional[uuid.UUID] = Query(None, description="Get stats for specific session UUID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get itinerary statistics for a user or session"""
     if not user_id and not session_id:
         raise HTTPException(status_code=400, detail="Either user_id or session_id must be provided")
     
-    service = get_itinerary_service(db)
-    stats = service.get_itinerary_stats(user_id, session_id)
+    service = get_async_itinerary_service(db)
+    stats = await service.get_itinerary_stats(user_id, session_id)
     
     if "error" in stats:
         raise HTTPException(status_code=400, detail=stats["error"])
@@ -194,15 +350,17 @@ def get_itinerary_stats(
 
 
 @itinerary_router.get("/user/{user_id}", response_model=List[ItineraryList])
-def get_user_itineraries(
+async def get_user_itineraries(
+    response: Response,
     user_id: str,
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)", deprecated=True),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[ListCursor] = Depends(get_list_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all itineraries for a specific Auth0 user"""
-    service = get_itinerary_service(db)
-    return service.get_itineraries_by_user(user_id, skip, limit)
+    service = get_async_itinerary_service(db)
+    return paginated(response, await service.get_itineraries_by_user(user_id, skip, limit, cursor), limit)
 
 @itinerary_router.get("/{itinerary_id}/accommodations/links")
 def get_accommodations_links(
@@ -214,15 +372,17 @@ def get_accommodations_links(
     return service.get_accommodations_links(itinerary_id)
 
 @itinerary_router.get("/session/{session_id}", response_model=List[ItineraryList])
-def get_session_itineraries(
+async def get_session_itineraries(
+    response: Response,
     session_id: uuid.UUID,
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)", deprecated=True),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[ListCursor] = Depends(get_list_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all itineraries for a specific session UUID"""
-    service = get_itinerary_service(db)
-    return service.get_itineraries_by_session(session_id, skip, limit)
+    service = get_async_itinerary_service(db)
+    return paginated(response, await service.get_itineraries_by_session(session_id, skip, limit, cursor), limit)
 
 
 @itinerary_router.post("/{itinerary_id}/agent/{thread_id}/messages")
@@ -243,17 +403,17 @@ def send_message_to_itinerary_agent(
 
 
 @itinerary_router.get("/{itinerary_id}/agent/{thread_id}/messages/stream")
-def send_message_to_itinerary_agent_stream(
+async def send_message_to_itinerary_agent_stream(
     itinerary_id: uuid.UUID,
     thread_id: str,
     message: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Send a message to an itinerary agent and stream the response"""
+    """Send a message to an itinerary agent and stream the response (typed SSE events, see utils/agent_stream.py)"""
 
-    service = get_itinerary_service(db)
+    service = get_async_itinerary_service(db)
 
-    return StreamingResponse(service.send_agent_message_stream(itinerary_id, thread_id, message), media_type="text/event-stream")   
+    return StreamingResponse(service.send_agent_message_astream(itinerary_id, thread_id, message), media_type="text/event-stream")
 
 
 @itinerary_router.get("/agent/{thread_id}")
@@ -275,7 +435,6 @@ def get_agent_state(
     return agent_state
 
 
-from graphs.route import generate_route as generate_route_ai
 from states.route import RouteStateInput
 
 @itinerary_router.post("/route")
@@ -286,20 +445,25 @@ def generate_route(
     # db: Session = Depends(get_db)
 ):
     """Generate a route for an itinerary"""
+    from graphs.route import generate_route as generate_route_ai  # imported on first use (LLM client)
+
     state = generate_route_ai(itinerary_data)
 
     return state
 
 
-@itinerary_router.post("/{itinerary_id}/route_confirmed")
+@itinerary_router.post("/{itinerary_id}/route_confirmed", response_model=ItineraryResponse, status_code=202)
 def confirm_route(
     itinerary_id: uuid.UUID,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Generate activities for a city"""
+    """Confirm the route and generate the daily activities in the background"""
     itinerary_service = get_itinerary_service(db)
-    itinerary = itinerary_service.itinerary_route_confirmed(itinerary_id)
+    itinerary, job = itinerary_service.itinerary_route_confirmed(itinerary_id)
     if not itinerary:
-        print(f"\n\nItinerary not found\n\n")
         raise HTTPException(status_code=404, detail="Itinerary not found")
-    return itinerary
\ No newline at end of file
+    headers = {"X-Job-ID": job.job_id} if job else None
+    if headers:
+        response.headers.update(headers)
+    return itinerary_response(itinerary, status_code=202, headers=headers)
@@ -0,0 +1,54 @@
+from fastapi import APIRouter
+
+from database import engine, async_engine
+from utils.db_pool import pool_status
+from utils.itinerary_cache import get_itinerary_cache
+from utils.itinerary_compact import prompt_token_metrics
+from utils.llm_usage import llm_usage_metrics
+from utils.llm_router import route_metrics
+from utils.llm_hedge import breaker_states, hedge_metrics
+
+
+metrics_router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@metrics_router.get("/itinerary-cache")
+def get_itinerary_cache_metrics():
+    """Hit/miss counters of the main itinerary cache"""
+    itinerary_cache = get_itinerary_cache()
+    if itinerary_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **itinerary_cache.stats()}
+
+
+@metrics_router.get("/db-pool")
+def get_db_pool_metrics():
+    """Occupancy and checkout wait times of the database connection pools"""
+    return {
+        "sync": pool_status(engine.pool),
+        "async": pool_status(async_engine.sync_engine.pool),
+    }
+
+
+@metrics_router.get("/chat-prompts")
+def get_chat_prompt_metrics():
+    """Approximate prompt tokens per turn of the chat agents"""
+    return prompt_token_metrics.snapshot()
+
+
+@metrics_router.get("/llm-usage")
+def get_llm_usage_metrics():
+    """Input tokens per model, split in served from the provider prompt cache and uncached"""
+    return llm_usage_metrics.snapshot()
+
+
+@metrics_router.get("/llm-routing")
+def get_llm_routing_metrics():
+    """Latency, estimated cost and escalation rate of the tiered model routes"""
+    return route_metrics.snapshot()
+
+
+@metrics_router.get("/llm-hedging")
+def get_llm_hedging_metrics():
+    """Hedged calls, fallback wins, deadline misses and circuit breaker state per provider"""
+    return {**hedge_metrics.snapshot(), "breakers": breaker_states()}
@@ -14,6 +14,7 @@ class VisibilityEnum(str, Enum):
 
 class StatusEnum(str, Enum):
     DRAFT = "draft"
+    GENERATING = "generating"
     CONFIRMED = "confirmed"
 
 
@@ -172,3 +173,27 @@ class ItineraryList(BaseModel):
             datetime: lambda v: v.isoformat() if v else None,
             date: lambda v: v.isoformat() if v else None
         }
+
+
+class ItineraryVersionResponse(BaseModel):
+    """Schema for an entry of the itinerary version history (without its content)"""
+    version: int = Field(..., description="Version number (1 is the first stored version)")
+    parent_version: Optional[int] = Field(None, description="Version this one was derived from")
+    kind: str = Field(..., description="Storage kind: snapshot or diff")
+    source: str = Field(..., description="Origin of the change (generation, daily, agent, update, enrichment, undo, restore)")
+    summary: Optional[str] = Field(None, description="Description of the change")
+    created_at: datetime = Field(..., description="Creation timestamp")
+
+    class Config:
+        from_attributes = True  # Enable ORM mode for SQLAlchemy compatibility (Pydantic V2)
+        json_encoders = {
+            datetime: lambda v: v.isoformat() if v else None
+        }
+
+
+class ItineraryVersionDetail(BaseModel):
+    """Schema for the content of an itinerary version"""
+    itinerary_id: uuid.UUID = Field(..., description="UUID identifier of the itinerary")
+    version: int = Field(..., description="Version number")
+    current_version: int = Field(..., description="Latest version of the itinerary")
+    details_itinerary: Dict[str, Any] = Field(..., description="details_itinerary as it was at this version")
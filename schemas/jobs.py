@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+from datetime import datetime
+
+from services.jobs import JobStatusEnum
+
+
+class JobResponse(BaseModel):
+    """Schema for background job responses"""
+    job_id: str = Field(..., description="Job identifier, used for polling or streaming its events")
+    kind: str = Field(..., description="Type of work performed by the job")
+    status: JobStatusEnum = Field(..., description="Current status of the job")
+    result: Optional[Any] = Field(None, description="Job result once it succeeded")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+    created_at: datetime = Field(..., description="Creation timestamp")
+    started_at: Optional[datetime] = Field(None, description="Start timestamp")
+    finished_at: Optional[datetime] = Field(None, description="Finish timestamp")
+    attempts: int = Field(0, description="Number of attempts made so far")
+    max_retries: int = Field(0, description="Maximum number of retries after the first attempt")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Extra information about the job")
+
+    class Config:
+        from_attributes = True
+        use_enum_values = True
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of the agent state serialization of the chat message path.
+
+Builds a checkpoint snapshot with a long thread (N messages + itinerary) and
+compares, per chat request:
+  - before: 3 `get_state` snapshots (thread check, HIL check, new state) and
+    2 json + pydantic_encoder round trips (3 on the first message of a thread)
+  - after: 2 snapshots (before and after the run) and 1 orjson round trip,
+    shared through `AgentTurnContext`
+
+Only the serialization is timed; every `get_state` saved is also one less
+checkpoint read from Postgres.
+
+Usage (from repo root or API folder):
+    python scripts/benchmark_agent_state.py
+    python scripts/benchmark_agent_state.py --messages 10 100 500 --repeat 20
+"""
+
+import argparse
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.types import StateSnapshot
+from pydantic.json import pydantic_encoder
+
+from utils.utils import state_to_dict
+
+SERIALIZATIONS_BEFORE = 2
+SERIALIZATIONS_AFTER = 1
+SNAPSHOTS_BEFORE = 3
+SNAPSHOTS_AFTER = 2
+
+
+def build_snapshot(n_messages: int, n_days: int = 14) -> StateSnapshot:
+    messages = []
+    for i in range(n_messages):
+        if i % 3 == 0:
+            messages.append(HumanMessage(content=f"Cambia las actividades del día {i % n_days + 1}, por favor"))
+        elif i % 3 == 1:
+            messages.append(AIMessage(
+                content="",
+                tool_calls=[{"id": f"call_{i}", "name": "modify_itinerary_agent", "args": {"instruction": "cambiar actividades " * 5}}],
+            ))
+        else:
+            messages.append(ToolMessage(content="Itinerario actualizado correctamente. " * 10, tool_call_id=f"call_{i - 1}"))
+
+    itinerary = {
+        "nombre_viaje": "Viaje de prueba",
+        "destino_general": "Perú",
+        "itinerario_diario": [
+            {
+                "dia": day + 1,
+                "titulo": f"Día {day + 1} en Cusco",
+                "actividades": [
+                    {"nombre": f"Actividad {a}", "descripcion": "Descripción de la actividad " * 8, "horario": "09:00"}
+                    for a in range(5)
+                ],
+            }
+            for day in range(n_days)
+        ],
+    }
+
+    return StateSnapshot(
+        values={"messages": messages, "itinerary": itinerary, "user_name": "Usuario"},
+        next=(),
+        config={"configurable": {"thread_id": "benchmark"}},
+        metadata={"step": n_messages},
+        created_at="2026-01-01T00:00:00+00:00",
+        parent_config=None,
+        tasks=(),
+        interrupts=(),
+    )
+
+
+def legacy_state_to_dict(state):
+    return json.loads(json.dumps(state, default=pydantic_encoder))
+
+
+def time_it(fn, state, repeat: int) -> float:
+    fn(state)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(state)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent state serialization of a chat request")
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 500], help="Thread lengths to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per measurement")
+    args = parser.parse_args()
+
+    print(f"Per request: {SNAPSHOTS_BEFORE} -> {SNAPSHOTS_AFTER} get_state, {SERIALIZATIONS_BEFORE} -> {SERIALIZATIONS_AFTER} serializations\n")
+    print(f"{'messages':>8} | {'json ms':>8} | {'orjson ms':>9} | {'before ms/req':>13} | {'after ms/req':>12} | {'speedup':>7}")
+    for n_messages in args.messages:
+        state = build_snapshot(n_messages)
+        assert legacy_state_to_dict(state) == state_to_dict(state), "orjson output differs from json + pydantic_encoder"
+
+        legacy_ms = time_it(legacy_state_to_dict, state, args.repeat)
+        orjson_ms = time_it(state_to_dict, state, args.repeat)
+        before = legacy_ms * SERIALIZATIONS_BEFORE
+        after = orjson_ms * SERIALIZATIONS_AFTER
+        print(f"{n_messages:>8} | {legacy_ms:>8.2f} | {orjson_ms:>9.2f} | {before:>13.2f} | {after:>12.2f} | {before / after:>6.1f}x")
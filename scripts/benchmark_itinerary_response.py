@@ -0,0 +1,93 @@
+"""
+Benchmark the serialization of an itinerary response (p50 / p99).
+
+Compares, for the sample in itinerary_examples/ (scaled up to the size of a
+confirmed trip with --scale):
+  - json: ItineraryResponse validation + stdlib json (the previous JSONResponse path)
+  - orjson: ItineraryResponse validation + ORJSONResponse (ITINERARY_RAW_RESPONSES=false)
+  - raw: the stored columns dumped with orjson, no validation (`itinerary_response`)
+
+Usage (from repo root or API folder):
+    python scripts/benchmark_itinerary_response.py
+    python scripts/benchmark_itinerary_response.py --scale 200 --repeat 500
+"""
+
+import argparse
+import copy
+import json
+import time
+import uuid
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from schemas.itinerary import ItineraryResponse
+from utils.responses import dumps_itinerary
+
+SAMPLE_PATH = "itinerary_examples/v0.0.1-grecia-10d.json"
+
+
+def load_sample(scale: int) -> dict:
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        details = json.load(f)
+    destinos = details.get("destinos") or []
+    details["destinos"] = [copy.deepcopy(destino) for _ in range(scale) for destino in destinos]
+    return details
+
+
+def build_row(details: dict) -> SimpleNamespace:
+    """Stand-in for an Itinerary row (the attributes read by the responses)"""
+    now = datetime.now(timezone.utc)
+    return SimpleNamespace(
+        itinerary_id=uuid.uuid4(),
+        user_id="auth0|benchmark",
+        session_id=None,
+        trip_name=details.get("nombre_viaje", "Benchmark"),
+        duration_days=details.get("cantidad_dias"),
+        start_date=date(2026, 5, 1),
+        travelers_count=2,
+        itinerary_metadata={"source": "benchmark"},
+        details_itinerary=details,
+        notes=None,
+        visibility="private",
+        status="confirmed",
+        created_at=now,
+        updated_at=now,
+        deleted_at=None,
+    )
+
+
+def validated_json(row) -> bytes:
+    return JSONResponse(ItineraryResponse.model_validate(row).model_dump(mode="json")).body
+
+
+def validated_orjson(row) -> bytes:
+    return ORJSONResponse(ItineraryResponse.model_validate(row).model_dump(mode="json")).body
+
+
+def percentiles(fn, row, repeat: int) -> tuple:
+    fn(row)  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(row)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the itinerary response serialization")
+    parser.add_argument("--scale", type=int, default=100, help="Times the sample destinations are repeated")
+    parser.add_argument("--repeat", type=int, default=300, help="Measurements per serializer")
+    args = parser.parse_args()
+
+    row = build_row(load_sample(args.scale))
+    assert json.loads(validated_json(row)) == json.loads(dumps_itinerary(row)), "raw response differs from the validated one"
+
+    print(f"Payload: {len(dumps_itinerary(row)) / 1024:.0f} KB | {args.repeat} runs\n")
+    print(f"{'serializer':>10} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for name, fn in (("json", validated_json), ("orjson", validated_orjson), ("raw", dumps_itinerary)):
+        p50, p99 = percentiles(fn, row, args.repeat)
+        print(f"{name:>10} | {p50:>8.3f} | {p99:>8.3f}")
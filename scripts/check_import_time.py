@@ -0,0 +1,109 @@
+"""
+Fail when the API import cost regresses.
+
+Imports the API modules in a fresh interpreter with `python -X importtime`,
+compares the total import time against a budget and checks that the heavy
+LLM/graph packages are not imported eagerly (they must load on first use).
+
+Usage (from repo root):
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget-ms 2500 routes.itinerary
+
+Exit code 1 when the budget is exceeded or a lazy package was imported.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+# Routers imported by main.py (main itself creates the tables at import time, so it is not imported here)
+DEFAULT_MODULES = [
+    "routes.itinerary",
+    "routes.transportation",
+    "routes.accommodations",
+    "routes.traveler_test.traveler_type",
+    "routes.traveler_test.user_traveler_test",
+    "routes.traveler_test.question",
+    "routes.traveler_test.question_option",
+    "routes.traveler_test.question_option_score",
+    "routes.traveler_test.user_answers",
+    "routes.auth_routes",
+    "routes.user",
+    "routes.metrics",
+    "graphs.loader",
+]
+
+# Packages that must only be imported on first use
+LAZY_PACKAGES = [
+    "langchain_openai",
+    "langchain_google_genai",
+    "langchain_anthropic",
+    "langgraph.prebuilt",
+    "openai",
+    "langmem",
+]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(modules: list) -> list:
+    """Return (self_us, cumulative_us, depth, module) for every import"""
+    code = "; ".join(f"import {module}" for module in modules)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if process.returncode != 0:
+        print(process.stderr[-2000:])
+        raise SystemExit(f"Import failed for: {', '.join(modules)}")
+
+    imports = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((int(self_us), int(cumulative_us), len(indent) // 2, module))
+    return imports
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "2500")),
+                        help="Maximum total import time in milliseconds (env IMPORT_TIME_BUDGET_MS)")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest imports to show")
+    args = parser.parse_args()
+
+    imports = measure(args.modules)
+    total_ms = sum(cumulative for _, cumulative, depth, _ in imports if depth == 0) / 1000
+
+    print(f"Total import time: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print("Slowest imports (cumulative):")
+    for _, cumulative, _, module in sorted(imports, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    failed = False
+    imported = {module for _, _, _, module in imports}
+    eager = [package for package in LAZY_PACKAGES if package in imported]
+    if eager:
+        print(f"❌ Imported eagerly (must be lazy): {', '.join(eager)}")
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print(f"❌ Import time over budget by {total_ms - args.budget_ms:.0f} ms")
+        failed = True
+
+    if not failed:
+        print("✅ Import time within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
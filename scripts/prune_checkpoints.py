@@ -0,0 +1,30 @@
+"""
+Delete chat agent threads (LangGraph checkpoints) that have been inactive for too long.
+
+A thread is pruned when its most recent checkpoint is older than the TTL.
+The API already prunes every CHECKPOINT_PRUNE_INTERVAL_HOURS; use this
+script to prune on demand (e.g. with a different TTL).
+
+Usage (from repo root or API folder):
+    python scripts/prune_checkpoints.py            # uses CHECKPOINT_TTL_DAYS (default 30)
+    python scripts/prune_checkpoints.py --days 7
+
+Note: Ensure your .env is configured (DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME).
+"""
+
+import argparse
+
+from utils.checkpointer import prune_checkpoints, CHECKPOINT_TTL_DAYS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune inactive chat agent threads")
+    parser.add_argument("--days", type=float, default=CHECKPOINT_TTL_DAYS, help="Maximum age (days) of the last checkpoint of a thread")
+    args = parser.parse_args()
+
+    print(f"Pruning threads inactive for more than {args.days} days...")
+    report = prune_checkpoints(args.days)
+    print(
+        f"Done. Threads: {report['threads']} | checkpoints: {report['checkpoints']} | "
+        f"blobs: {report['checkpoint_blobs']} | writes: {report['checkpoint_writes']}"
+    )
@@ -1,24 +1,95 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy import and_, or_
-from models.itinerary import Itinerary
+from sqlalchemy import and_, or_, select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.itinerary import Itinerary, ITINERARY_DESTINATIONS
 from models.user import User
-from schemas.itinerary import ItineraryCreate, ItineraryUpdate, ItineraryGenerate
-from graphs.activities_city_map_reducer import ItineraryState
-from graphs.daily_itinerary_graph import graph as daily_itinerary_graph
-from typing import List, Optional
-from datetime import datetime, timedelta
+from schemas.itinerary import ItineraryCreate, ItineraryUpdate, ItineraryGenerate, ItineraryResponse
+from typing import List, Optional, TYPE_CHECKING
+from datetime import datetime, timedelta, timezone
 import uuid
-from graphs.itinerary_graph import generate_main_itinerary
-from graphs.itinerary_chat_agent import itinerary_agent
-from graphs.activities_chat_agent import activities_chat_agent
+from graphs.itinerary_graph import generate_main_itinerary, stream_main_itinerary
+from states.itinerary import ViajeState
+from graphs.loader import get_graph, get_graph_attribute
 from utils.agent import is_valid_thread_state
-from utils.utils import detect_hil_mode, state_to_dict
+from utils.utils import state_to_dict
+from utils.pagination import ListCursor
+from utils.gazetteer import country_code_for, find_cities
+from utils.agent_stream import agent_event_stream, sse_event
+from utils.itinerary_patch import itinerary_to_dict
 from utils.accommodation_link import generate_airbnb_link, generate_booking_link, generate_expedia_link
-from langchain_core.runnables import RunnableConfig
-from langgraph.types import Command
 from models.traveler_test.traveler_type import TravelerType
+from services.jobs import Job, get_job_manager
+from services.itinerary_enrichment import ITINERARY_ENRICHMENT_ENABLED, enrich_itinerary
+from services.itinerary_versions import get_version_content, list_versions, record_version, restore_version, undo_version
+from models.itinerary_version import ItineraryVersion
+import copy
+from database import session_scope
+import asyncio
 import json
+import os
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
+
+
+# Columns read by ItineraryList: the list queries never load the itinerary JSON columns
+LIST_COLUMNS = (
+    Itinerary.itinerary_id,
+    Itinerary.user_id,
+    Itinerary.session_id,
+    Itinerary.slug,
+    Itinerary.destination,
+    Itinerary.start_date,
+    Itinerary.duration_days,
+    Itinerary.trip_name,
+    Itinerary.trip_type,
+    Itinerary.visibility,
+    Itinerary.status,
+    Itinerary.created_at,
+    Itinerary.updated_at,
+)
+
+# A "generating" itinerary not updated for this long lost its job (the jobs live in the process memory)
+DAILY_ITINERARY_STALE_SECONDS = float(os.getenv("DAILY_ITINERARY_STALE_SECONDS", "900"))
+
+
+def list_itineraries_statement(*filters, cursor: Optional[ListCursor] = None, skip: int = 0, limit: int = 100):
+    """Projected list query, newest first, paginated by keyset (`cursor`) or by the deprecated `skip`"""
+    statement = (
+        select(Itinerary)
+        .options(load_only(*LIST_COLUMNS, raiseload=True))
+        .where(*filters, Itinerary.deleted_at.is_(None))
+        .order_by(Itinerary.created_at.desc(), Itinerary.itinerary_id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        statement = statement.where(tuple_(Itinerary.created_at, Itinerary.itinerary_id) < tuple_(*cursor))
+    elif skip:
+        statement = statement.offset(skip)
+    return statement
+
+
+def itinerary_json_filters(city: Optional[str] = None, country: Optional[str] = None, traveler_profile: Optional[str] = None) -> list:
+    """
+    SQL filters inside the itinerary JSON, served by the GIN indexes (containment, @>).
+
+    Args:
+        city: Destination city; its gazetteer spellings ("Sevilla" / "Seville") match too
+        country: Country of a destination, ISO code or name ("ES", "España")
+        traveler_profile: traveler_profile_name of the itinerary metadata
+    """
+    filters = []
+    if city:
+        names = {city.strip()}
+        for match in find_cities(city):
+            names.update([match["name"], *match.get("aliases", [])])
+        filters.append(or_(*(ITINERARY_DESTINATIONS.contains([{"ciudad": name}]) for name in sorted(names))))
+    if country:
+        filters.append(ITINERARY_DESTINATIONS.contains([{"pais_codigo": country_code_for(country) or country.strip().upper()}]))
+    if traveler_profile:
+        filters.append(Itinerary.itinerary_metadata.contains({"traveler_profile_name": traveler_profile}))
+    return filters
 
 class ItineraryService:
     """Service class for itinerary CRUD operations"""
@@ -36,6 +107,7 @@ class ItineraryService:
 
         db_itinerary = Itinerary(**itinerary_dict)
         self.db.add(db_itinerary)
+        record_version(self.db, db_itinerary, db_itinerary.details_itinerary, "create")
         self.db.commit()
         self.db.refresh(db_itinerary)
         
@@ -49,6 +121,44 @@ class ItineraryService:
     def generate_itinerary(self, itinerary_data: ItineraryGenerate, user: Optional[User] = None, session_id: Optional[uuid.UUID] = None) -> Itinerary:
         """Generate an itinerary with automatic user/session assignment"""
 
+        itinerary_data = self.apply_traveler_profile(itinerary_data, user)
+
+        # Don't hold a pooled connection during the LLM call
+        self.release_connection()
+        state = generate_main_itinerary(itinerary_data)
+
+        return self.save_generated_itinerary(itinerary_data, state, user, session_id)
+
+    def generate_itinerary_stream(self, itinerary_data: ItineraryGenerate, user: Optional[User] = None, session_id: Optional[uuid.UUID] = None):
+        """Generate an itinerary streaming each destination and transport as soon as it is ready (SSE)"""
+
+        itinerary_data = self.apply_traveler_profile(itinerary_data, user)
+
+        # Don't hold a pooled connection while the LLM streams
+        self.release_connection()
+        try:
+            for event in stream_main_itinerary(itinerary_data):
+                if event["type"] == "itinerary":
+                    db_itinerary = self.save_generated_itinerary(itinerary_data, event["data"], user, session_id)
+                    event = {"type": "itinerary", "data": ItineraryResponse.model_validate(db_itinerary).model_dump(mode="json")}
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            print(f"\n\nError streaming itinerary generation: {e}\n\n")
+            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+        yield "data: [DONE]\n\n"
+
+    def release_connection(self) -> None:
+        """End the current transaction so its connection goes back to the pool.
+
+        Call it before long LLM calls. The session stays usable: the next query
+        checks out a connection again.
+        """
+        self.db.commit()
+
+    def apply_traveler_profile(self, itinerary_data: ItineraryGenerate, user: Optional[User] = None) -> ItineraryGenerate:
+        """Fill the traveler profile of the generation input from the user's traveler type"""
+
         if user and getattr(user, "traveler_type_id", None):
 
             traveler_type_id = getattr(user, "traveler_type_id", None)
@@ -63,7 +173,11 @@ class ItineraryService:
                     preferences=itinerary_data.preferences,
                 )
 
-        state = generate_main_itinerary(itinerary_data)
+        return itinerary_data
+
+    def save_generated_itinerary(self, itinerary_data: ItineraryGenerate, state: ViajeState, user: Optional[User] = None, session_id: Optional[uuid.UUID] = None) -> Itinerary:
+        """Persist a generated itinerary with automatic user/session assignment"""
+
         details_itinerary = state.model_dump()
 
         print(f"\n\ndetails_itinerary (model_dump): {details_itinerary}\n\n")
@@ -87,6 +201,7 @@ class ItineraryService:
         )
 
         self.db.add(db_itinerary)
+        record_version(self.db, db_itinerary, details_itinerary, "generation")
         self.db.commit()
         self.db.refresh(db_itinerary)
         
@@ -96,15 +211,36 @@ class ItineraryService:
             self.db.commit()
         
         return db_itinerary
+
+    def submit_generate_itinerary_job(self, itinerary_data: ItineraryGenerate, user: Optional[User] = None, session_id: Optional[uuid.UUID] = None) -> Job:
+        """Queue the itinerary generation as a background job and return it immediately"""
+        user_id = user.id if user else None
+        session_id_to_use = None if user else (session_id or uuid.uuid4())
+
+        return get_job_manager().submit(
+            "generate_itinerary",
+            _generate_itinerary_job,
+            itinerary_data,
+            user_id,
+            session_id_to_use,
+            metadata={"trip_name": itinerary_data.trip_name, "duration_days": itinerary_data.duration_days},
+        )
     
-    def get_itinerary_by_id(self, itinerary_id: uuid.UUID) -> Optional[Itinerary]:
-        """Get itinerary by UUID (excluding soft deleted)"""
-        return self.db.query(Itinerary).filter(
+    def get_itinerary_by_id(self, itinerary_id: uuid.UUID, for_update: bool = False) -> Optional[Itinerary]:
+        """Get itinerary by UUID (excluding soft deleted).
+
+        `for_update` locks the row until the commit; use it before `record_version`,
+        which numbers the new version from `current_version`.
+        """
+        query = self.db.query(Itinerary).filter(
             and_(
                 Itinerary.itinerary_id == itinerary_id,
                 Itinerary.deleted_at.is_(None)
             )
-        ).first()
+        )
+        if for_update:
+            query = query.with_for_update().populate_existing()
+        return query.first()
     
     def get_itinerary_by_slug(self, slug: str) -> Optional[Itinerary]:
         """Get itinerary by slug (excluding soft deleted)"""
@@ -115,79 +251,79 @@ class ItineraryService:
             )
         ).first()
     
-    def get_itineraries_by_user(self, user_id: str, skip: int = 0, limit: int = 100) -> List[Itinerary]:
-        """Get all itineraries for a specific Auth0 user"""
-        return self.db.query(Itinerary).filter(
-            and_(
-                Itinerary.user_id == user_id,
-                Itinerary.deleted_at.is_(None)
-            )
-        ).offset(skip).limit(limit).all()
+    def get_itineraries_by_user(self, user_id: str, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Get all itineraries for a specific Auth0 user (list columns only)"""
+        return self._list(Itinerary.user_id == user_id, cursor=cursor, skip=skip, limit=limit)
     
-    def get_itineraries_by_session(self, session_id: uuid.UUID, skip: int = 0, limit: int = 100) -> List[Itinerary]:
-        """Get all itineraries for a specific session UUID"""
-        return self.db.query(Itinerary).filter(
-            and_(
-                Itinerary.session_id == session_id,
-                Itinerary.deleted_at.is_(None)
-            )
-        ).offset(skip).limit(limit).all()
+    def get_itineraries_by_session(self, session_id: uuid.UUID, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Get all itineraries for a specific session UUID (list columns only)"""
+        return self._list(Itinerary.session_id == session_id, cursor=cursor, skip=skip, limit=limit)
     
     def get_user_or_session_itineraries(self, user_id: Optional[str] = None, session_id: Optional[uuid.UUID] = None, 
-                                      skip: int = 0, limit: int = 100) -> List[Itinerary]:
+                                      skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
         """Get itineraries for either Auth0 user_id or session_id UUID"""
         if user_id:
-            return self.get_itineraries_by_user(user_id, skip, limit)
+            return self.get_itineraries_by_user(user_id, skip, limit, cursor)
         elif session_id:
-            return self.get_itineraries_by_session(session_id, skip, limit)
+            return self.get_itineraries_by_session(session_id, skip, limit, cursor)
         else:
             return []
     
-    def get_public_itineraries(self, skip: int = 0, limit: int = 100) -> List[Itinerary]:
-        """Get all public itineraries"""
-        return self.db.query(Itinerary).filter(
-            and_(
-                Itinerary.visibility == "public",
-                Itinerary.deleted_at.is_(None)
-            )
-        ).offset(skip).limit(limit).all()
+    def get_public_itineraries(self, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None,
+                               city: Optional[str] = None, country: Optional[str] = None, traveler_profile: Optional[str] = None) -> List[Itinerary]:
+        """Get all public itineraries, optionally by destination city, country or traveler profile (list columns only)"""
+        filters = itinerary_json_filters(city, country, traveler_profile)
+        return self._list(Itinerary.visibility == "public", *filters, cursor=cursor, skip=skip, limit=limit)
+
+    def _list(self, *filters, cursor: Optional[ListCursor] = None, skip: int = 0, limit: int = 100) -> List[Itinerary]:
+        return list(self.db.scalars(list_itineraries_statement(*filters, cursor=cursor, skip=skip, limit=limit)).all())
 
 
-    def itinerary_route_confirmed(self, itinerary_id: uuid.UUID) -> Optional[Itinerary]:
+    def itinerary_route_confirmed(self, itinerary_id: uuid.UUID) -> tuple[Optional[Itinerary], Optional[Job]]:
+        """Confirm the route and queue the daily itinerary generation in the background"""
         db_itinerary = self.get_itinerary_by_id(itinerary_id)
         if not db_itinerary:
-            return None
-        
-        db_itinerary.status = "confirmed"
+            return None, None
+
+        # Already being generated, don't queue a second job (unless that job was lost)
+        if db_itinerary.status == "generating" and not _is_stale_generation(db_itinerary):
+            return db_itinerary, None
+
+        db_itinerary.status = "generating"
         self.db.commit()
         self.db.refresh(db_itinerary)
 
-        # import time
-        # time.sleep(10)
+        job = get_job_manager().submit(
+            "generate_itineraries_daily",
+            _generate_itineraries_daily_job,
+            itinerary_id,
+            metadata={"itinerary_id": str(itinerary_id)},
+            max_retries=int(os.getenv("DAILY_ITINERARY_MAX_RETRIES", "2")),
+            retry_backoff=float(os.getenv("DAILY_ITINERARY_RETRY_BACKOFF_SECONDS", "5")),
+            on_failure=lambda failed_job: _set_itinerary_status(itinerary_id, "draft"),
+        )
 
-        try:
-            db_itinerary = self.generate_itineraries_daily(itinerary_id)
-            # Force error
-            # raise Exception("Error generating itineraries daily")
-        except Exception as e:
-            print(f"\n\nError generating itineraries daily: {e}\n\n")
-            db_itinerary.status = "draft"
-            self.db.commit()
-            self.db.refresh(db_itinerary)
-            return None
+        return db_itinerary, job
 
-        return db_itinerary
+    def reset_stale_generations(self, stale_seconds: Optional[float] = None) -> int:
+        """Move the "generating" itineraries whose job was lost back to "draft", so the route can be confirmed again"""
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds if stale_seconds is not None else DAILY_ITINERARY_STALE_SECONDS)
+        count = self.db.query(Itinerary).filter(
+            Itinerary.status == "generating",
+            Itinerary.updated_at < stale_before,
+        ).update({Itinerary.status: "draft"}, synchronize_session=False)
+        self.db.commit()
+        return count
 
-    def generate_itineraries_daily(self, itinerary_id: uuid.UUID) -> Optional[Itinerary]:
-        import time
-        time.sleep(10)
+    def get_daily_generation_input(self, itinerary_id: uuid.UUID) -> Optional[dict]:
+        """Build the input of the daily itinerary graph from the stored route"""
         itinerary = self.get_itinerary_by_id(itinerary_id)
         if not itinerary:
             return None
-        
+
         if not itinerary.details_itinerary:
             return None
-        
+
         cities = []
         for destino in itinerary.details_itinerary["destinos"]:
             cities.append({
@@ -196,24 +332,57 @@ class ItineraryService:
             })
 
         itinerary_metadata = itinerary.itinerary_metadata or {}
-        
-        final_itinerary = daily_itinerary_graph.invoke({"cities": cities, "itinerary_metadata": itinerary_metadata}).get("final_itinerary", None)
-        if not final_itinerary:
-            return None # TODO: Add error handling
 
-        final_itinerary_json = final_itinerary.model_dump()
+        return {"cities": cities, "itinerary_metadata": itinerary_metadata}
 
-        itinerary.details_itinerary["itinerario_diario"] = final_itinerary_json["itinerario_diario"]
-        itinerary.details_itinerary["resumen_itinerario"] = final_itinerary_json["resumen_itinerario"]
-        itinerary.details_itinerary["recomendaciones_generales"] = final_itinerary_json["recomendaciones_generales"]
-        itinerary.details_itinerary["actividades_extras"] = final_itinerary_json["actividades_extras"]
+    def save_daily_itinerary(self, itinerary_id: uuid.UUID, final_itinerary_json: dict) -> Optional[Itinerary]:
+        """Store the generated daily plan and mark the itinerary as confirmed"""
+        itinerary = self.get_itinerary_by_id(itinerary_id, for_update=True)
+        if not itinerary:
+            return None
+
+        details = copy.deepcopy(itinerary.details_itinerary)
+        details["itinerario_diario"] = final_itinerary_json["itinerario_diario"]
+        details["resumen_itinerario"] = final_itinerary_json["resumen_itinerario"]
+        details["recomendaciones_generales"] = final_itinerary_json["recomendaciones_generales"]
+        details["actividades_extras"] = final_itinerary_json["actividades_extras"]
+        itinerary.status = "confirmed"
 
-        flag_modified(itinerary, "details_itinerary") # For SQLAlchemy to detect the changes
+        record_version(self.db, itinerary, details, "daily")
         self.db.commit()
         self.db.refresh(itinerary)
 
         return itinerary
 
+    def generate_itineraries_daily(self, itinerary_id: uuid.UUID) -> Optional[Itinerary]:
+        """Generate and store the daily plan synchronously (used outside of the job queue and of an event loop).
+
+        Returns None if the itinerary does not exist.
+
+        Raises:
+            ValueError: If the daily itinerary graph returned no itinerary
+        """
+        graph_input = self.get_daily_generation_input(itinerary_id)
+        if not graph_input:
+            return None
+
+        self.release_connection()
+        # The city nodes are async (the model requests are awaited)
+        result = asyncio.run(get_graph("daily_itinerary").ainvoke(graph_input, config=get_graph_attribute("daily_itinerary", "GRAPH_CONFIG")))
+        final_itinerary = result.get("final_itinerary", None)
+        if not final_itinerary:
+            raise ValueError("The daily itinerary graph returned no itinerary")
+
+        itinerary = self.save_daily_itinerary(itinerary_id, final_itinerary.model_dump())
+        if itinerary and ITINERARY_ENRICHMENT_ENABLED:
+            get_job_manager().submit(
+                "enrich_itinerary",
+                _enrich_itinerary_job,
+                itinerary_id,
+                metadata={"itinerary_id": str(itinerary_id)},
+            )
+        return itinerary
+
 
     # def add_itineraries_daily(self, itinerary_id: uuid.UUID, itineraries: List[ItineraryState]) -> Optional[Itinerary]:
     #     db_itinerary = self.get_itinerary_by_id(itinerary_id)
@@ -252,34 +421,85 @@ class ItineraryService:
         
         
     
-    def search_itineraries(self, query: str, skip: int = 0, limit: int = 100) -> List[Itinerary]:
-        """Search itineraries by trip name or destination"""
+    def search_itineraries(self, query: str, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Search itineraries by trip name or destination (list columns only)"""
         search_filter = or_(
             Itinerary.trip_name.ilike(f"%{query}%"),
             Itinerary.destination.ilike(f"%{query}%")
         )
-        return self.db.query(Itinerary).filter(
-            and_(
-                search_filter,
-                Itinerary.visibility == "public",
-                Itinerary.deleted_at.is_(None)
-            )
-        ).offset(skip).limit(limit).all()
+        return self._list(search_filter, Itinerary.visibility == "public", cursor=cursor, skip=skip, limit=limit)
     
-    def update_itinerary(self, itinerary_id: uuid.UUID, itinerary_data: ItineraryUpdate) -> Optional[Itinerary]:
-        """Update an existing itinerary"""
-        db_itinerary = self.get_itinerary_by_id(itinerary_id)
+    def update_itinerary(self, itinerary_id: uuid.UUID, itinerary_data: ItineraryUpdate, version_source: str = "update",
+                         db_itinerary: Optional[Itinerary] = None) -> Optional[Itinerary]:
+        """Update an existing itinerary (a change of details_itinerary is recorded as a new version)"""
+        if db_itinerary is not None:
+            self.db.refresh(db_itinerary, with_for_update=True)  # Loaded before the agent ran: read it again, locked
+        else:
+            db_itinerary = self.get_itinerary_by_id(itinerary_id, for_update=True)
         if not db_itinerary:
             return None
         
         update_data = itinerary_data.dict(exclude_unset=True)
+        details_itinerary = update_data.pop("details_itinerary", None)
         for field, value in update_data.items():
             setattr(db_itinerary, field, value)
+        record_version(self.db, db_itinerary, details_itinerary, version_source)
         
         self.db.commit()
         self.db.refresh(db_itinerary)
         return db_itinerary
     
+    def get_itinerary_versions(self, itinerary_id: uuid.UUID, skip: int = 0, limit: int = 100) -> List[ItineraryVersion]:
+        """Version history of the itinerary details, newest first"""
+        return list_versions(self.db, itinerary_id, skip, limit)
+
+    def get_itinerary_version(self, itinerary_id: uuid.UUID, version: int) -> Optional[dict]:
+        """details_itinerary as it was at `version`"""
+        return get_version_content(self.db, itinerary_id, version)
+
+    def undo_itinerary(self, itinerary_id: uuid.UUID, thread_id: Optional[str] = None) -> tuple[Optional[Itinerary], bool]:
+        """Undo the last change of the itinerary details without calling the LLM.
+
+        Returns (itinerary, undone). If `thread_id` is given, the chat agent
+        thread gets the restored itinerary too, so its next edit starts from it.
+        """
+        db_itinerary = self.get_itinerary_by_id(itinerary_id, for_update=True)
+        if not db_itinerary:
+            return None, False
+
+        version = undo_version(self.db, db_itinerary)
+        return self._apply_restored_version(db_itinerary, version, thread_id), version is not None
+
+    def restore_itinerary_version(self, itinerary_id: uuid.UUID, version: int, thread_id: Optional[str] = None) -> tuple[Optional[Itinerary], bool]:
+        """Make a previous version of the itinerary details the current one"""
+        db_itinerary = self.get_itinerary_by_id(itinerary_id, for_update=True)
+        if not db_itinerary:
+            return None, False
+
+        restored = restore_version(self.db, db_itinerary, version)
+        return self._apply_restored_version(db_itinerary, restored, thread_id), restored is not None
+
+    def _apply_restored_version(self, db_itinerary: Itinerary, version: Optional[ItineraryVersion], thread_id: Optional[str]) -> Itinerary:
+        if version is None:
+            return db_itinerary
+
+        details = db_itinerary.details_itinerary or {}
+        db_itinerary.trip_name = details.get("nombre_viaje") or db_itinerary.trip_name
+        db_itinerary.duration_days = details.get("cantidad_dias") or db_itinerary.duration_days
+        if db_itinerary.status == "confirmed" and not details.get("itinerario_diario"):
+            db_itinerary.status = "draft"  # Restored a route from before the daily plan: back to the itinerary agent
+        self.db.commit()
+        self.db.refresh(db_itinerary)
+
+        if thread_id:
+            agent_str = "activities_chat_agent" if db_itinerary.status == "confirmed" else "itinerary_agent"
+            config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+            agent = get_graph(agent_str)
+            if (agent.get_state(config).values or {}).get("messages"):
+                agent.update_state(config, {"itinerary": db_itinerary.details_itinerary})
+
+        return db_itinerary
+
     def soft_delete_itinerary(self, itinerary_id: uuid.UUID) -> bool:
         """Soft delete an itinerary"""
         db_itinerary = self.get_itinerary_by_id(itinerary_id)
@@ -327,6 +547,7 @@ class ItineraryService:
         
         total = base_query.count()
         draft = base_query.filter(Itinerary.status == "draft").count()
+        generating = base_query.filter(Itinerary.status == "generating").count()
         confirmed = base_query.filter(Itinerary.status == "confirmed").count()
         public = base_query.filter(Itinerary.visibility == "public").count()
         private = base_query.filter(Itinerary.visibility == "private").count()
@@ -334,6 +555,7 @@ class ItineraryService:
         return {
             "total_itineraries": total,
             "draft_itineraries": draft,
+            "generating_itineraries": generating,
             "confirmed_itineraries": confirmed,
             "public_itineraries": public,
             "private_itineraries": private
@@ -381,166 +603,344 @@ class ItineraryService:
         return result
 
     
-    def initilize_agent(self, itinerary_id: uuid.UUID, thread_id: str, message: str):
-
-        config: RunnableConfig = {
-            "configurable": {
-                "thread_id": thread_id,
-            }
-        }
-        
-        itinerary = self.get_itinerary_by_id(itinerary_id)
+    def initilize_agent(self, itinerary_id: uuid.UUID, thread_id: str, message: str, turn: Optional["AgentTurnContext"] = None):
+        turn = turn or AgentTurnContext(self, itinerary_id, thread_id)
 
         initial_state = {
-            "itinerary": itinerary.details_itinerary,
+            "itinerary": turn.itinerary.details_itinerary,
             "messages": message,
         }
 
-        itinerary_agent.invoke(initial_state, config=config)
-
-        raw_state = itinerary_agent.get_state(config)
+        agent = turn.agent
+        self.release_connection()
+        agent.invoke(initial_state, config=turn.config)
+        turn.invalidate()
 
-        return state_to_dict(raw_state)  
+        return turn.state
 
 
     def send_agent_message(self, itinerary_id: uuid.UUID, thread_id: str, message: str):
-        config: RunnableConfig = {
-            "configurable": {
-                "thread_id": thread_id,
-            }
-        }
+        # The itinerary and the thread snapshot are loaded once per request
+        turn = AgentTurnContext(self, itinerary_id, thread_id)
+        agent = turn.agent
 
-        status = self.get_itinerary_by_id(itinerary_id).status
-        if status == "confirmed":
-            agent = activities_chat_agent
-            agent_str = "activities_chat_agent"
-        else:
-            agent_str = "itinerary_agent"
-            agent = itinerary_agent
-
-        agent_state = self.get_agent_state(thread_id, agent_str)
-        if not agent_state:
-            self.initilize_agent(itinerary_id, thread_id, message)
-            return self.get_agent_state(thread_id, agent_str)
+        if not turn.has_thread:
+            return self.initilize_agent(itinerary_id, thread_id, message, turn)
 
-        is_hil_mode, hil_message, state_values = detect_hil_mode(agent, config)
+        is_hil_mode = turn.is_hil_mode()
+        self.release_connection()
 
         if is_hil_mode:
-            agent.invoke(Command(resume={"messages": message}), config=config)
-
-            itinerary = self.get_itinerary_by_id(itinerary_id)
-            agent_state = self.get_agent_state(thread_id, agent_str) # update the new agent state
-
-            itinerary_update = ItineraryUpdate(
-                details_itinerary=agent_state[0]["itinerary"],
-                trip_name=agent_state[0]["itinerary"]["nombre_viaje"],
-                duration_days=agent_state[0]["itinerary"]["cantidad_dias"],
-                slug=itinerary.slug,
-                destination=itinerary.destination,
-                start_date=itinerary.start_date,
-                travelers_count=itinerary.travelers_count,
-                budget=itinerary.budget,
-                trip_type=itinerary.trip_type,
-                tags=itinerary.tags,
-                notes=itinerary.notes,
-                visibility=itinerary.visibility,
-                status=itinerary.status,
-            )
+            from langgraph.types import Command
+            agent.invoke(Command(resume={"messages": message}), config=turn.config)
+            turn.invalidate()
 
-            self.update_itinerary(itinerary_id, itinerary_update)
+            agent_state = turn.state # the new agent state
+            self.save_agent_itinerary(itinerary_id, agent_state[0]["itinerary"], db_itinerary=turn.itinerary)
 
             return agent_state
   
-        agent.invoke({"messages": message}, config=config)
+        agent.invoke({"messages": message}, config=turn.config)
+        turn.invalidate()
 
-        return self.get_agent_state(thread_id, agent_str)
+        return turn.state
 
 
-    def send_agent_message_stream(self, itinerary_id: uuid.UUID, thread_id: str, message: str):
+    def save_agent_itinerary(self, itinerary_id: uuid.UUID, itinerary: dict, db_itinerary: Optional[Itinerary] = None) -> Optional[Itinerary]:
+        """Store the itinerary edited by a chat agent (recorded as an "agent" version)"""
+        itinerary_update = ItineraryUpdate(
+            details_itinerary=itinerary,
+            trip_name=itinerary["nombre_viaje"],
+            duration_days=itinerary["cantidad_dias"],
+        )
+        return self.update_itinerary(itinerary_id, itinerary_update, version_source="agent", db_itinerary=db_itinerary)
+
+    def get_agent_state(self, thread_id: str, agent_str: str):
         config: RunnableConfig = {
             "configurable": {
                 "thread_id": thread_id,
             }
         }
 
-        status = self.get_itinerary_by_id(itinerary_id).status
-        if status == "confirmed":
-            agent = activities_chat_agent
-            agent_str = "activities_chat_agent"
-        else:
-            agent = itinerary_agent
-            agent_str = "itinerary_agent"
+        if agent_str not in ("itinerary_agent", "activities_chat_agent"):
+            return False
+        agent = get_graph(agent_str)
 
-        agent_state = self.get_agent_state(thread_id, agent_str)
+        raw_state = agent.get_state(config)
+        state_dict = state_to_dict(raw_state)
+        if not is_valid_thread_state(state_dict):
+            return False
 
-        # Initialize the agent if it doesn't exist
-        if not agent_state: 
-            itinerary = self.get_itinerary_by_id(itinerary_id)
-            state = {
-                "itinerary": itinerary.details_itinerary,
-                "messages": message,
-            }
+        return state_dict
 
-        else:
 
-            is_hil_mode, hil_message, state_values = detect_hil_mode(agent, config)
-            if is_hil_mode:
-                state = Command(resume={"messages": message})
-            else:
-                state = {"messages": message}
-
-        for chunk, metadata in agent.stream(state, config=config, stream_mode="messages"):
-            if chunk.content:
-                yield f"data: {json.dumps({'token': chunk.content})}\n\n"
-
-        if agent_state and is_hil_mode:
-
-            itinerary = self.get_itinerary_by_id(itinerary_id)
-            agent_state = self.get_agent_state(thread_id, agent_str) # update the new agent state
-
-            itinerary_update = ItineraryUpdate(
-                details_itinerary=agent_state[0]["itinerary"],
-                trip_name=agent_state[0]["itinerary"]["nombre_viaje"],
-                duration_days=agent_state[0]["itinerary"]["cantidad_dias"],
-                slug=itinerary.slug,
-                destination=itinerary.destination,
-                start_date=itinerary.start_date,
-                travelers_count=itinerary.travelers_count,
-                budget=itinerary.budget,
-                trip_type=itinerary.trip_type,
-                tags=itinerary.tags,
-                notes=itinerary.notes,
-                visibility=itinerary.visibility,
-                status=itinerary.status,
+class AgentTurnContext:
+    """Itinerary and chat thread snapshot of one agent request, each loaded once.
+
+    Call `invalidate()` after running the agent: the next access reads the new
+    checkpoint. The snapshot is only serialized when `state` is requested.
+    """
+
+    def __init__(self, service: ItineraryService, itinerary_id: uuid.UUID, thread_id: str):
+        self.service = service
+        self.itinerary_id = itinerary_id
+        self.config = {"configurable": {"thread_id": thread_id}}
+        self._itinerary: Optional[Itinerary] = None
+        self._snapshot = None
+        self._state = None
+
+    @property
+    def itinerary(self) -> Optional[Itinerary]:
+        if self._itinerary is None:
+            self._itinerary = self.service.get_itinerary_by_id(self.itinerary_id)
+        return self._itinerary
+
+    @property
+    def agent_str(self) -> str:
+        return "activities_chat_agent" if self.itinerary.status == "confirmed" else "itinerary_agent"
+
+    @property
+    def agent(self):
+        return get_graph(self.agent_str)
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self.agent.get_state(self.config)
+        return self._snapshot
+
+    @property
+    def has_thread(self) -> bool:
+        """The thread already has a conversation (same check as `is_valid_thread_state`)"""
+        return bool((self.snapshot.values or {}).get("messages"))
+
+    @property
+    def state(self):
+        """Thread state as JSON compatible data, or False if the thread has no conversation"""
+        if self._state is None:
+            state_dict = state_to_dict(self.snapshot)
+            self._state = state_dict if is_valid_thread_state(state_dict) else False
+        return self._state
+
+    def is_hil_mode(self) -> bool:
+        """The agent is waiting for a Human in the Loop answer"""
+        return any(getattr(task, "interrupts", None) for task in self.snapshot.tasks or ())
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+        self._state = None
+
+
+class AsyncItineraryService:
+    """Async (non-blocking) variant of the hot read paths of ItineraryService"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_itinerary_by_id(self, itinerary_id: uuid.UUID) -> Optional[Itinerary]:
+        """Get itinerary by UUID (excluding soft deleted)"""
+        result = await self.db.execute(
+            select(Itinerary).where(
+                Itinerary.itinerary_id == itinerary_id,
+                Itinerary.deleted_at.is_(None)
             )
+        )
+        return result.scalars().first()
 
-            self.update_itinerary(itinerary_id, itinerary_update)
+    async def get_itinerary_by_slug(self, slug: str) -> Optional[Itinerary]:
+        """Get itinerary by slug (excluding soft deleted)"""
+        result = await self.db.execute(
+            select(Itinerary).where(
+                Itinerary.slug == slug,
+                Itinerary.deleted_at.is_(None)
+            )
+        )
+        return result.scalars().first()
 
-        yield "data: [DONE]\n\n"    
+    async def get_itineraries_by_user(self, user_id: str, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Get all itineraries for a specific Auth0 user (list columns only)"""
+        return await self._list(Itinerary.user_id == user_id, cursor=cursor, skip=skip, limit=limit)
 
-    def get_agent_state(self, thread_id: str, agent_str: str):
-        config: RunnableConfig = {
-            "configurable": {
-                "thread_id": thread_id,
-            }
+    async def get_itineraries_by_session(self, session_id: uuid.UUID, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Get all itineraries for a specific session UUID (list columns only)"""
+        return await self._list(Itinerary.session_id == session_id, cursor=cursor, skip=skip, limit=limit)
+
+    async def get_public_itineraries(self, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None,
+                                     city: Optional[str] = None, country: Optional[str] = None, traveler_profile: Optional[str] = None) -> List[Itinerary]:
+        """Get all public itineraries, optionally by destination city, country or traveler profile (list columns only)"""
+        filters = itinerary_json_filters(city, country, traveler_profile)
+        return await self._list(Itinerary.visibility == "public", *filters, cursor=cursor, skip=skip, limit=limit)
+
+    async def search_itineraries(self, query: str, skip: int = 0, limit: int = 100, cursor: Optional[ListCursor] = None) -> List[Itinerary]:
+        """Search public itineraries by trip name or destination (list columns only)"""
+        search_filter = or_(
+            Itinerary.trip_name.ilike(f"%{query}%"),
+            Itinerary.destination.ilike(f"%{query}%")
+        )
+        return await self._list(search_filter, Itinerary.visibility == "public", cursor=cursor, skip=skip, limit=limit)
+
+    async def get_itinerary_stats(self, user_id: Optional[str] = None, session_id: Optional[uuid.UUID] = None) -> dict:
+        """Get statistics for Auth0 user's or session's itineraries (single query)"""
+        if user_id:
+            owner_filter = Itinerary.user_id == user_id
+        elif session_id:
+            owner_filter = Itinerary.session_id == session_id
+        else:
+            return {"error": "Either user_id or session_id must be provided"}
+
+        result = await self.db.execute(
+            select(
+                func.count(),
+                func.count().filter(Itinerary.status == "draft"),
+                func.count().filter(Itinerary.status == "generating"),
+                func.count().filter(Itinerary.status == "confirmed"),
+                func.count().filter(Itinerary.visibility == "public"),
+                func.count().filter(Itinerary.visibility == "private"),
+            ).where(owner_filter, Itinerary.deleted_at.is_(None))
+        )
+        total, draft, generating, confirmed, public, private = result.one()
+
+        return {
+            "total_itineraries": total,
+            "draft_itineraries": draft,
+            "generating_itineraries": generating,
+            "confirmed_itineraries": confirmed,
+            "public_itineraries": public,
+            "private_itineraries": private
         }
 
-        if agent_str == "itinerary_agent":
-            agent = itinerary_agent
-        elif agent_str == "activities_chat_agent":
-            agent = activities_chat_agent
+    async def send_agent_message_astream(self, itinerary_id: uuid.UUID, thread_id: str, message: str):
+        """Send a message to the chat agent of the itinerary and stream the turn as SSE events.
+
+        The thread snapshot is loaded once (thread existence and pending
+        interrupt), the DB connection is released before the LLM starts, and the
+        itinerary is stored only if the turn changed it.
+        """
+        from langgraph.types import Command
+
+        itinerary = await self.get_itinerary_by_id(itinerary_id)
+        if itinerary is None:
+            yield sse_event({"type": "error", "error": "Itinerary not found"})
+            yield "data: [DONE]\n\n"
+            return
+
+        agent_str = "activities_chat_agent" if itinerary.status == "confirmed" else "itinerary_agent"
+        details_itinerary = itinerary.details_itinerary
+        await self.db.close()  # Don't hold a pooled connection while the LLM streams
+
+        agent = get_graph(agent_str)
+        config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+        snapshot = await agent.aget_state(config)
+        values = snapshot.values or {}
+
+        if not values.get("messages"):
+            graph_input = {"itinerary": details_itinerary, "messages": message}
+            previous_itinerary = details_itinerary
         else:
-            return False
+            is_hil_mode = any(task.interrupts for task in snapshot.tasks or ())
+            graph_input = Command(resume={"messages": message}) if is_hil_mode else {"messages": message}
+            previous_itinerary = itinerary_to_dict(values.get("itinerary")) if values.get("itinerary") is not None else details_itinerary
 
-        raw_state = agent.get_state(config)
-        state_dict = state_to_dict(raw_state)
-        if not is_valid_thread_state(state_dict):
-            return False
+        async def save(new_itinerary: dict):
+            await asyncio.to_thread(_run_in_session, lambda service: service.save_agent_itinerary(itinerary_id, new_itinerary))
 
-        return state_dict
+        async for event in agent_event_stream(agent, graph_input, config, previous_itinerary, on_itinerary=save):
+            yield event
+
+    async def _list(self, *filters, cursor: Optional[ListCursor] = None, skip: int = 0, limit: int = 100) -> List[Itinerary]:
+        result = await self.db.execute(list_itineraries_statement(*filters, cursor=cursor, skip=skip, limit=limit))
+        return list(result.scalars().all())
+
+
+def _generate_itinerary_job(job: Job, itinerary_data: ItineraryGenerate, user_id: Optional[uuid.UUID], session_id: Optional[uuid.UUID]) -> dict:
+    """Job body: generate and store the itinerary using its own DB session"""
+    with session_scope() as db:
+        user = db.get(User, user_id) if user_id else None
+        get_job_manager().progress(job, "generating_itinerary")
+        itinerary = ItineraryService(db).generate_itinerary(itinerary_data, user, session_id)
+        return ItineraryResponse.model_validate(itinerary).model_dump(mode="json")
+
+
+async def _generate_itineraries_daily_job(job: Job, itinerary_id: uuid.UUID) -> dict:
+    """Job body: run the daily itinerary graph without blocking a thread during the LLM calls"""
+    job_manager = get_job_manager()
+
+    job_manager.progress(job, "loading_itinerary")
+    graph_input = await asyncio.to_thread(_run_in_session, lambda service: service.get_daily_generation_input(itinerary_id))
+    if not graph_input:
+        raise ValueError(f"Itinerary {itinerary_id} not found or without route details")
+
+    job_manager.progress(job, "generating_daily_itinerary", cities=[city["city"] for city in graph_input["cities"]])
+    result = await get_graph("daily_itinerary").ainvoke(graph_input, config=get_graph_attribute("daily_itinerary", "GRAPH_CONFIG"))
+    final_itinerary = result.get("final_itinerary", None)
+    if not final_itinerary:
+        raise ValueError("The daily itinerary graph returned no itinerary")
+
+    job_manager.progress(job, "saving_daily_itinerary")
+    final_itinerary_json = final_itinerary.model_dump()
+    await asyncio.to_thread(_run_in_session, lambda service: service.save_daily_itinerary(itinerary_id, final_itinerary_json))
+
+    # The plan is already visible; coordinates and photos are added day by day
+    enrichment = None
+    if ITINERARY_ENRICHMENT_ENABLED:
+        job_manager.progress(job, "enriching_itinerary")
+        try:
+            enrichment = await enrich_itinerary(
+                itinerary_id,
+                on_day=lambda day_index, day: job_manager.progress(job, "day_enriched", day_index=day_index, dia=day.get("dia")),
+            )
+        except Exception as e:
+            print(f"\n\nError enriching itinerary {itinerary_id}: {e}\n\n")
+
+    return {"itinerary_id": str(itinerary_id), "status": "confirmed", "enrichment": enrichment}
+
+
+async def _enrich_itinerary_job(job: Job, itinerary_id: uuid.UUID) -> dict:
+    """Job body: add coordinates and images to a stored daily itinerary"""
+    job_manager = get_job_manager()
+    summary = await enrich_itinerary(
+        itinerary_id,
+        on_day=lambda day_index, day: job_manager.progress(job, "day_enriched", day_index=day_index, dia=day.get("dia")),
+    )
+    return {"itinerary_id": str(itinerary_id), "enrichment": summary}
+
+
+def _run_in_session(func):
+    """Run `func(service)` with a short lived session of its own"""
+    with session_scope() as db:
+        return func(ItineraryService(db))
+
+
+def _is_stale_generation(itinerary: Itinerary) -> bool:
+    updated_at = itinerary.updated_at
+    if updated_at is None:
+        return False
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - updated_at > timedelta(seconds=DAILY_ITINERARY_STALE_SECONDS)
+
+
+def reset_stale_generations() -> int:
+    """Startup hook: the jobs of the previous process are gone, release their itineraries"""
+    return _run_in_session(lambda service: service.reset_stale_generations())
+
+
+def _set_itinerary_status(itinerary_id: uuid.UUID, status: str) -> None:
+    def update(service: ItineraryService):
+        itinerary = service.get_itinerary_by_id(itinerary_id)
+        if itinerary:
+            itinerary.status = status
+            service.db.commit()
+
+    _run_in_session(update)
 
 
 # Convenience functions for dependency injection
 def get_itinerary_service(db: Session) -> ItineraryService:
     """Factory function to create ItineraryService instance"""
     return ItineraryService(db)
+
+
+def get_async_itinerary_service(db: AsyncSession) -> AsyncItineraryService:
+    """Factory function to create AsyncItineraryService instance"""
+    return AsyncItineraryService(db)
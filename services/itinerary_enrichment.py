@@ -0,0 +1,170 @@
+"""
+Enrichment stage of the daily itinerary: coordinates and photos per activity.
+
+Runs after the daily plan is stored. Every activity of `itinerario_diario` is
+geocoded (Mapbox) and matched to a Wikipedia page for images. Days are
+processed concurrently (at most ITINERARY_ENRICHMENT_MAX_CONCURRENCY at a
+time); within a day the geocoding and the Wikipedia lookups run in parallel and
+both tools cache their results. Each day is written back as soon as it is
+ready, so the frontend gets maps and photos progressively.
+
+Fields added to every activity: `latitud`, `longitud`, `direccion_completa`
+and `imagenes` (list of image URLs).
+"""
+
+import asyncio
+import copy
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from database import session_scope
+from models.itinerary import Itinerary
+from services.itinerary_versions import record_version
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+ITINERARY_ENRICHMENT_ENABLED = os.getenv("ITINERARY_ENRICHMENT_ENABLED", "true").lower() in ("1", "true", "yes")
+ITINERARY_ENRICHMENT_MAX_CONCURRENCY = int(os.getenv("ITINERARY_ENRICHMENT_MAX_CONCURRENCY", "3"))
+ITINERARY_ENRICHMENT_LANGUAGE = os.getenv("ITINERARY_ENRICHMENT_LANGUAGE", "es")
+ITINERARY_ENRICHMENT_MAX_IMAGES = int(os.getenv("ITINERARY_ENRICHMENT_MAX_IMAGES", "2"))
+
+ACTIVITY_SLOTS = ("actividades_mañana", "actividades_tarde", "actividades_noche")
+
+
+def day_activities(day: dict) -> list[dict]:
+    """Activities of a day in order (morning, afternoon, night)"""
+    return [activity for slot in ACTIVITY_SLOTS for activity in (day.get(slot) or [])]
+
+
+def geocoding_query(activity: dict, day: dict) -> str:
+    """Text sent to the geocoder: the activity location (its title if it has none) plus city and country.
+
+    `ubicacion` is an address or area the geocoder can resolve, while a title
+    like "Paseo por el Trastevere al atardecer" is not a place name. The city
+    and country are added (unless the location already names them) so homonyms
+    resolve to the right place.
+    """
+    place = (activity.get("ubicacion") or "").strip() or (activity.get("titulo") or "").strip()
+    parts = [place]
+    for part in (day.get("ciudad"), day.get("pais")):
+        part = (part or "").strip()
+        if part and part.lower() not in place.lower():
+            parts.append(part)
+    return ", ".join(part for part in parts if part)
+
+
+async def enrich_day(day: dict, language: Optional[str] = None, max_images: Optional[int] = None) -> dict:
+    """Return a copy of `day` with coordinates and images on each activity"""
+    from tools.geocoding_tool import batch_geocode_attractions_async
+    from tools.wikipedia_tool import fetch_wikipedia_pages
+
+    language = language or ITINERARY_ENRICHMENT_LANGUAGE
+    max_images = max_images or ITINERARY_ENRICHMENT_MAX_IMAGES
+
+    activities = day_activities(day)
+    if not activities:
+        return day
+
+    queries = [geocoding_query(activity, day) for activity in activities]
+    titles = [activity.get("titulo", "") for activity in activities]
+
+    # Geocoding (async) and Wikipedia (batched sync requests, in a thread) at the same time
+    locations, pages = await asyncio.gather(
+        batch_geocode_attractions_async(queries, language=language),
+        asyncio.to_thread(fetch_wikipedia_pages, titles, language=language, sentences=1, max_images=max_images),
+    )
+
+    enriched = {**day}
+    for slot in ACTIVITY_SLOTS:
+        if day.get(slot) is None:
+            continue
+        enriched_activities = []
+        for activity in day[slot]:
+            location = locations.get(geocoding_query(activity, day)) or {}
+            page = pages.get(activity.get("titulo", ""))
+            enriched_activities.append({
+                **activity,
+                "latitud": location.get("latitude"),
+                "longitud": location.get("longitude"),
+                "direccion_completa": location.get("full_address"),
+                "imagenes": [image["url"] for image in page["images"]] if page else [],
+            })
+        enriched[slot] = enriched_activities
+
+    return enriched
+
+
+def save_enriched_day(itinerary_id: uuid.UUID, day_index: int, enriched_day: dict) -> bool:
+    """Write the enrichment of one day back into `details_itinerary`.
+
+    The row is locked and re-read, so concurrent day writes (or an edit made
+    meanwhile) are not overwritten: only activities whose title still matches
+    get the new fields.
+    """
+    with session_scope() as db:
+        itinerary = db.get(Itinerary, itinerary_id, with_for_update=True)
+        if not itinerary or not itinerary.details_itinerary:
+            return False
+
+        details = copy.deepcopy(itinerary.details_itinerary)
+        days = details.get("itinerario_diario") or []
+        if day_index >= len(days) or days[day_index].get("dia") != enriched_day.get("dia"):
+            return False
+
+        stored_day = days[day_index]
+        for slot in ACTIVITY_SLOTS:
+            for stored, enriched in zip(stored_day.get(slot) or [], enriched_day.get(slot) or []):
+                if stored.get("titulo") == enriched.get("titulo"):
+                    stored.update({key: enriched[key] for key in ("latitud", "longitud", "direccion_completa", "imagenes")})
+
+        record_version(db, itinerary, details, "enrichment", summary=f"Day {enriched_day.get('dia')} enriched")
+    return True
+
+
+def _load_days(itinerary_id: uuid.UUID) -> list[dict]:
+    with session_scope() as db:
+        itinerary = db.get(Itinerary, itinerary_id)
+        if not itinerary or not itinerary.details_itinerary:
+            return []
+        return itinerary.details_itinerary.get("itinerario_diario") or []
+
+
+async def enrich_itinerary(
+    itinerary_id: uuid.UUID,
+    on_day: Optional[Callable[[int, dict], Optional[Awaitable[None]]]] = None,
+    max_concurrency: Optional[int] = None,
+) -> dict:
+    """Enrich every day of a stored itinerary, saving each day when it is ready.
+
+    `on_day(day_index, enriched_day)` is called after each day is saved (for progress events).
+    Returns a summary: {"days", "enriched_days", "activities", "geocoded", "with_images"}.
+    """
+    days = await asyncio.to_thread(_load_days, itinerary_id)
+    semaphore = asyncio.Semaphore(max_concurrency or ITINERARY_ENRICHMENT_MAX_CONCURRENCY)
+    summary = {"days": len(days), "enriched_days": 0, "activities": 0, "geocoded": 0, "with_images": 0}
+
+    async def process(day_index: int, day: dict):
+        async with semaphore:
+            try:
+                enriched_day = await enrich_day(day)
+            except Exception as e:
+                print(f"\n\nError enriching day {day.get('dia')} of itinerary {itinerary_id}: {e}\n\n")
+                return
+        if not await asyncio.to_thread(save_enriched_day, itinerary_id, day_index, enriched_day):
+            return
+
+        activities = day_activities(enriched_day)
+        summary["enriched_days"] += 1
+        summary["activities"] += len(activities)
+        summary["geocoded"] += sum(1 for activity in activities if activity.get("latitud") is not None)
+        summary["with_images"] += sum(1 for activity in activities if activity.get("imagenes"))
+        if on_day is not None:
+            result = on_day(day_index, enriched_day)
+            if asyncio.iscoroutine(result):
+                await result
+
+    await asyncio.gather(*(process(day_index, day) for day_index, day in enumerate(days)))
+    return summary
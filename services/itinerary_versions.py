@@ -0,0 +1,212 @@
+"""
+Version history of `details_itinerary`.
+
+Every change of the itinerary details is stored in `itinerary_versions` as a
+JSON Patch (RFC 6902) from the previous version, with a full snapshot every
+ITINERARY_SNAPSHOT_INTERVAL versions (or when the diff would be larger than
+the document). `Itinerary.current_version` points at the latest row, so it is
+found without scanning the history, and any version is rebuilt from its
+nearest snapshot with at most ITINERARY_SNAPSHOT_INTERVAL - 1 patches.
+
+Undo never calls the LLM: it restores the version the current one was derived
+from and records that as a new version, so the history is never rewritten.
+"""
+
+import copy
+import json
+import os
+from typing import List, Optional
+
+import jsonpatch
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.orm.attributes import flag_modified
+
+from models.itinerary import Itinerary
+from models.itinerary_version import ItineraryVersion, VersionKindEnum
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+ITINERARY_SNAPSHOT_INTERVAL = int(os.getenv("ITINERARY_SNAPSHOT_INTERVAL", "10"))
+
+# Background steps that add data to the itinerary but are not user edits: undo skips over them
+NON_UNDOABLE_SOURCES = {"enrichment"}
+# Undo never goes back past these: the daily plan confirms the itinerary, undoing it would leave a confirmed trip without days
+UNDO_BARRIER_SOURCES = {"daily"}
+
+
+def _json_size(data) -> int:
+    return len(json.dumps(data, ensure_ascii=False, default=str))
+
+
+def _get_version(db: Session, itinerary_id, version: int) -> Optional[ItineraryVersion]:
+    return db.execute(
+        select(ItineraryVersion).where(
+            ItineraryVersion.itinerary_id == itinerary_id,
+            ItineraryVersion.version == version,
+        )
+    ).scalar_one_or_none()
+
+
+def _add_version(db: Session, itinerary: Itinerary, kind: VersionKindEnum, data, source: str,
+                 summary: Optional[str], parent_version: Optional[int]) -> ItineraryVersion:
+    version = ItineraryVersion(
+        itinerary_id=itinerary.itinerary_id,
+        version=(itinerary.current_version or 0) + 1,
+        parent_version=parent_version,
+        kind=kind.value,
+        data=data,
+        source=source,
+        summary=summary,
+    )
+    db.add(version)
+    itinerary.current_version = version.version
+    return version
+
+
+def record_version(db: Session, itinerary: Itinerary, new_details: Optional[dict], source: str,
+                   summary: Optional[str] = None, parent_version: Optional[int] = -1) -> Optional[ItineraryVersion]:
+    """
+    Set `itinerary.details_itinerary` to `new_details` and record the change.
+
+    The caller commits. Returns None when nothing changed.
+
+    Args:
+        db: Session the itinerary belongs to
+        itinerary: Itinerary being changed (must not have been mutated in place yet)
+        new_details: New content of details_itinerary
+        source: Who made the change (generation, daily, agent, update, enrichment, undo, restore)
+        summary: Optional human readable description of the change
+        parent_version: Version the change derives from (defaults to the current one)
+    """
+    if new_details is None:
+        return None
+
+    new_details = copy.deepcopy(new_details)
+    old_details = itinerary.details_itinerary
+    if itinerary.itinerary_id is None:
+        db.flush()  # assigns the primary key of a new itinerary
+
+    if parent_version == -1:
+        parent_version = itinerary.current_version or None
+
+    if not itinerary.current_version:
+        # Itineraries created before versioning get their previous content as baseline
+        if old_details and old_details != new_details:
+            _add_version(db, itinerary, VersionKindEnum.SNAPSHOT, copy.deepcopy(old_details), "baseline", None, None)
+            parent_version = itinerary.current_version
+        version = _add_version(db, itinerary, VersionKindEnum.SNAPSHOT, new_details, source, summary, parent_version)
+    else:
+        patch = jsonpatch.make_patch(old_details or {}, new_details).patch
+        if not patch:
+            return None
+
+        next_version = itinerary.current_version + 1
+        if (next_version - 1) % ITINERARY_SNAPSHOT_INTERVAL == 0 or _json_size(patch) >= _json_size(new_details):
+            version = _add_version(db, itinerary, VersionKindEnum.SNAPSHOT, new_details, source, summary, parent_version)
+        else:
+            version = _add_version(db, itinerary, VersionKindEnum.DIFF, patch, source, summary, parent_version)
+
+    itinerary.details_itinerary = new_details
+    flag_modified(itinerary, "details_itinerary") # For SQLAlchemy to detect the changes
+    return version
+
+
+def get_version_content(db: Session, itinerary_id, version: int) -> Optional[dict]:
+    """Rebuild details_itinerary as it was at `version` (nearest snapshot + following patches)"""
+    snapshot = db.execute(
+        select(ItineraryVersion)
+        .where(
+            ItineraryVersion.itinerary_id == itinerary_id,
+            ItineraryVersion.version <= version,
+            ItineraryVersion.kind == VersionKindEnum.SNAPSHOT.value,
+        )
+        .order_by(ItineraryVersion.version.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+    if snapshot is None:
+        return None
+
+    diffs = db.execute(
+        select(ItineraryVersion)
+        .where(
+            ItineraryVersion.itinerary_id == itinerary_id,
+            ItineraryVersion.version > snapshot.version,
+            ItineraryVersion.version <= version,
+        )
+        .order_by(ItineraryVersion.version)
+    ).scalars().all()
+    if len(diffs) != version - snapshot.version:
+        return None
+
+    content = copy.deepcopy(snapshot.data)
+    for diff in diffs:
+        content = jsonpatch.apply_patch(content, diff.data)
+    return content
+
+
+def list_versions(db: Session, itinerary_id, skip: int = 0, limit: int = 100) -> List[ItineraryVersion]:
+    """Version metadata, newest first (the stored data is not loaded)"""
+    return db.execute(
+        select(ItineraryVersion)
+        .options(load_only(
+            ItineraryVersion.version, ItineraryVersion.parent_version, ItineraryVersion.kind,
+            ItineraryVersion.source, ItineraryVersion.summary, ItineraryVersion.created_at,
+        ))
+        .where(ItineraryVersion.itinerary_id == itinerary_id)
+        .order_by(ItineraryVersion.version.desc())
+        .offset(skip)
+        .limit(limit)
+    ).scalars().all()
+
+
+def restore_version(db: Session, itinerary: Itinerary, version: int, source: str = "restore",
+                    parent_version: Optional[int] = -1, summary: Optional[str] = None) -> Optional[ItineraryVersion]:
+    """Make `version` the current content again, recorded as a new version"""
+    content = get_version_content(db, itinerary.itinerary_id, version)
+    if content is None:
+        return None
+    if parent_version == -1:
+        parent_version = version
+    return record_version(db, itinerary, content, source, summary=summary or f"Restored version {version}", parent_version=parent_version)
+
+
+def _last_undoable(db: Session, itinerary_id, version: Optional[int]) -> Optional[ItineraryVersion]:
+    """`version`, or the closest ancestor that is not a background step (NON_UNDOABLE_SOURCES)"""
+    current = _get_version(db, itinerary_id, version) if version else None
+    while current is not None and current.source in NON_UNDOABLE_SOURCES and current.parent_version:
+        current = _get_version(db, itinerary_id, current.parent_version)
+    return current
+
+
+def undo_version(db: Session, itinerary: Itinerary) -> Optional[ItineraryVersion]:
+    """
+    Go back to the version the last change was made from.
+
+    Background versions (enrichment) are skipped on both ends: the last user
+    change is the one undone, and the restored content keeps the enrichment
+    added after it. Repeated undos keep walking back (the new version inherits
+    the parent of the last user change of the restored one) but never past
+    the daily plan (UNDO_BARRIER_SOURCES). Returns None when there is nothing
+    to undo.
+    """
+    if not itinerary.current_version:
+        return None
+
+    current = _last_undoable(db, itinerary.itinerary_id, itinerary.current_version)
+    if current is None or current.source in UNDO_BARRIER_SOURCES or not current.parent_version:
+        return None
+
+    target = _get_version(db, itinerary.itinerary_id, current.parent_version)
+    if target is None:
+        return None
+
+    base = _last_undoable(db, itinerary.itinerary_id, target.version)
+    parent_version = None if base is None or base.source in UNDO_BARRIER_SOURCES else base.parent_version
+
+    return restore_version(
+        db, itinerary, target.version, source="undo", parent_version=parent_version,
+        summary=f"Undo: back to version {target.version}",
+    )
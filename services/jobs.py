@@ -0,0 +1,363 @@
+"""
+Background job queue for long running work (LLM itinerary generation).
+
+Jobs are executed on a dedicated event loop thread, outside of the AnyIO
+threadpool used by FastAPI request handlers, so a slow Gemini call never
+starves unrelated CRUD endpoints. Submitting a job returns immediately;
+clients read the result by polling the job or by streaming its events (SSE).
+
+The job state and events are stored in the `jobs` / `job_events` tables
+(JOB_BACKEND=postgres), so any API worker or container can answer the polls
+and streams of a job that runs in another one. JOB_BACKEND=memory keeps them
+in process memory, for tests and single process development only.
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+class JobStatusEnum(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+FINISHED_STATUSES = (JobStatusEnum.SUCCEEDED, JobStatusEnum.FAILED)
+
+
+@dataclass
+class Job:
+    """A unit of background work and its outcome"""
+    job_id: str
+    kind: str
+    status: JobStatusEnum = JobStatusEnum.QUEUED
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    max_retries: int = 0
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class InMemoryJobBackend:
+    """Stores jobs and their events in process memory.
+
+    Only for tests and single process development: another worker cannot see
+    these jobs. Oldest finished jobs are dropped once `max_jobs` is reached.
+    """
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._events: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._events.setdefault(job.job_id, [])
+            self._evict()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def add_event(self, job_id: str, event: str, data: dict) -> None:
+        with self._lock:
+            self._events.setdefault(job_id, []).append({"event": event, "data": data})
+
+    def get_events(self, job_id: str, since: int = 0) -> List[dict]:
+        with self._lock:
+            return list(self._events.get(job_id, [])[since:])
+
+    def _evict(self) -> None:
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs.keys()):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].is_finished:
+                del self._jobs[job_id]
+                self._events.pop(job_id, None)
+
+
+class PostgresJobBackend:
+    """Stores jobs and their events in the database, shared by every API process.
+
+    Finished jobs older than JOB_RETENTION_HOURS are deleted (with their
+    events) whenever a new job is saved.
+    """
+
+    def __init__(self, session_factory=None, retention_hours: Optional[float] = None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.retention_hours = retention_hours if retention_hours is not None else float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+    def save(self, job: Job) -> None:
+        from models.job import JobEventRecord, JobRecord
+
+        with self.session_factory() as db:
+            if job.status == JobStatusEnum.QUEUED and job.attempts == 0:
+                self._prune(db, JobRecord, JobEventRecord)
+            db.merge(JobRecord(
+                job_id=job.job_id,
+                kind=job.kind,
+                status=job.status.value,
+                result=_json_safe(job.result),
+                error=job.error,
+                created_at=job.created_at,
+                started_at=job.started_at,
+                finished_at=job.finished_at,
+                job_metadata=_json_safe(job.metadata),
+                attempts=job.attempts,
+                max_retries=job.max_retries,
+            ))
+            db.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        from models.job import JobRecord
+
+        with self.session_factory() as db:
+            record = db.get(JobRecord, job_id)
+            if record is None:
+                return None
+            return Job(
+                job_id=record.job_id,
+                kind=record.kind,
+                status=JobStatusEnum(record.status),
+                result=record.result,
+                error=record.error,
+                created_at=record.created_at,
+                started_at=record.started_at,
+                finished_at=record.finished_at,
+                metadata=record.job_metadata or {},
+                attempts=record.attempts,
+                max_retries=record.max_retries,
+            )
+
+    def add_event(self, job_id: str, event: str, data: dict) -> None:
+        from models.job import JobEventRecord
+
+        with self.session_factory() as db:
+            db.add(JobEventRecord(job_id=job_id, event=event, data=_json_safe(data)))
+            db.commit()
+
+    def get_events(self, job_id: str, since: int = 0) -> List[dict]:
+        from models.job import JobEventRecord
+
+        with self.session_factory() as db:
+            rows = db.query(JobEventRecord.event, JobEventRecord.data).filter(
+                JobEventRecord.job_id == job_id
+            ).order_by(JobEventRecord.id).offset(since).all()
+            return [{"event": event, "data": data} for event, data in rows]
+
+    def _prune(self, db, JobRecord, JobEventRecord) -> None:
+        finished_before = datetime.now(timezone.utc) - timedelta(hours=self.retention_hours)
+        old_jobs = db.query(JobRecord.job_id).filter(JobRecord.finished_at < finished_before)
+        db.query(JobEventRecord).filter(JobEventRecord.job_id.in_(old_jobs.scalar_subquery())).delete(synchronize_session=False)
+        db.query(JobRecord).filter(JobRecord.finished_at < finished_before).delete(synchronize_session=False)
+
+
+def _json_safe(value):
+    """Plain JSON data (datetimes, UUIDs and enums as strings) for the JSON columns"""
+    return json.loads(json.dumps(value, default=str)) if value is not None else None
+
+
+def create_job_backend():
+    """Backend selected by JOB_BACKEND (postgres | memory)"""
+    backend = os.getenv("JOB_BACKEND", "postgres").lower()
+    if backend == "memory":
+        return InMemoryJobBackend()
+    if backend == "postgres":
+        return PostgresJobBackend()
+    raise ValueError(f"Unknown JOB_BACKEND: {backend}")
+
+
+class JobManager:
+    """Runs submitted jobs with bounded concurrency on a background event loop.
+
+    Job functions receive the `Job` as first argument (to report progress) and
+    may be sync functions (run in a bounded thread pool) or coroutines.
+    """
+
+    def __init__(self, backend=None, max_workers: Optional[int] = None):
+        self.backend = backend or create_job_backend()
+        self.max_workers = max_workers or int(os.getenv("JOB_MAX_WORKERS", "4"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job-worker")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_workers)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="job-loop", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(
+        self,
+        kind: str,
+        func: Callable[..., Any],
+        *args,
+        metadata: Optional[dict] = None,
+        max_retries: int = 0,
+        retry_backoff: float = 2.0,
+        on_failure: Optional[Callable[[Job], Any]] = None,
+        **kwargs,
+    ) -> Job:
+        """Queue `func(job, *args, **kwargs)` and return the job right away.
+
+        A failed attempt is retried up to `max_retries` times, waiting
+        `retry_backoff * 2**(attempt - 1)` seconds between attempts.
+        `on_failure(job)` runs once after the last attempt failed.
+        """
+        job = Job(job_id=str(uuid.uuid4()), kind=kind, metadata=metadata or {}, max_retries=max_retries)
+        self.backend.save(job)
+        self.emit(job, "status", status=job.status.value)
+
+        loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._run(job, func, args, kwargs, retry_backoff, on_failure), loop)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        return self.backend.get(job_id)
+
+    def get_events(self, job_id: str, since: int = 0) -> List[dict]:
+        return self.backend.get_events(job_id, since)
+
+    def emit(self, job: Job, event: str, **data) -> None:
+        """Record an event for the job (status changes, progress, result)"""
+        self.backend.add_event(job.job_id, event, data)
+
+    def progress(self, job: Job, step: str, **data) -> None:
+        """Helper for job functions to report intermediate progress"""
+        self.emit(job, "progress", step=step, **data)
+
+    async def _run(
+        self,
+        job: Job,
+        func: Callable[..., Any],
+        args: tuple,
+        kwargs: dict,
+        retry_backoff: float = 2.0,
+        on_failure: Optional[Callable[[Job], Any]] = None,
+    ) -> None:
+        async with self._semaphore:
+            job.status = JobStatusEnum.RUNNING
+            job.started_at = datetime.now(timezone.utc)
+            self.backend.save(job)
+            self.emit(job, "status", status=job.status.value)
+
+            result, error = None, None
+            status = JobStatusEnum.FAILED
+            while job.attempts <= job.max_retries:
+                job.attempts += 1
+                try:
+                    result = await self._call(job, func, args, kwargs)
+                    status, error = JobStatusEnum.SUCCEEDED, None
+                    break
+                except Exception as e:
+                    # Stored on the job (and in its events) so any worker can report it
+                    error = f"{type(e).__name__}: {e}"
+                    job.error = error
+                    self.backend.save(job)
+                    if job.attempts > job.max_retries:
+                        break
+                    delay = retry_backoff * (2 ** (job.attempts - 1))
+                    self.emit(job, "retry", attempt=job.attempts, error=error, retry_in_seconds=delay)
+                    await asyncio.sleep(delay)
+
+            if status == JobStatusEnum.FAILED and on_failure is not None:
+                try:
+                    await self._call_hook(on_failure, job)
+                except Exception as e:
+                    self.emit(job, "failure_hook_error", error=f"{type(e).__name__}: {e}")
+
+            # Emit the final events before flipping the status, so streams never miss them
+            if status == JobStatusEnum.SUCCEEDED:
+                self.emit(job, "result", result=result)
+            else:
+                self.emit(job, "error", error=error)
+            self.emit(job, "status", status=status.value)
+
+            job.result = result
+            job.error = error
+            job.finished_at = datetime.now(timezone.utc)
+            job.status = status
+            self.backend.save(job)
+
+    async def _call(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        if inspect.iscoroutinefunction(func):
+            return await func(job, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(job, *args, **kwargs))
+
+    async def _call_hook(self, hook: Callable[[Job], Any], job: Job) -> Any:
+        if inspect.iscoroutinefunction(hook):
+            return await hook(job)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, hook, job)
+
+
+async def job_events_stream(job_manager: "JobManager", job_id: str, poll_interval: float = 0.5):
+    """Yield the job events as Server-Sent Events until the job finishes"""
+    cursor = 0
+    while True:
+        # The backend may be the database: read it off the event loop
+        events = await asyncio.to_thread(job_manager.get_events, job_id, cursor)
+        cursor += len(events)
+        for event in events:
+            yield f"data: {json.dumps(event, default=str)}\n\n"
+
+        job = await asyncio.to_thread(job_manager.get_job, job_id)
+        if job is None or (job.is_finished and not await asyncio.to_thread(job_manager.get_events, job_id, cursor)):
+            break
+        await asyncio.sleep(poll_interval)
+
+    yield "data: [DONE]\n\n"
+
+
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Return the process wide job manager (backend from JOB_BACKEND)"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+    return _job_manager
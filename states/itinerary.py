@@ -41,6 +41,36 @@ class ViajeState(BaseModel):
     transportes_entre_destinos: Optional[List[TransporteEntreDestinosState]] = Field(..., description="Transportes entre destinos del viaje completo (si el viaje tiene mas de un destino)")
     itinerario_diario: Optional[List[Dict[str, Any]]] = Field(None, description="JSON field containing itinerary daily details")
 
+class PatchOperationEnum(str, Enum):
+    ADD = "add"
+    REMOVE = "remove"
+    REPLACE = "replace"
+    MOVE = "move"
+    COPY = "copy"
+    TEST = "test"
+
+class ItineraryPatchOperationState(BaseModel):
+    op: PatchOperationEnum = Field(..., description="Operacion JSON Patch (RFC 6902)")
+    path: str = Field(..., description="JSON Pointer del campo a modificar. Ejemplo: '/destinos/1/dias_en_destino', '/transportes_entre_destinos/0/tipo_transporte', '/destinos/-'")
+    value: Optional[Any] = Field(None, description="Nuevo valor (para add, replace y test)")
+    from_path: Optional[str] = Field(None, description="JSON Pointer de origen (solo para move y copy)")
+
+    def to_json_patch(self) -> Dict[str, Any]:
+        operation = {"op": self.op.value, "path": self.path}
+        if self.op in (PatchOperationEnum.ADD, PatchOperationEnum.REPLACE, PatchOperationEnum.TEST):
+            operation["value"] = self.value
+        if self.op in (PatchOperationEnum.MOVE, PatchOperationEnum.COPY):
+            operation["from"] = self.from_path
+        return operation
+
 class ViajeStateModify(BaseModel):
     itinerario_actual: ViajeState
     prompt: str
+
+class DestinoRepairState(BaseModel):
+    indice: int = Field(..., description="Indice del destino a corregir (igual al indice recibido)")
+    pais_codigo: Optional[str] = Field(None, description="Codigo ISO 3166-1 alpha-2 del pais del destino")
+    coordenadas: Optional[str] = Field(None, description="Coordenadas del centro de la ciudad en formato 'latitud, longitud'")
+
+class DestinosRepairState(BaseModel):
+    destinos: List[DestinoRepairState] = Field(..., description="Campos corregidos de cada destino solicitado")
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateTable
+
+# database.py builds the engine URLs at import time; the unit tests never connect to them
+for name, value in {"DB_USER": "test", "DB_PASSWORD": "test", "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "test"}.items():
+    os.environ.setdefault(name, value)
+# The chat agents create their checkpointer at import time; keep their threads in memory
+os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_as_json(type_, compiler, **kw):
+    return "JSON"
+
+
+@pytest.fixture
+def db():
+    """SQLite session with the itinerary tables"""
+    from models.itinerary import Itinerary
+    from models.itinerary_version import ItineraryVersion
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)  # One in-memory database for every session
+    with engine.begin() as connection:
+        # Tables only: the Postgres indexes (GIN, partial) don't exist in SQLite
+        connection.execute(CreateTable(Itinerary.__table__))
+        connection.execute(CreateTable(ItineraryVersion.__table__))
+    with Session(engine) as session:
+        yield session
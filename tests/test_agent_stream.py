@@ -0,0 +1,67 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from utils.agent_stream import agent_event_stream
+
+
+class FakeAgent:
+    """Streams the given (mode, payload) items; `aget_state` returns `final_itinerary`"""
+
+    def __init__(self, items, final_itinerary):
+        self.items = items
+        self.final_itinerary = final_itinerary
+
+    async def astream(self, graph_input, config=None, stream_mode=None):
+        for item in self.items:
+            yield item
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"itinerary": self.final_itinerary})
+
+
+def run_turn(agent, itinerary):
+    saved = []
+
+    async def on_itinerary(new_itinerary):
+        saved.append(new_itinerary)
+
+    async def collect():
+        return [event async for event in agent_event_stream(agent, {}, {}, itinerary, on_itinerary=on_itinerary)]
+
+    events = asyncio.run(collect())
+    payloads = [json.loads(event[len("data: "):]) for event in events if event != "data: [DONE]\n\n"]
+    return payloads, saved
+
+
+def test_itinerary_update_delivered_as_a_list_is_streamed_and_saved():
+    before = {"nombre_viaje": "Italia", "cantidad_dias": 7}
+    after = {"nombre_viaje": "Italia y Suiza", "cantidad_dias": 7}
+    # ToolNode with parallel tool calls: one update per tool call
+    agent = FakeAgent([("updates", {"tools": [{"messages": []}, {"itinerary": after, "messages": []}]})], after)
+
+    payloads, saved = run_turn(agent, before)
+
+    assert [p["type"] for p in payloads] == ["itinerary_patch"]
+    assert saved == [after]
+
+
+def test_itinerary_missing_from_the_stream_is_taken_from_the_checkpoint():
+    before = {"nombre_viaje": "Italia", "cantidad_dias": 7}
+    after = {"nombre_viaje": "Italia", "cantidad_dias": 8}
+    agent = FakeAgent([("updates", {"agent": {"messages": []}})], after)
+
+    payloads, saved = run_turn(agent, before)
+
+    assert payloads == [{"type": "itinerary_patch", "patch": [{"op": "replace", "path": "/cantidad_dias", "value": 8}]}]
+    assert saved == [after]
+
+
+def test_turn_without_changes_does_not_save():
+    itinerary = {"nombre_viaje": "Italia", "cantidad_dias": 7}
+    agent = FakeAgent([("updates", {"agent": {"messages": []}})], dict(itinerary))
+
+    payloads, saved = run_turn(agent, itinerary)
+
+    assert payloads == []
+    assert saved == []
@@ -0,0 +1,34 @@
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+import utils.checkpointer as checkpointer
+
+
+def save_thread(saver, thread_id: str, checkpoint_id: str) -> None:
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    checkpoint = {"v": 1, "id": checkpoint_id, "ts": "2026-01-01T00:00:00+00:00", "channel_values": {}, "channel_versions": {}, "versions_seen": {}}
+    saver.put(config, checkpoint, {}, {})
+
+
+def test_listing_without_a_thread_only_returns_the_namespace():
+    store = MemorySaver()
+    chat = checkpointer._namespaced_saver(store, "itinerary_chat")
+    agent = checkpointer._namespaced_saver(store, "itinerary_agent")
+    save_thread(chat, "1", "a")
+    save_thread(chat, "2", "b")
+    save_thread(agent, "1", "c")
+
+    assert sorted(item.config["configurable"]["thread_id"] for item in chat.list(None)) == ["1", "2"]
+    assert [item.config["configurable"]["thread_id"] for item in agent.list(None)] == ["1"]
+    assert len(list(chat.list(None, limit=1))) == 1
+
+
+def test_unreachable_postgres_fails_unless_the_fallback_is_enabled(monkeypatch):
+    def unreachable():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(checkpointer, "_create_postgres_checkpointer", unreachable)
+
+    with pytest.raises(RuntimeError, match="CHECKPOINTER_ALLOW_MEMORY_FALLBACK"):
+        checkpointer.create_checkpointer("postgres", allow_memory_fallback=False)
+    assert isinstance(checkpointer.create_checkpointer("postgres", allow_memory_fallback=True), MemorySaver)
@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import pytest
+
+import tools.geocoding_tool as geocoding
+from utils.cache import SQLiteCache
+
+
+def feature(name: str) -> dict:
+    return {
+        "type": "Feature",
+        "id": name,
+        "geometry": {"type": "Point", "coordinates": [12.49, 41.89]},
+        "properties": {"name": name, "full_address": f"{name}, Roma", "context": {"country": {"name": "Italia", "short_code": "it"}}},
+    }
+
+
+@pytest.fixture(autouse=True)
+def token(monkeypatch):
+    monkeypatch.setenv("MAPBOX_ACCESS_TOKEN", "test")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SQLiteCache(str(tmp_path / "geocoding.sqlite3"), table="geocoding_cache")
+
+
+def geocode(attractions, transport, cache, concurrency=None):
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await geocoding.batch_geocode_attractions_async(attractions, country="IT", concurrency=concurrency, client=client, cache=cache)
+    return asyncio.run(run())
+
+
+def test_cached_and_repeated_attractions_are_requested_once(cache):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.params["q"])
+        return httpx.Response(200, json={"type": "FeatureCollection", "features": [feature(request.url.params["q"])]})
+
+    transport = httpx.MockTransport(handler)
+    first = geocode(["Coliseo", "coliseo ", "Panteón"], transport, cache)
+    second = geocode(["Coliseo", "Panteon"], transport, cache)
+
+    assert requests == ["Coliseo", "Panteón"]
+    assert first["coliseo "]["success"] and first["coliseo "]["attraction"] == "coliseo "
+    assert second["Panteon"]["latitude"] == 41.89
+    assert len(cache) == 2
+
+
+def test_rate_limits_and_server_errors_are_retried(cache):
+    statuses = iter([429, 503, 200])
+
+    def handler(request):
+        status = next(statuses)
+        return httpx.Response(status, json={"type": "FeatureCollection", "features": [feature("Coliseo")] if status == 200 else []})
+
+    results = geocode(["Coliseo"], httpx.MockTransport(handler), cache)
+
+    assert results["Coliseo"]["success"]
+    assert next(statuses, None) is None
+
+
+def test_errors_after_the_last_retry_are_not_cached(cache):
+    results = geocode(["Coliseo"], httpx.MockTransport(lambda request: httpx.Response(500)), cache)
+
+    assert not results["Coliseo"]["success"]
+    assert len(cache) == 0
+
+
+def test_requests_in_flight_stay_under_the_concurrency_limit(cache):
+    in_flight, peak = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"type": "FeatureCollection", "features": [feature(request.url.params["q"])]})
+
+    attractions = [f"Atraccion {i}" for i in range(10)]
+    results = geocode(attractions, httpx.MockTransport(handler), cache, concurrency=3)
+
+    assert all(result["success"] for result in results.values())
+    assert peak == 3
@@ -0,0 +1,84 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import graphs.activities_chat_agent as activities_chat_agent
+import utils.itinerary_compact as itinerary_compact
+from states.daily_activities import DailyItineraryOutput
+from utils.itinerary_compact import PromptTokenMetrics, build_itinerary_prompt, summarized_days
+
+
+def actividad(titulo: str) -> dict:
+    return {
+        "titulo": titulo, "descripcion": "Visita guiada " * 20, "horarios": "9-18", "precio": "20 EUR",
+        "requisitos_reserva": "-", "enlace": "-", "ubicacion": "Centro", "transporte_recomendado": "A pie",
+    }
+
+
+def dia(numero: int) -> dict:
+    return {
+        "dia": str(numero), "ciudad": "Roma", "pais": "Italia", "titulo": f"Dia {numero} - Roma",
+        "actividades_mañana": [actividad(f"Museo {numero}")],
+        "actividades_tarde": [actividad(f"Plaza {numero}")],
+        "actividades_noche": [actividad(f"Cena {numero}")],
+    }
+
+
+def itinerario() -> dict:
+    return {
+        "ruta_elegida": "-", "justificacion_ruta_elegida": "-", "nombre_viaje": "Roma", "cantidad_dias": 4,
+        "destino_general": "Italia", "resumen_viaje": "-",
+        "destinos": [{"ciudad": "Roma", "pais": "Italia", "pais_codigo": "IT", "coordenadas": "41.9028, 12.4964", "dias_en_destino": 4, "sugerencias_alojamiento": "Centro"}],
+        "transportes_entre_destinos": [],
+        "itinerario_diario": [dia(numero) for numero in range(1, 5)],
+    }
+
+
+@pytest.fixture(autouse=True)
+def presupuesto_chico(monkeypatch):
+    monkeypatch.setattr(itinerary_compact, "CHAT_ITINERARY_TOKEN_BUDGET", 300)
+
+
+def test_prompt_metrics_are_recorded_once_per_user_turn(monkeypatch):
+    metrics = PromptTokenMetrics()
+    monkeypatch.setattr(itinerary_compact, "prompt_token_metrics", metrics)
+    messages = [HumanMessage("Cambia la cena del dia 2")]
+
+    build_itinerary_prompt("activities_chat_agent", "Prompt", itinerario(), messages)
+    # Same turn: the model called a tool and is called again with its result
+    messages += [AIMessage("", tool_calls=[{"name": "web_search", "args": {"query": "cena"}, "id": "call_1"}]), ToolMessage("...", tool_call_id="call_1")]
+    build_itinerary_prompt("activities_chat_agent", "Prompt", itinerario(), messages)
+
+    assert metrics.snapshot()["activities_chat_agent"]["turns"] == 1
+
+
+def test_summarized_days_are_the_ones_not_mentioned():
+    assert summarized_days(itinerario(), [HumanMessage("Cambia la cena del dia 2")]) == {"1", "3", "4"}
+    assert summarized_days(itinerario(), [HumanMessage("Hola")], token_budget=100_000) == set()
+
+
+def modify_activities(dias: list, texto: str, monkeypatch):
+    interrupts = []
+    monkeypatch.setattr(activities_chat_agent, "interrupt", lambda value: interrupts.append(value) or {"messages": "si"})
+    command = activities_chat_agent.modify_activities(
+        tool_call_id="call_1",
+        dias_modificados=[DailyItineraryOutput(**dia(numero)) for numero in dias],
+        new_itinerary_modifications_summary="-",
+        itinerary=itinerario(),
+        messages=[HumanMessage(texto)],
+    )
+    return command, interrupts
+
+
+def test_modify_activities_rejects_a_day_the_model_only_saw_summarized(monkeypatch):
+    command, interrupts = modify_activities([2, 3], "Cambia la cena del dia 2", monkeypatch)
+
+    assert "itinerary" not in command.update
+    assert "3" in command.update["messages"][0].content
+    assert interrupts == []
+
+
+def test_modify_activities_accepts_the_days_shown_in_full(monkeypatch):
+    command, interrupts = modify_activities([2], "Cambia la cena del dia 2", monkeypatch)
+
+    assert "itinerary" in command.update
+    assert len(interrupts) == 1
@@ -0,0 +1,17 @@
+from services.itinerary_enrichment import geocoding_query
+
+DAY = {"ciudad": "Roma", "pais": "Italia"}
+
+
+def test_geocoding_query_uses_the_activity_location():
+    activity = {"titulo": "Paseo por el Trastevere al atardecer", "ubicacion": "Piazza di Santa Maria in Trastevere"}
+
+    assert geocoding_query(activity, DAY) == "Piazza di Santa Maria in Trastevere, Roma, Italia"
+
+
+def test_geocoding_query_does_not_repeat_the_city_of_the_location():
+    assert geocoding_query({"titulo": "Coliseo", "ubicacion": "Piazza del Colosseo, Roma"}, DAY) == "Piazza del Colosseo, Roma, Italia"
+
+
+def test_geocoding_query_falls_back_to_the_title():
+    assert geocoding_query({"titulo": "Coliseo", "ubicacion": ""}, DAY) == "Coliseo, Roma, Italia"
@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from models.itinerary import Itinerary
+from services.itinerary import ItineraryService
+
+SESSION_ID = uuid.uuid4()
+
+
+def itinerary(db, status: str, minutes_ago: int) -> Itinerary:
+    itinerary = Itinerary(
+        trip_name="Italia", status=status, visibility="private", session_id=SESSION_ID,
+        updated_at=datetime.now(timezone.utc) - timedelta(minutes=minutes_ago),
+    )
+    db.add(itinerary)
+    db.commit()
+    return itinerary
+
+
+def test_reset_stale_generations_releases_only_the_lost_jobs(db):
+    lost = itinerary(db, "generating", minutes_ago=60)
+    running = itinerary(db, "generating", minutes_ago=1)
+    confirmed = itinerary(db, "confirmed", minutes_ago=60)
+
+    assert ItineraryService(db).reset_stale_generations(stale_seconds=900) == 1
+
+    db.expire_all()
+    assert (lost.status, running.status, confirmed.status) == ("draft", "generating", "confirmed")
+
+
+def test_stats_count_the_itineraries_being_generated(db):
+    itinerary(db, "draft", minutes_ago=1)
+    itinerary(db, "generating", minutes_ago=1)
+    itinerary(db, "confirmed", minutes_ago=1)
+
+    stats = ItineraryService(db).get_itinerary_stats(session_id=SESSION_ID)
+
+    assert (stats["total_itineraries"], stats["draft_itineraries"], stats["generating_itineraries"], stats["confirmed_itineraries"]) == (3, 1, 1, 1)
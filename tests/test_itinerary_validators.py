@@ -0,0 +1,120 @@
+import pytest
+
+import utils.itinerary_validators as validators
+from states.itinerary import DestinoState, TransporteEntreDestinosState, ViajeState
+from utils.itinerary_validators import (
+    auto_fix_transportes_secuenciales,
+    fix_destinos_duplicados,
+    fix_suma_dias,
+    validate_and_fix_itinerary,
+    validate_transportes_secuenciales,
+)
+
+COORDENADAS = {
+    "Roma": "41.9028, 12.4964",
+    "Florencia": "43.7696, 11.2558",
+    "Venecia": "45.4408, 12.3155",
+}
+
+
+@pytest.fixture(autouse=True)
+def sin_reparacion_llm(monkeypatch):
+    monkeypatch.setattr(validators, "ITINERARY_LLM_REPAIR_ENABLED", False)
+
+
+def destino(ciudad: str, dias: int) -> DestinoState:
+    return DestinoState(
+        ciudad=ciudad,
+        pais="Italia",
+        pais_codigo="IT",
+        coordenadas=COORDENADAS.get(ciudad, "41.9028, 12.4964"),
+        dias_en_destino=dias,
+        sugerencias_alojamiento="Centro",
+    )
+
+
+def transporte(origen: str, destino: str) -> TransporteEntreDestinosState:
+    return TransporteEntreDestinosState(
+        ciudad_origen=origen, ciudad_destino=destino, tipo_transporte="Tren", justificacion="Rapido", alternativas=["Auto"],
+    )
+
+
+def viaje(destinos, transportes, cantidad_dias: int) -> ViajeState:
+    return ViajeState(
+        ruta_elegida="Italia clasica",
+        justificacion_ruta_elegida="-",
+        nombre_viaje="Italia",
+        cantidad_dias=cantidad_dias,
+        destino_general="Italia",
+        resumen_viaje="-",
+        destinos=destinos,
+        transportes_entre_destinos=transportes,
+    )
+
+
+def roma_duplicada() -> ViajeState:
+    return viaje(
+        [destino("Roma", 3), destino("Roma", 2), destino("Florencia", 2), destino("Venecia", 2)],
+        [transporte("Roma", "Roma"), transporte("Roma", "Florencia"), transporte("Florencia", "Venecia")],
+        cantidad_dias=9,
+    )
+
+
+def test_fix_destinos_duplicados_une_dias_y_quita_el_transporte_entre_ellos():
+    corregido, cambios = fix_destinos_duplicados(roma_duplicada())
+
+    assert [(d.ciudad, d.dias_en_destino) for d in corregido.destinos] == [("Roma", 5), ("Florencia", 2), ("Venecia", 2)]
+    assert [(t.ciudad_origen, t.ciudad_destino) for t in corregido.transportes_entre_destinos] == [("Roma", "Florencia"), ("Florencia", "Venecia")]
+    assert len(cambios) == 2
+
+
+def test_fix_destinos_duplicados_mantiene_ciudad_repetida_no_consecutiva():
+    ida_y_vuelta = viaje(
+        [destino("Roma", 2), destino("Florencia", 2), destino("Roma", 1)],
+        [transporte("Roma", "Florencia"), transporte("Florencia", "Roma")],
+        cantidad_dias=5,
+    )
+    corregido, cambios = fix_destinos_duplicados(ida_y_vuelta)
+
+    assert [d.ciudad for d in corregido.destinos] == ["Roma", "Florencia", "Roma"]
+    assert len(corregido.transportes_entre_destinos) == 2
+    assert cambios == []
+
+
+def test_validate_and_fix_itinerary_corrige_destinos_duplicados_consecutivos():
+    corregido = validate_and_fix_itinerary(roma_duplicada(), cantidad_dias_esperada=9)
+
+    assert [d.ciudad for d in corregido.destinos] == ["Roma", "Florencia", "Venecia"]
+    assert validate_transportes_secuenciales(corregido)[0]
+
+
+def test_auto_fix_cuenta_transportes_sobrantes_como_cambio():
+    sobrantes = viaje(
+        [destino("Roma", 2), destino("Florencia", 2)],
+        [transporte("Roma", "Florencia"), transporte("Florencia", "Venecia")],
+        cantidad_dias=4,
+    )
+    corregido, hubo_cambios = auto_fix_transportes_secuenciales(sobrantes)
+
+    assert hubo_cambios
+    assert [(t.ciudad_origen, t.ciudad_destino) for t in corregido.transportes_entre_destinos] == [("Roma", "Florencia")]
+
+
+def test_auto_fix_crea_transporte_faltante():
+    faltante = viaje([destino("Roma", 2), destino("Florencia", 2), destino("Venecia", 1)], [transporte("Roma", "Florencia")], cantidad_dias=5)
+    corregido, hubo_cambios = auto_fix_transportes_secuenciales(faltante)
+
+    assert hubo_cambios
+    assert validate_transportes_secuenciales(corregido)[0]
+
+
+def test_fix_suma_dias_reparte_la_diferencia_en_las_estadias_mas_largas():
+    corregido, _ = fix_suma_dias(viaje([destino("Roma", 4), destino("Florencia", 2)], [transporte("Roma", "Florencia")], cantidad_dias=6), 8)
+
+    assert corregido.cantidad_dias == 8
+    assert [d.dias_en_destino for d in corregido.destinos] == [6, 2]
+
+
+def test_fix_suma_dias_falla_con_mas_destinos_que_dias():
+    with pytest.raises(ValueError):
+        fix_suma_dias(viaje([destino("Roma", 1), destino("Florencia", 1), destino("Venecia", 1)], [], cantidad_dias=3), 2)
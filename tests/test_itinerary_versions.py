@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from models.itinerary import Itinerary
+from services.itinerary_versions import get_version_content, record_version, undo_version
+
+
+def day(number: int, enriched: bool = False) -> dict:
+    activity = {"titulo": f"Actividad {number}"}
+    if enriched:
+        activity["latitud"] = 41.9
+    return {"dia": number, "actividades": [activity]}
+
+
+def details(destinos: list, days: int = 0, enriched_days: int = 0, **extra) -> dict:
+    content = {"nombre_viaje": "Italia", "cantidad_dias": 3, "destinos": destinos, **extra}
+    if days:
+        content["itinerario_diario"] = [day(n, enriched=n <= enriched_days) for n in range(1, days + 1)]
+    return content
+
+
+def change(db, itinerary, content, source):
+    version = record_version(db, itinerary, content, source)
+    db.commit()
+    return version
+
+
+@pytest.fixture
+def confirmed(db):
+    """generation -> agent edit -> daily -> enrichment of each day"""
+    itinerary = Itinerary(trip_name="Italia", status="draft", visibility="private")
+    db.add(itinerary)
+    change(db, itinerary, details(["Roma"]), "generation")
+    change(db, itinerary, details(["Roma", "Florencia"]), "agent")
+    change(db, itinerary, details(["Roma", "Florencia"], days=3), "daily")
+    itinerary.status = "confirmed"
+    for enriched in range(1, 4):
+        change(db, itinerary, details(["Roma", "Florencia"], days=3, enriched_days=enriched), "enrichment")
+    return itinerary
+
+
+def test_undo_after_confirmation_does_not_cross_the_daily_plan(db, confirmed):
+    before = confirmed.current_version
+
+    assert undo_version(db, confirmed) is None
+    assert confirmed.current_version == before
+    assert len(confirmed.details_itinerary["itinerario_diario"]) == 3
+
+
+def test_undo_of_agent_edit_keeps_enrichment_and_stops_at_the_daily_plan(db, confirmed):
+    enriched = details(["Roma", "Florencia"], days=3, enriched_days=3)
+    change(db, confirmed, {**enriched, "nombre_viaje": "Italia 1"}, "agent")
+    change(db, confirmed, {**enriched, "nombre_viaje": "Italia 2"}, "agent")
+
+    first = undo_version(db, confirmed)
+    db.commit()
+    assert confirmed.details_itinerary == {**enriched, "nombre_viaje": "Italia 1"}
+
+    second = undo_version(db, confirmed)
+    db.commit()
+    # Back to the fully enriched daily plan, not to a partially enriched version
+    assert confirmed.details_itinerary == enriched
+    assert second.parent_version is None
+
+    assert first.source == second.source == "undo"
+    assert undo_version(db, confirmed) is None
+
+
+def test_undo_before_the_daily_plan_walks_back_user_edits(db):
+    itinerary = Itinerary(trip_name="Italia", status="draft", visibility="private")
+    db.add(itinerary)
+    change(db, itinerary, details(["Roma"]), "generation")
+    change(db, itinerary, details(["Roma", "Florencia"]), "agent")
+    change(db, itinerary, details(["Roma", "Florencia", "Venecia"]), "agent")
+
+    undo_version(db, itinerary)
+    db.commit()
+    assert itinerary.details_itinerary["destinos"] == ["Roma", "Florencia"]
+
+    undo_version(db, itinerary)
+    db.commit()
+    assert itinerary.details_itinerary["destinos"] == ["Roma"]
+
+    assert undo_version(db, itinerary) is None
+    assert get_version_content(db, itinerary.itinerary_id, itinerary.current_version) == itinerary.details_itinerary
+
+
+def test_agent_save_numbers_the_version_after_changes_made_while_the_agent_ran(db):
+    from schemas.itinerary import ItineraryUpdate
+    from services.itinerary import ItineraryService
+
+    itinerary = Itinerary(trip_name="Italia", status="draft", visibility="private")
+    db.add(itinerary)
+    change(db, itinerary, details(["Roma"]), "generation")
+    loaded_before_the_agent = itinerary
+
+    # Another request records a version while the agent runs
+    with Session(db.get_bind()) as other:
+        change(other, other.get(Itinerary, itinerary.itinerary_id), details(["Roma", "Florencia"]), "agent")
+
+    ItineraryService(db).update_itinerary(
+        itinerary.itinerary_id,
+        ItineraryUpdate(details_itinerary=details(["Roma", "Venecia"])),
+        version_source="agent",
+        db_itinerary=loaded_before_the_agent,
+    )
+
+    assert itinerary.current_version == 3
+    assert get_version_content(db, itinerary.itinerary_id, 2)["destinos"] == ["Roma", "Florencia"]
+    assert get_version_content(db, itinerary.itinerary_id, 3)["destinos"] == ["Roma", "Venecia"]
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from services.jobs import Job, JobManager, JobStatusEnum, PostgresJobBackend
+
+
+@pytest.fixture
+def session_factory():
+    """SQLite sessions over the jobs tables, shared like the Postgres database"""
+    from models.job import JobEventRecord, JobRecord
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    JobRecord.__table__.create(engine)
+    JobEventRecord.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+def wait_until_finished(backend, job_id: str) -> Job:
+    for _ in range(200):
+        job = backend.get(job_id)
+        if job.is_finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("the job did not finish")
+
+
+def test_job_submitted_by_one_worker_is_visible_to_another(session_factory):
+    manager = JobManager(backend=PostgresJobBackend(session_factory), max_workers=1)
+    other_worker = PostgresJobBackend(session_factory)
+
+    def job_func(job, destino):
+        manager.progress(job, "ciudades", total=2)
+        return {"destino": destino}
+
+    job = manager.submit("itinerary", job_func, "Italia", metadata={"itinerary_id": 7})
+    finished = wait_until_finished(other_worker, job.job_id)
+
+    assert finished.status == JobStatusEnum.SUCCEEDED
+    assert finished.result == {"destino": "Italia"}
+    assert finished.metadata == {"itinerary_id": 7}
+    events = other_worker.get_events(job.job_id)
+    assert [e["event"] for e in events][:3] == ["status", "status", "progress"]
+    assert events[2]["data"] == {"step": "ciudades", "total": 2}
+    assert other_worker.get_events(job.job_id, since=len(events)) == []
+
+
+def test_failed_job_keeps_its_error_on_the_shared_record(session_factory):
+    backend = PostgresJobBackend(session_factory)
+    manager = JobManager(backend=backend, max_workers=1)
+
+    def job_func(job):
+        raise RuntimeError("Gemini no respondio")
+
+    job = manager.submit("itinerary", job_func, max_retries=1, retry_backoff=0)
+    failed = wait_until_finished(PostgresJobBackend(session_factory), job.job_id)
+
+    assert failed.status == JobStatusEnum.FAILED
+    assert failed.attempts == 2
+    assert "Gemini no respondio" in failed.error
+    retries = [e for e in backend.get_events(job.job_id) if e["event"] == "retry"]
+    assert retries[0]["data"]["error"] == failed.error
+
+
+def test_finished_jobs_past_the_retention_are_pruned_on_submit(session_factory):
+    backend = PostgresJobBackend(session_factory, retention_hours=1)
+    old = Job(job_id="old", kind="itinerary", status=JobStatusEnum.SUCCEEDED, finished_at=datetime.now(timezone.utc) - timedelta(hours=2))
+    backend.save(old)
+    backend.add_event(old.job_id, "status", {"status": "succeeded"})
+
+    backend.save(Job(job_id="new", kind="itinerary"))
+
+    assert backend.get("old") is None
+    assert backend.get_events("old") == []
+    assert backend.get("new") is not None
@@ -0,0 +1,31 @@
+import pytest
+
+import utils.llm as llm
+
+
+@pytest.fixture(autouse=True)
+def fresh_models(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setattr(llm, "_http_clients", {})
+    llm.reset_llms()
+    yield
+    llm.reset_llms()
+
+
+def test_gemini_profiles_share_one_client():
+    main, cheap = llm.get_llm("main"), llm.get_llm("cheap")
+
+    assert main.client is cheap.client
+
+
+def test_anthropic_profiles_share_one_connection_pool(monkeypatch):
+    monkeypatch.setenv("LLM_MAIN_PROVIDER", "anthropic")
+    monkeypatch.setenv("LLM_MAIN_MODEL", "claude-sonnet-4-5")
+    monkeypatch.setenv("LLM_CHEAP_PROVIDER", "anthropic")
+    monkeypatch.setenv("LLM_CHEAP_MODEL", "claude-haiku-4-5")
+    main, cheap = llm.get_llm("main"), llm.get_llm("cheap")
+
+    assert main._client._client is cheap._client._client
+    assert main._async_client._client is cheap._async_client._client
+    assert main._client._client is llm._http_clients["anthropic"]
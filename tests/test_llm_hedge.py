@@ -0,0 +1,156 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import utils.llm_hedge as llm_hedge
+from utils.llm import override_llm
+from utils.llm_hedge import LLMDeadlineExceeded, ahedged_invoke, get_breaker, hedged_invoke
+
+
+class FakeModel:
+    """Answers `answer` after `delay` seconds, or raises `error`"""
+
+    def __init__(self, answer: str = "ok", delay: float = 0.0, error: Exception = None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    def invoke(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.answer
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.answer
+
+
+def invoke(model):
+    return model.invoke("hola")
+
+
+def ainvoke(model):
+    return model.ainvoke("hola")
+
+
+@pytest.fixture(autouse=True)
+def hedge(monkeypatch):
+    monkeypatch.setattr(llm_hedge, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_hedge, "LLM_HEDGE_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(llm_hedge, "LLM_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(llm_hedge, "LLM_BREAKER_RESET_SECONDS", 0.2)
+    monkeypatch.setattr(llm_hedge, "hedge_metrics", llm_hedge.HedgeMetrics())
+    monkeypatch.setenv("LLM_MAIN_FALLBACK", "openai_mini")
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(llm_hedge, "_executor", executor)
+    llm_hedge.reset_breakers()
+    yield
+    executor.shutdown(wait=True)  # a losing call must not finish during the next test
+    llm_hedge.reset_breakers()
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    primary, fallback = FakeModel("lento", delay=0.5), FakeModel("rapido")
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        result, model = hedged_invoke("main", invoke, deadline_seconds=2)
+
+    assert (result, model) == ("rapido", fallback)
+    assert llm_hedge.hedge_metrics.snapshot()["fallback_wins"] == 1
+
+
+def test_primary_error_fires_the_fallback_and_counts_a_failure():
+    primary, fallback = FakeModel(error=RuntimeError("503")), FakeModel("rapido")
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        result, _ = hedged_invoke("main", invoke, deadline_seconds=2)
+
+    assert result == "rapido"
+    assert get_breaker("google_genai").failures == 1
+    assert get_breaker("openai").failures == 0
+
+
+def test_every_candidate_failing_raises_the_last_error():
+    with override_llm("main", FakeModel(error=RuntimeError("503"))), override_llm("openai_mini", FakeModel(error=ValueError("400"))):
+        with pytest.raises(ValueError):
+            hedged_invoke("main", invoke, deadline_seconds=2)
+
+
+def test_deadline_counts_one_miss_and_ignores_the_late_answer():
+    primary, fallback = FakeModel(delay=0.3), FakeModel(delay=0.3)
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        with pytest.raises(LLMDeadlineExceeded):
+            hedged_invoke("main", invoke, deadline_seconds=0.1)
+        time.sleep(0.4)  # both calls finish after the deadline
+
+    assert get_breaker("google_genai").failures == 1
+    assert get_breaker("openai").failures == 1
+    assert llm_hedge.hedge_metrics.snapshot()["deadline_exceeded"] == 1
+
+
+def test_deadline_cancels_a_hedge_that_never_started(monkeypatch):
+    monkeypatch.setattr(llm_hedge, "_executor", ThreadPoolExecutor(max_workers=1))  # the hedge waits behind the primary
+    primary, fallback = FakeModel(delay=0.3), FakeModel()
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        with pytest.raises(LLMDeadlineExceeded):
+            hedged_invoke("main", invoke, deadline_seconds=0.1)
+        time.sleep(0.3)
+
+    assert fallback.calls == 0
+    assert get_breaker("openai").failures == 0
+    assert get_breaker("google_genai").failures == 1
+
+
+def test_open_breaker_skips_the_provider_until_the_half_open_trial():
+    failing, fallback = FakeModel(error=RuntimeError("503")), FakeModel("rapido")
+    with override_llm("main", failing), override_llm("openai_mini", fallback):
+        for _ in range(2):
+            hedged_invoke("main", invoke, deadline_seconds=2)
+        assert get_breaker("google_genai").state == "open"
+
+        result, _ = hedged_invoke("main", invoke, deadline_seconds=2)
+        assert result == "rapido"
+        assert failing.calls == 2
+        assert llm_hedge.hedge_metrics.snapshot()["breaker_skips"] == 1
+
+    time.sleep(0.2)
+    assert get_breaker("google_genai").state == "half_open"
+    recovered = FakeModel("primario")
+    with override_llm("main", recovered), override_llm("openai_mini", fallback):
+        result, _ = hedged_invoke("main", invoke, deadline_seconds=2)
+
+    assert result == "primario"
+    assert get_breaker("google_genai").state == "closed"
+
+
+def test_async_hedge_wins_and_cancels_the_slow_primary():
+    primary, fallback = FakeModel("lento", delay=5), FakeModel("rapido")
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        result, model = asyncio.run(ahedged_invoke("main", ainvoke, deadline_seconds=2))
+
+    assert (result, model) == ("rapido", fallback)
+    assert primary.cancelled
+    # Cancelled without an outcome: the primary provider is not blamed
+    assert get_breaker("google_genai").failures == 0
+
+
+def test_async_deadline_cancels_the_running_calls_and_counts_one_miss_each():
+    primary, fallback = FakeModel(delay=5), FakeModel(delay=5)
+    with override_llm("main", primary), override_llm("openai_mini", fallback):
+        with pytest.raises(LLMDeadlineExceeded):
+            asyncio.run(ahedged_invoke("main", ainvoke, deadline_seconds=0.1))
+
+    assert primary.cancelled and fallback.cancelled
+    assert get_breaker("google_genai").failures == 1
+    assert get_breaker("openai").failures == 1
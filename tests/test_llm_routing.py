@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+import graphs.daily_itinerary_graph as daily_itinerary_graph
+import graphs.itinerary_graph as itinerary_graph
+import utils.itinerary_validators as validators
+import utils.llm as llm
+import utils.llm_hedge as llm_hedge
+import utils.llm_router as llm_router
+from utils.llm_hedge import LLMDeadlineExceeded
+from schemas.itinerary import ItineraryGenerate, ItineraryPreferences
+from states.itinerary import ViajeState
+
+
+def viaje(dias: list) -> ViajeState:
+    destinos = [
+        {"ciudad": ciudad, "pais": "Italia", "pais_codigo": "IT", "coordenadas": "41.9028, 12.4964", "dias_en_destino": n, "sugerencias_alojamiento": "Centro"}
+        for ciudad, n in zip(["Roma", "Florencia", "Venecia"], dias)
+    ]
+    return ViajeState(
+        ruta_elegida="-", justificacion_ruta_elegida="-", nombre_viaje="Italia", cantidad_dias=sum(dias),
+        destino_general="Italia", resumen_viaje="-", destinos=destinos, transportes_entre_destinos=[],
+    )
+
+
+@pytest.fixture(autouse=True)
+def sin_cache_ni_reparacion(monkeypatch):
+    monkeypatch.setattr(itinerary_graph, "get_itinerary_cache", lambda: None)
+    monkeypatch.setattr(validators, "ITINERARY_LLM_REPAIR_ENABLED", False)
+
+
+def respuestas_por_tier(monkeypatch, **parsed_por_tier):
+    """The real invoke_structured, with each tier answering `parsed` (None: the output could not be parsed)"""
+    def hedged_invoke(tier, call):
+        return {"parsed": parsed_por_tier[tier], "raw": None, "parsing_error": "JSON invalido"}, object()
+
+    monkeypatch.setattr(llm_router, "hedged_invoke", hedged_invoke)
+
+
+def generar(duration_days: int) -> ViajeState:
+    return itinerary_graph.generate_main_itinerary(ItineraryGenerate(trip_name="Italia", duration_days=duration_days))
+
+
+def test_cheap_output_is_not_returned_when_the_escalation_fails(monkeypatch):
+    # cheap: 3 destinos for a 2 day trip (fails validation); main: unparseable
+    respuestas_por_tier(monkeypatch, cheap=viaje([1, 1, 1]), main=None)
+
+    with pytest.raises(ValueError):
+        generar(2)
+
+
+def test_main_draft_is_returned_when_the_cheap_tier_could_not_be_parsed(monkeypatch):
+    # cheap: unparseable (never validated); main: 3 destinos for a 2 day trip (fails validation)
+    principal = viaje([1, 1, 1])
+    respuestas_por_tier(monkeypatch, cheap=None, main=principal)
+
+    assert generar(2) is principal
+
+
+def test_daily_generation_routes_on_the_preferences_only(monkeypatch):
+    tiers = []
+
+    async def ainvoke_structured(route, schema, prompt, validate, tier):
+        tiers.append(tier)
+        raise ValueError("stop")
+
+    monkeypatch.setattr(daily_itinerary_graph, "ainvoke_structured", ainvoke_structured)
+    monkeypatch.setattr(daily_itinerary_graph, "get_city_itinerary_prompt", lambda state, profile="main": "prompt")
+    preferences = ItineraryPreferences(trip_type="pareja", budget="confort", travel_pace="activo", goal="descansar").model_dump()
+    itinerary_metadata = {
+        **preferences,
+        "traveler_profile_name": "Explorador",
+        "traveler_profile_prompt_desc": "Le gusta caminar",
+        "traveler_profile_description": "Le gusta caminar",
+    }
+
+    with pytest.raises(ValueError):
+        asyncio.run(daily_itinerary_graph.generate_city_itinerary({
+            "city": "Roma", "days": 3, "city_index": 0, "first_day": 1,
+            "cities": [{"city": "Roma", "days": 3}], "itinerary_metadata": itinerary_metadata,
+        }))
+
+    assert tiers == [itinerary_graph.choose_tier(3, preferences)] == ["cheap"]
+
+
+@pytest.fixture
+def metricas(monkeypatch):
+    metrics = llm_router.RouteMetrics()
+    monkeypatch.setattr(llm_router, "route_metrics", metrics)
+    return metrics
+
+
+class ErrorDelProveedor(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [(LLMDeadlineExceeded("cheap"), "deadline"), (ErrorDelProveedor("503"), "provider")])
+def test_cheap_tier_errors_escalate_and_are_recorded(monkeypatch, metricas, error, kind):
+    principal = viaje([2])
+
+    def hedged_invoke(tier, call):
+        if tier == "cheap":
+            raise error
+        return {"parsed": principal, "raw": None}, object()
+
+    monkeypatch.setattr(llm_router, "hedged_invoke", hedged_invoke)
+
+    assert llm_router.invoke_structured("ruta", ViajeState, "prompt", tier="cheap") is principal
+    tiers = metricas.snapshot()["ruta"]["tiers"]
+    assert tiers["cheap"]["failures"] == 1 and tiers["cheap"]["errors"] == {kind: 1}
+    assert tiers["main"]["failures"] == 0
+    assert metricas.snapshot()["ruta"]["escalations"] == 1
+
+
+def test_async_cheap_deadline_escalates_to_main(monkeypatch, metricas):
+    principal = viaje([2])
+
+    async def ahedged_invoke(tier, call):
+        if tier == "cheap":
+            raise LLMDeadlineExceeded("cheap")
+        return {"parsed": principal, "raw": None}, object()
+
+    monkeypatch.setattr(llm_router, "ahedged_invoke", ahedged_invoke)
+
+    assert asyncio.run(llm_router.ainvoke_structured("ruta", ViajeState, "prompt", tier="cheap")) is principal
+    assert metricas.snapshot()["ruta"]["tiers"]["cheap"]["errors"] == {"deadline": 1}
+
+
+def test_main_tier_errors_are_raised_after_being_recorded(monkeypatch, metricas):
+    def hedged_invoke(tier, call):
+        raise ErrorDelProveedor("503")
+
+    monkeypatch.setattr(llm_router, "hedged_invoke", hedged_invoke)
+
+    with pytest.raises(ErrorDelProveedor):
+        llm_router.invoke_structured("ruta", ViajeState, "prompt", tier="cheap")
+    tiers = metricas.snapshot()["ruta"]["tiers"]
+    assert tiers["cheap"]["errors"] == tiers["main"]["errors"] == {"provider": 1}
+
+
+class ModeloQueCaptura:
+    """Structured output model that records its prompts (and fails with `error`)"""
+
+    def __init__(self, parsed=None, error: Exception = None):
+        self.parsed, self.error, self.prompts = parsed, error, []
+
+    def with_structured_output(self, schema, include_raw=False):
+        return self
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        return {"parsed": self.parsed, "raw": None}
+
+
+def test_system_message_is_built_for_the_provider_that_serves_the_call(monkeypatch):
+    monkeypatch.setenv("LLM_MAIN_PROVIDER", "anthropic")
+    principal = ModeloQueCaptura(error=ErrorDelProveedor("overloaded"))
+    respaldo = ModeloQueCaptura(parsed=viaje([2]))
+    prompt = lambda profile: [llm.cacheable_system_message("instrucciones", profile)]
+
+    try:
+        with llm.override_llm("main", principal), llm.override_llm("openai_mini", respaldo):
+            llm_router.invoke_structured("ruta", ViajeState, prompt, tier="main")
+    finally:
+        llm_hedge.reset_breakers()
+
+    # Anthropic gets its cache breakpoint, the OpenAI fallback a plain system message
+    assert principal.prompts[0][0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert respaldo.prompts[0][0].content == "instrucciones"
@@ -0,0 +1,73 @@
+import pytest
+
+import graphs.itinerary_chat_agent as chat_agent
+import utils.itinerary_validators as validators
+from states.itinerary import ItineraryPatchOperationState
+
+
+def itinerary() -> dict:
+    destino = {"pais": "Italia", "pais_codigo": "IT", "sugerencias_alojamiento": "Centro"}
+    return {
+        "ruta_elegida": "Italia clasica",
+        "justificacion_ruta_elegida": "-",
+        "nombre_viaje": "Italia",
+        "cantidad_dias": 7,
+        "destino_general": "Italia",
+        "resumen_viaje": "-",
+        "destinos": [
+            {**destino, "ciudad": "Roma", "coordenadas": "41.9028, 12.4964", "dias_en_destino": 3},
+            {**destino, "ciudad": "Florencia", "coordenadas": "43.7696, 11.2558", "dias_en_destino": 4},
+        ],
+        "transportes_entre_destinos": [
+            {"ciudad_origen": "Roma", "ciudad_destino": "Florencia", "tipo_transporte": "Tren", "justificacion": "-", "alternativas": []},
+        ],
+    }
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Order of the interrupt() and LLM repair calls; the user always confirms"""
+    calls = []
+
+    def fake_interrupt(value):
+        calls.append("interrupt")
+        return {"messages": "si"}
+
+    def fake_repair(viaje_state, pendientes):
+        calls.append("repair")
+        return []
+
+    monkeypatch.setattr(chat_agent, "interrupt", fake_interrupt)
+    monkeypatch.setattr(validators, "repair_campos_con_llm", fake_repair)
+    return calls
+
+
+def patch(operations: list):
+    return chat_agent.patch_itinerary(
+        tool_call_id="call_1",
+        operations=[ItineraryPatchOperationState(**operation) for operation in operations],
+        modifications_summary="-",
+        itinerary=itinerary(),
+    )
+
+
+def test_changed_stay_updates_the_trip_length_instead_of_rebalancing(calls):
+    command = patch([{"op": "replace", "path": "/destinos/1/dias_en_destino", "value": 5}])
+
+    new_itinerary = command.update["itinerary"]
+    assert [d.dias_en_destino for d in new_itinerary.destinos] == [3, 5]
+    assert new_itinerary.cantidad_dias == 8
+
+
+def test_trip_length_that_does_not_match_the_stays_goes_back_to_the_model(calls):
+    command = patch([{"op": "replace", "path": "/cantidad_dias", "value": 10}])
+
+    assert "itinerary" not in command.update
+    assert "cantidad_dias" in command.update["messages"][0].content
+    assert calls == []
+
+
+def test_llm_repair_runs_only_after_the_confirmation(calls):
+    patch([{"op": "replace", "path": "/destinos/0/dias_en_destino", "value": 2}, {"op": "replace", "path": "/cantidad_dias", "value": 6}])
+
+    assert calls == ["interrupt", "repair"]
@@ -0,0 +1,129 @@
+import pytest
+
+import tools.wikipedia_tool as wikipedia
+from utils.cache import SQLiteCache
+
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """Answers every API request with `handler(params)` and records the params"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(params)
+        return FakeResponse(self.handler(params))
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(handler):
+        fake = FakeSession(handler)
+        monkeypatch.setattr(wikipedia, "_get_session", lambda: fake)
+        return fake
+    return install
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "wikipedia.sqlite3"), table="wikipedia_cache")
+    monkeypatch.setattr(wikipedia, "get_wikipedia_cache", lambda: cache)
+    return cache
+
+
+def article(pageid: int, title: str, revid: int = 100) -> dict:
+    return {"pageid": pageid, "title": title, "lastrevid": revid}
+
+
+def test_list_props_are_merged_across_continuations(session):
+    responses = iter([
+        {"query": {"pages": [{"pageid": 1, "title": "Coliseo", "images": [{"title": "File:A.jpg"}]}]}, "continue": {"imcontinue": "1|B.jpg", "continue": "||"}},
+        {"query": {"pages": [{"pageid": 1, "title": "Coliseo", "images": [{"title": "File:B.jpg"}]}]}},
+    ])
+    fake = session(lambda params: next(responses))
+
+    data = wikipedia._api_query("es", {"pageids": "1", "prop": "images"})
+
+    assert data["pages"][1]["images"] == [{"title": "File:A.jpg"}, {"title": "File:B.jpg"}]
+    assert fake.requests[1]["imcontinue"] == "1|B.jpg"
+
+
+def test_titles_are_requested_in_chunks_of_50(session):
+    fake = session(lambda params: {"query": {"pages": [article(i + 1, title) for i, title in enumerate(params["titles"].split("|"))]}})
+    queries = [f"Lugar {i}" for i in range(120)]
+
+    resolved = wikipedia._resolve_titles(queries, "es")
+
+    assert [len(params["titles"].split("|")) for params in fake.requests] == [50, 50, 20]
+    assert len(resolved) == 120
+
+
+def test_normalized_and_redirected_titles_resolve_to_the_article(session):
+    session(lambda params: {"query": {
+        "normalized": [{"from": "torre eiffel", "to": "Torre eiffel"}],
+        "redirects": [{"from": "Torre eiffel", "to": "Torre Eiffel"}],
+        "pages": [article(7, "Torre Eiffel", revid=555)],
+    }})
+
+    resolved = wikipedia._resolve_titles(["torre eiffel"], "es")
+
+    assert resolved == {"torre eiffel": {"pageid": 7, "title": "Torre Eiffel", "revid": 555}}
+
+
+def test_disambiguation_pages_are_not_matched_by_title(session):
+    session(lambda params: {"query": {"pages": [
+        {**article(3, "Mercurio"), "pageprops": {"disambiguation": ""}},
+        article(4, "Coliseo"),
+    ]}})
+
+    resolved = wikipedia._resolve_titles(["Mercurio", "Coliseo"], "es")
+
+    assert list(resolved) == ["Coliseo"]
+
+
+def wiki(revid: int = 100):
+    """API for one article found by search, with its data and no images"""
+    def handler(params):
+        if params.get("generator") == "search":
+            return {"query": {"pages": [article(9, "Coliseo", revid)]}}
+        if "pageids" in params:
+            return {"query": {"pages": [{**article(9, "Coliseo", revid), "extract": "Anfiteatro", "fullurl": "https://es.wikipedia.org/wiki/Coliseo"}]}}
+        return {"query": {"pages": []}}
+    return handler
+
+
+def test_page_data_is_cached_by_page_and_revision(session, cache):
+    session(wiki(revid=100))
+    first = wikipedia.fetch_wikipedia_pages(["el coliseo romano"], language="es")
+
+    assert first["el coliseo romano"]["summary"] == "Anfiteatro"
+    assert cache.get("page:es:9:100:3")["summary"] == "Anfiteatro"
+
+    fake = session(wiki(revid=100))
+    wikipedia.fetch_wikipedia_pages(["el coliseo romano"], language="es")
+
+    assert not any("pageids" in params for params in fake.requests)
+
+
+def test_cached_search_hits_reuse_their_revision(session, cache):
+    session(wiki())
+    wikipedia.fetch_wikipedia_pages(["el coliseo romano"], language="es")
+
+    fake = session(wiki())
+    result = wikipedia.fetch_wikipedia_pages(["El Coliseo  Romano"], language="es")
+
+    assert result["El Coliseo  Romano"]["page_id"] == 9
+    # Only the exact title lookup: no search and no revision request
+    assert [params["prop"] for params in fake.requests] == ["info|pageprops"]
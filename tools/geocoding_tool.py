@@ -1,9 +1,28 @@
+import asyncio
+import hashlib
 import os
+import threading
+import unicodedata
+import weakref
 from typing import Optional, TypedDict, Any
+import httpx
 import requests
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
 
+from utils.cache import SQLiteCache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Forward geocoding endpoint (override to point at a mock server in tests)
+MAPBOX_GEOCODING_URL = os.getenv("MAPBOX_GEOCODING_URL", "https://api.mapbox.com/search/geocode/v6/forward")
+GEOCODING_CONCURRENCY = int(os.getenv("GEOCODING_CONCURRENCY", "8"))
+GEOCODING_TIMEOUT_SECONDS = float(os.getenv("GEOCODING_TIMEOUT_SECONDS", "10"))
+GEOCODING_CACHE_PATH = os.getenv("GEOCODING_CACHE_PATH", ".cache/geocoding.sqlite3")
+GEOCODING_CACHE_TTL_DAYS = float(os.getenv("GEOCODING_CACHE_TTL_DAYS", "30"))
+
 
 class MapboxContext(TypedDict, total=False):
     """Context information from Mapbox response"""
@@ -76,6 +95,65 @@ class GeocodingInputSchema(BaseModel):
     params: GeocodingInput
 
 
+def _build_query_params(params: GeocodingInput, access_token: str) -> dict:
+    query_params = {
+        'q': params.search_text,
+        'access_token': access_token,
+        'language': params.language or 'en',
+        'limit': params.limit or 1,
+    }
+
+    # Add optional parameters
+    if params.country:
+        query_params['country'] = params.country
+
+    if params.proximity:
+        query_params['proximity'] = params.proximity
+
+    return query_params
+
+
+def _parse_geocoding_response(search_text: str, data: MapboxGeocodingResponse) -> dict[str, Any] | str:
+    """Convert the Mapbox response into AttractionCoordinates (or a 'No results' message)"""
+    if not data.get('features') or len(data['features']) == 0:
+        return f"No results found for: {search_text}"
+
+    # Extract the first/best result
+    feature = data['features'][0]
+    geometry = feature['geometry']
+    properties = feature['properties']
+
+    # Extract context information (city, region, country, etc.)
+    context = properties.get('context', {})
+
+    # Helper function to get context value by type
+    def get_context_value(feature_type: str) -> Optional[str]:
+        for key, value in context.items():
+            if key.startswith(feature_type):
+                return value.get('name') or value.get('text')
+        return None
+
+    result: AttractionCoordinates = {
+        'attraction': search_text,
+        'latitude': geometry['coordinates'][1],
+        'longitude': geometry['coordinates'][0],
+        'full_address': properties.get('full_address') or properties.get('place_formatted', ''),
+        'place_name': properties.get('name_preferred') or properties.get('name', ''),
+        'city': get_context_value('place') or get_context_value('locality'),
+        'region': get_context_value('region'),
+        'country': get_context_value('country'),
+        'country_code': None  # Extract from context if needed
+    }
+
+    # Try to get country code from context
+    for key, value in context.items():
+        if key.startswith('country'):
+            result['country_code'] = value.get('short_code')
+            break
+
+    return result
+
+
 def geocode_location(params: GeocodingInput) -> dict[str, Any] | str:
     """
     Geocode a location using the Mapbox Geocoding API.
@@ -95,67 +173,11 @@ def geocode_location(params: GeocodingInput) -> dict[str, Any] | str:
     if not access_token:
         return "Error: MAPBOX_ACCESS_TOKEN not found in environment variables"
     
-    # Build request URL
-    base_url = "https://api.mapbox.com/search/geocode/v6/forward"
-    
-    # Build query parameters
-    query_params = {
-        'q': params.search_text,
-        'access_token': access_token,
-        'language': params.language or 'en',
-        'limit': params.limit or 1,
-    }
-    
-    # Add optional parameters
-    if params.country:
-        query_params['country'] = params.country
-    
-    if params.proximity:
-        query_params['proximity'] = params.proximity
-    
     try:
-        response = requests.get(base_url, params=query_params, timeout=10)
+        response = requests.get(MAPBOX_GEOCODING_URL, params=_build_query_params(params, access_token), timeout=GEOCODING_TIMEOUT_SECONDS)
         response.raise_for_status()
         
-        data: MapboxGeocodingResponse = response.json()
-        
-        if not data.get('features') or len(data['features']) == 0:
-            return f"No results found for: {params.search_text}"
-        
-        # Extract the first/best result
-        feature = data['features'][0]
-        geometry = feature['geometry']
-        properties = feature['properties']
-        
-        # Extract context information (city, region, country, etc.)
-        context = properties.get('context', {})
-        
-        # Helper function to get context value by type
-        def get_context_value(feature_type: str) -> Optional[str]:
-            for key, value in context.items():
-                if key.startswith(feature_type):
-                    return value.get('name') or value.get('text')
-            return None
-        
-        result: AttractionCoordinates = {
-            'attraction': params.search_text,
-            'latitude': geometry['coordinates'][1],
-            'longitude': geometry['coordinates'][0],
-            'full_address': properties.get('full_address') or properties.get('place_formatted', ''),
-            'place_name': properties.get('name_preferred') or properties.get('name', ''),
-            'city': get_context_value('place') or get_context_value('locality'),
-            'region': get_context_value('region'),
-            'country': get_context_value('country'),
-            'country_code': None  # Extract from context if needed
-        }
-        
-        # Try to get country code from context
-        for key, value in context.items():
-            if key.startswith('country'):
-                result['country_code'] = value.get('short_code')
-                break
-        
-        return result
+        return _parse_geocoding_response(params.search_text, response.json())
         
     except requests.exceptions.Timeout:
         return f"Error: Request timeout while geocoding {params.search_text}"
@@ -165,9 +187,155 @@ def geocode_location(params: GeocodingInput) -> dict[str, Any] | str:
         return f"Error: {str(e)}"
 
 
+# ========= Async batch geocoding ============
+
+def _normalize_search_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+
+def geocoding_cache_key(search_text: str, country: Optional[str] = None, language: Optional[str] = None) -> str:
+    """Cache key on (normalized text, country, language)"""
+    raw = f"{_normalize_search_text(search_text)}|{(country or '').upper()}|{(language or 'en').lower()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_geocoding_cache: Optional[SQLiteCache] = None
+_geocoding_cache_lock = threading.Lock()
+
+
+def get_geocoding_cache() -> SQLiteCache:
+    """Persistent geocoding cache (SQLite file, TTL in GEOCODING_CACHE_TTL_DAYS)"""
+    global _geocoding_cache
+    with _geocoding_cache_lock:
+        if _geocoding_cache is None:
+            _geocoding_cache = SQLiteCache(
+                GEOCODING_CACHE_PATH,
+                max_entries=int(os.getenv("GEOCODING_CACHE_MAX_ENTRIES", "50000")),
+                ttl_seconds=GEOCODING_CACHE_TTL_DAYS * 86400,
+                table="geocoding_cache",
+            )
+    return _geocoding_cache
+
+
+# One client per event loop (an httpx.AsyncClient can't be shared across loops)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_geocoding_client() -> httpx.AsyncClient:
+    """Shared keep-alive client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=GEOCODING_CONCURRENCY, max_keepalive_connections=GEOCODING_CONCURRENCY)
+        client = httpx.AsyncClient(timeout=GEOCODING_TIMEOUT_SECONDS, limits=limits)
+        _async_clients[loop] = client
+    return client
+
+
+# Background loop for the sync wrappers, so their client (and its connections) is reused between calls
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def _run_sync(coroutine):
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="geocoding-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _sync_loop).result()
+
+
+async def geocode_location_async(params: GeocodingInput, client: httpx.AsyncClient, retries: int = 2) -> dict[str, Any] | str:
+    """Async version of `geocode_location` on a shared client (retries 429/5xx with backoff)"""
+    access_token = os.environ.get('MAPBOX_ACCESS_TOKEN')
+
+    if not access_token:
+        return "Error: MAPBOX_ACCESS_TOKEN not found in environment variables"
+
+    query_params = _build_query_params(params, access_token)
+    for attempt in range(retries + 1):
+        try:
+            response = await client.get(MAPBOX_GEOCODING_URL, params=query_params)
+            if (response.status_code == 429 or response.status_code >= 500) and attempt < retries:
+                await asyncio.sleep(0.5 * (2 ** attempt))
+                continue
+            response.raise_for_status()
+            return _parse_geocoding_response(params.search_text, response.json())
+        except httpx.TimeoutException:
+            if attempt < retries:
+                continue
+            return f"Error: Request timeout while geocoding {params.search_text}"
+        except httpx.HTTPError as e:
+            return f"Error: Request failed - {str(e)}"
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+
+async def batch_geocode_attractions_async(
+    attractions: list[str],
+    country: Optional[str] = None,
+    language: str = "en",
+    concurrency: Optional[int] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    cache: Optional[SQLiteCache] = None,
+) -> dict[str, dict]:
+    """
+    Geocode many attractions concurrently.
+
+    Identical attractions (after normalizing case, accents and spaces) are
+    requested once, cached results are not requested at all, and at most
+    `concurrency` requests run at the same time. Same output as
+    `batch_geocode_attractions`.
+    """
+    cache = cache if cache is not None else get_geocoding_cache()
+    semaphore = asyncio.Semaphore(concurrency or GEOCODING_CONCURRENCY)
+
+    # Dedupe the batch: one request per cache key
+    keys = {attraction: geocoding_cache_key(attraction, country, language) for attraction in attractions}
+    # The SQLite cache blocks (and commits): read and write it in one batch each, off the event loop
+    cached = await asyncio.to_thread(cache.get_many, list(keys.values()))
+    resolved: dict[str, dict[str, Any] | str] = {key: value["result"] for key, value in cached.items()}
+    pending: dict[str, str] = {}
+    for attraction, key in keys.items():
+        if key not in resolved and key not in pending:
+            pending[key] = attraction
+
+    async def geocode(key: str, attraction: str, client: httpx.AsyncClient):
+        async with semaphore:
+            resolved[key] = await geocode_location_async(
+                GeocodingInput(search_text=attraction, country=country, language=language, limit=1),
+                client,
+            )
+
+    if pending:
+        client = client or get_geocoding_client()
+        await asyncio.gather(*(geocode(key, attraction, client) for key, attraction in pending.items()))
+        # Cache hits and "no results" (deterministic), not transient errors
+        to_cache = {
+            key: {"result": resolved[key]}
+            for key in pending
+            if isinstance(resolved[key], dict) or resolved[key].startswith("No results")
+        }
+        await asyncio.to_thread(cache.set_many, to_cache)
+
+    results = {}
+    for attraction in attractions:
+        result = resolved[keys[attraction]]
+        if isinstance(result, dict):
+            results[attraction] = {**result, "attraction": attraction, "success": True}
+        else:
+            results[attraction] = {"success": False, "error": result}
+    return results
+
+
 def batch_geocode_attractions(attractions: list[str], country: Optional[str] = None) -> dict[str, dict]:
     """
     Geocode multiple attractions/locations at once.
+
+    Runs `batch_geocode_attractions_async` (concurrent, cached, deduplicated).
     
     Args:
         attractions: List of location names to geocode
@@ -193,29 +361,4 @@ def batch_geocode_attractions(attractions: list[str], country: Optional[str] = N
             }
         }
     """
-    results = {}
-    
-    for attraction in attractions:
-        input_params = GeocodingInput(
-            search_text=attraction,
-            country=country,
-            limit=1
-        )
-        result = geocode_location(input_params)
-        
-        # Process result into consistent format
-        if isinstance(result, dict):
-            # Success - add success flag
-            results[attraction] = {
-                **result,
-                "success": True
-            }
-        else:
-            # Error - create error object
-            results[attraction] = {
-                "success": False,
-                "error": result
-            }
-    
-    return results
-
+    return _run_sync(batch_geocode_attractions_async(attractions, country=country))
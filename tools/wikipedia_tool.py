@@ -8,11 +8,22 @@ This tool uses the Wikipedia API to search for articles and extract:
 - Related links and categories
 """
 
+import os
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, TypedDict, Any
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
 
+from utils.cache import SQLiteCache
+
+from dotenv import load_dotenv
+load_dotenv()
+
 
 # User-Agent header requerido por la API de Wikipedia
 # Según la política de etiqueta de MediaWiki: https://www.mediawiki.org/wiki/API:Etiquette
@@ -20,6 +31,14 @@ HEADERS = {
     'User-Agent': 'TravelSmart-AI/1.0 (https://github.com/travelsmart; contact@travelsmart.com) Python/requests'
 }
 
+# API URL template ({language} is replaced), override to point at a mock server in tests
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://{language}.wikipedia.org/w/api.php")
+WIKIPEDIA_BATCH_SIZE = 50  # Maximum titles/pageids per MediaWiki request
+WIKIPEDIA_MAX_CONCURRENCY = int(os.getenv("WIKIPEDIA_MAX_CONCURRENCY", "4"))
+WIKIPEDIA_TIMEOUT_SECONDS = float(os.getenv("WIKIPEDIA_TIMEOUT_SECONDS", "10"))
+WIKIPEDIA_CACHE_PATH = os.getenv("WIKIPEDIA_CACHE_PATH", ".cache/wikipedia.sqlite3")
+WIKIPEDIA_CACHE_TTL_DAYS = float(os.getenv("WIKIPEDIA_CACHE_TTL_DAYS", "7"))
+
 
 class WikipediaImage(TypedDict, total=False):
     """Image information from Wikipedia"""
@@ -71,7 +90,26 @@ class WikipediaInputSchema(BaseModel):
 
 def _get_wikipedia_api_url(language: str = "en") -> str:
     """Get the Wikipedia API URL for a specific language"""
-    return f"https://{language}.wikipedia.org/w/api.php"
+    return WIKIPEDIA_API_URL.format(language=language)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Shared keep-alive session (connection pool + retries on 429/5xx)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=max(WIKIPEDIA_MAX_CONCURRENCY, 10), max_retries=retry)
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
 
 
 def _search_wikipedia(query: str, language: str = "en", limit: int = 5) -> list[WikipediaSearchResult]:
@@ -98,7 +136,7 @@ def _search_wikipedia(query: str, language: str = "en", limit: int = 5) -> list[
     }
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        response = _get_session().get(url, params=params, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         
@@ -147,7 +185,7 @@ def _get_page_info(page_id: int, language: str = "en", sentences: int = 3) -> Op
     }
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        response = _get_session().get(url, params=params, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         
@@ -198,6 +236,41 @@ def _get_page_info(page_id: int, language: str = "en", sentences: int = 3) -> Op
         return None
 
 
+def _is_skipped_image(title: str) -> bool:
+    """Filter out common icons"""
+    return any(skip in title.lower() for skip in ['icon', 'logo', 'symbol', 'flag', '.svg'])
+
+
+def _parse_image_page(page: dict) -> Optional[WikipediaImage]:
+    """Build a WikipediaImage from an `imageinfo` page (None for icons and small images)"""
+    if not page.get('imageinfo'):
+        return None
+    
+    image_info = page['imageinfo'][0]
+    title = page.get('title', '').replace('File:', '')
+    
+    # Filter out common icons and small images
+    if _is_skipped_image(title):
+        return None
+    
+    if image_info.get('width', 0) < 200 or image_info.get('height', 0) < 200:
+        return None
+    
+    # Extract description from metadata
+    description = None
+    extmetadata = image_info.get('extmetadata', {})
+    if 'ImageDescription' in extmetadata:
+        description = extmetadata['ImageDescription'].get('value', '')
+    
+    return WikipediaImage(
+        url=image_info.get('url', ''),
+        title=title,
+        description=description,
+        width=image_info.get('width'),
+        height=image_info.get('height')
+    )
+
+
 def _get_page_images(page_id: int, language: str = "en", limit: int = 5) -> list[WikipediaImage]:
     """
     Get images from a Wikipedia page.
@@ -223,7 +296,7 @@ def _get_page_images(page_id: int, language: str = "en", limit: int = 5) -> list
     }
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        response = _get_session().get(url, params=params, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         
@@ -247,37 +320,16 @@ def _get_page_images(page_id: int, language: str = "en", limit: int = 5) -> list
                 'utf8': 1
             }
             
-            response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+            response = _get_session().get(url, params=params, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
             response.raise_for_status()
             data = response.json()
             
             for page in data.get('query', {}).get('pages', {}).values():
-                if 'imageinfo' not in page:
-                    continue
-                
-                image_info = page['imageinfo'][0]
-                title = page.get('title', '').replace('File:', '')
-                
-                # Filter out common icons and small images
-                if any(skip in title.lower() for skip in ['icon', 'logo', 'symbol', 'flag', '.svg']):
-                    continue
-                
-                if image_info.get('width', 0) < 200 or image_info.get('height', 0) < 200:
+                image = _parse_image_page(page)
+                if image is None:
                     continue
                 
-                # Extract description from metadata
-                description = None
-                extmetadata = image_info.get('extmetadata', {})
-                if 'ImageDescription' in extmetadata:
-                    description = extmetadata['ImageDescription'].get('value', '')
-                
-                images.append(WikipediaImage(
-                    url=image_info.get('url', ''),
-                    title=title,
-                    description=description,
-                    width=image_info.get('width'),
-                    height=image_info.get('height')
-                ))
+                images.append(image)
                 
                 if len(images) >= limit:
                     break
@@ -315,7 +367,7 @@ def _get_full_extract(page_id: int, language: str = "en") -> Optional[str]:
     }
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        response = _get_session().get(url, params=params, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         
@@ -327,6 +379,334 @@ def _get_full_extract(page_id: int, language: str = "en") -> Optional[str]:
         return None
 
 
+# ========= Batched enrichment engine ============
+#
+# Resolves many queries with multi-title MediaWiki requests (up to 50 titles or
+# pageids per request, props combined in one call, `continue` followed until
+# complete) on the shared session:
+#   1. exact titles (following redirects) -> page id + last revision
+#   2. queries that are not a page title -> one search each (cached)
+#   3. page data for the (page id, revision) pairs not in the cache
+#   4. image info for the candidate files not in the cache
+# Page data is cached by page id and revision, so an edited article is fetched again.
+
+_wikipedia_cache: Optional[SQLiteCache] = None
+_wikipedia_cache_lock = threading.Lock()
+
+
+def get_wikipedia_cache() -> SQLiteCache:
+    """Persistent cache of pages (by page id and revision), files and search results"""
+    global _wikipedia_cache
+    with _wikipedia_cache_lock:
+        if _wikipedia_cache is None:
+            _wikipedia_cache = SQLiteCache(
+                WIKIPEDIA_CACHE_PATH,
+                max_entries=int(os.getenv("WIKIPEDIA_CACHE_MAX_ENTRIES", "50000")),
+                ttl_seconds=WIKIPEDIA_CACHE_TTL_DAYS * 86400,
+                table="wikipedia_cache",
+            )
+    return _wikipedia_cache
+
+
+def _normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKD", query)
+    query = "".join(char for char in query if not unicodedata.combining(char))
+    return " ".join(query.lower().split())
+
+
+def _chunks(items: list, size: int = WIKIPEDIA_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _api_query(language: str, params: dict) -> dict:
+    """
+    Run an `action=query` request, following `continue` until the result is complete.
+    
+    Returns {"pages": {pageid or title: page}, "normalized": {from: to}, "redirects": {from: to}}
+    with the list props (images, categories, ...) of every continuation merged per page.
+    """
+    url = _get_wikipedia_api_url(language)
+    base = {'action': 'query', 'format': 'json', 'formatversion': 2, 'utf8': 1, **params}
+    result = {"pages": {}, "normalized": {}, "redirects": {}}
+    continuation = {}
+    
+    while True:
+        response = _get_session().get(url, params={**base, **continuation}, timeout=WIKIPEDIA_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            raise RuntimeError(data['error'].get('info', data['error']))
+        
+        query = data.get('query', {})
+        for item in query.get('normalized', []):
+            result["normalized"][item['from']] = item['to']
+        for item in query.get('redirects', []):
+            result["redirects"][item['from']] = item['to']
+        for page in query.get('pages', []):
+            merged = result["pages"].setdefault(page.get('pageid') or page.get('title'), {})
+            for field, value in page.items():
+                if isinstance(value, list) and isinstance(merged.get(field), list):
+                    merged[field].extend(value)
+                else:
+                    merged[field] = value
+        
+        if 'continue' not in data:
+            return result
+        continuation = data['continue']
+
+
+def _resolved_title(title: str, data: dict) -> str:
+    title = data["normalized"].get(title, title)
+    return data["redirects"].get(title, title)
+
+
+def _is_article(page: dict) -> bool:
+    return bool(page.get('pageid')) and not page.get('missing') and 'disambiguation' not in page.get('pageprops', {})
+
+
+def _resolve_titles(queries: list[str], language: str) -> dict[str, dict]:
+    """Match queries to articles by exact title (redirects followed). Returns query -> {pageid, title, revid}"""
+    resolved = {}
+    # '|' separates titles and can't be part of one
+    titles = [query for query in queries if '|' not in query and len(query) <= 255]
+    
+    for chunk in _chunks(titles):
+        try:
+            data = _api_query(language, {
+                'titles': '|'.join(chunk),
+                'redirects': 1,
+                'prop': 'info|pageprops',
+                'ppprop': 'disambiguation',
+            })
+        except Exception as e:
+            print(f"Error resolving Wikipedia titles: {e}")
+            continue
+        
+        by_title = {page['title']: page for page in data["pages"].values() if _is_article(page)}
+        for query in chunk:
+            page = by_title.get(_resolved_title(query, data))
+            if page:
+                resolved[query] = {'pageid': page['pageid'], 'title': page['title'], 'revid': page.get('lastrevid')}
+    
+    return resolved
+
+
+def _page_revisions(page_ids: list[int], language: str) -> dict[int, dict]:
+    """Current revision of already known pages. Returns pageid -> {pageid, title, revid}"""
+    revisions = {}
+    for chunk in _chunks(page_ids):
+        try:
+            data = _api_query(language, {'pageids': '|'.join(map(str, chunk)), 'prop': 'info'})
+        except Exception as e:
+            print(f"Error getting Wikipedia revisions: {e}")
+            continue
+        for page in data["pages"].values():
+            if _is_article(page):
+                revisions[page['pageid']] = {'pageid': page['pageid'], 'title': page['title'], 'revid': page.get('lastrevid')}
+    return revisions
+
+
+def _search_page(query: str, language: str) -> Optional[dict]:
+    """Best search result for a query as {pageid, title, revid}"""
+    try:
+        data = _api_query(language, {
+            'generator': 'search',
+            'gsrsearch': query,
+            'gsrlimit': 1,
+            'prop': 'info',
+        })
+    except Exception as e:
+        print(f"Error searching Wikipedia: {e}")
+        return None
+    
+    for page in data["pages"].values():
+        if page.get('pageid') and not page.get('missing'):
+            return {'pageid': page['pageid'], 'title': page['title'], 'revid': page.get('lastrevid')}
+    return None
+
+
+def _resolve_queries(queries: list[str], language: str, cache: SQLiteCache) -> dict[str, dict]:
+    """Query -> {pageid, title, revid} for every query that matches an article"""
+    resolved = _resolve_titles(queries, language)
+    unresolved = [query for query in queries if query not in resolved]
+    
+    # Search results are cached with their revision and reused while the entry lives;
+    # entries stored without a revision get it refreshed in one batched request
+    to_search = []
+    cached_ids = {}
+    for query in unresolved:
+        cached = cache.get(f"search:{language}:{_normalize_query(query)}")
+        if cached is None:
+            to_search.append(query)
+        elif cached.get('revid') is not None:
+            resolved[query] = cached
+        else:
+            cached_ids[query] = cached['pageid']
+    
+    if cached_ids:
+        revisions = _page_revisions(sorted(set(cached_ids.values())), language)
+        for query, page_id in cached_ids.items():
+            if page_id in revisions:
+                resolved[query] = revisions[page_id]
+            else:
+                to_search.append(query)
+    
+    if to_search:
+        with ThreadPoolExecutor(max_workers=WIKIPEDIA_MAX_CONCURRENCY) as executor:
+            for query, page in zip(to_search, executor.map(lambda query: _search_page(query, language), to_search)):
+                if page:
+                    cache.set(f"search:{language}:{_normalize_query(query)}", page)
+                    resolved[query] = page
+    
+    return resolved
+
+
+def _page_cache_key(language: str, page: dict, sentences: int) -> str:
+    return f"page:{language}:{page['pageid']}:{page['revid']}:{sentences}"
+
+
+def _fetch_page_data(pages: list[dict], language: str, sentences: int, cache: SQLiteCache) -> dict[int, dict]:
+    """Extract, coordinates, categories and image files of pages, by page id (cached by revision)"""
+    page_data = {}
+    missing = []
+    for page in pages:
+        cached = cache.get(_page_cache_key(language, page, sentences))
+        if cached is not None:
+            page_data[page['pageid']] = cached
+        else:
+            missing.append(page)
+    
+    by_id = {page['pageid']: page for page in missing}
+    for chunk in _chunks(list(by_id)):
+        try:
+            data = _api_query(language, {
+                'pageids': '|'.join(map(str, chunk)),
+                'prop': 'extracts|coordinates|categories|images|info',
+                'exintro': 1,
+                'exsentences': sentences,
+                'explaintext': 1,
+                'exlimit': 'max',
+                'cllimit': 'max',
+                'imlimit': 'max',
+                'colimit': 'max',
+                'inprop': 'url',
+            })
+        except Exception as e:
+            print(f"Error getting Wikipedia pages: {e}")
+            continue
+        
+        for raw in data["pages"].values():
+            if raw.get('pageid') not in by_id:
+                continue
+            title = raw.get('title', '')
+            coordinates = None
+            if raw.get('coordinates'):
+                coordinates = WikipediaCoordinates(
+                    latitude=raw['coordinates'][0].get('lat', 0.0),
+                    longitude=raw['coordinates'][0].get('lon', 0.0)
+                )
+            
+            data_for_page = {
+                'title': title,
+                'page_id': raw['pageid'],
+                'url': raw.get('fullurl', f"https://{language}.wikipedia.org/wiki/{title.replace(' ', '_')}"),
+                'summary': raw.get('extract', ''),
+                'coordinates': coordinates,
+                'categories': [cat['title'].replace('Category:', '') for cat in raw.get('categories', [])][:10],
+                'files': [image['title'] for image in raw.get('images', []) if not _is_skipped_image(image['title'])],
+            }
+            page_data[raw['pageid']] = data_for_page
+            cache.set(_page_cache_key(language, by_id[raw['pageid']], sentences), data_for_page)
+    
+    return page_data
+
+
+def _fetch_images(files: list[str], language: str, cache: SQLiteCache) -> dict[str, Optional[WikipediaImage]]:
+    """Image info of file titles (None for icons and small images), cached by file title"""
+    images = {}
+    missing = []
+    for file_title in files:
+        cached = cache.get(f"file:{language}:{file_title}")
+        if cached is not None:
+            images[file_title] = cached['image']
+        else:
+            missing.append(file_title)
+    
+    for chunk in _chunks(missing):
+        try:
+            data = _api_query(language, {
+                'titles': '|'.join(chunk),
+                'prop': 'imageinfo',
+                'iiprop': 'url|size|extmetadata',
+            })
+        except Exception as e:
+            print(f"Error getting images: {e}")
+            continue
+        
+        by_title = {page.get('title'): page for page in data["pages"].values()}
+        for file_title in chunk:
+            page = by_title.get(_resolved_title(file_title, data))
+            if page is None:
+                continue
+            image = _parse_image_page(page)
+            images[file_title] = image
+            cache.set(f"file:{language}:{file_title}", {'image': image})
+    
+    return images
+
+
+def fetch_wikipedia_pages(
+    queries: list[str],
+    language: str = "en",
+    sentences: int = 3,
+    max_images: int = 5,
+) -> dict[str, Optional[WikipediaPageInfo]]:
+    """
+    Resolve many queries to Wikipedia pages in batched requests.
+    
+    Queries that are article titles resolve in ceil(N/50) requests, the rest
+    need one search each. `extract` is the intro (the full text can only be
+    requested one page at a time, see `_get_full_extract`).
+    
+    Returns:
+        dict: query -> WikipediaPageInfo, or None when no page was found
+    """
+    cache = get_wikipedia_cache()
+    unique_queries = list(dict.fromkeys(query.strip() for query in queries if query and query.strip()))
+    
+    resolved = _resolve_queries(unique_queries, language, cache)
+    pages = list({page['pageid']: page for page in resolved.values()}.values())
+    page_data = _fetch_page_data(pages, language, sentences, cache)
+    
+    # Candidate files per page: more than max_images, some are dropped for their size
+    candidates = {page_id: data['files'][:max_images + 5] for page_id, data in page_data.items()}
+    images = _fetch_images(sorted({file for files in candidates.values() for file in files}), language, cache)
+    
+    results = {}
+    for query in queries:
+        page = resolved.get(query.strip()) if query else None
+        data = page_data.get(page['pageid']) if page else None
+        if data is None:
+            results[query] = None
+            continue
+        
+        page_images = [images[file] for file in candidates[data['page_id']] if images.get(file)]
+        results[query] = WikipediaPageInfo(
+            title=data['title'],
+            page_id=data['page_id'],
+            url=data['url'],
+            summary=data['summary'],
+            extract=data['summary'],
+            images=page_images[:max_images],
+            coordinates=data['coordinates'],
+            categories=data['categories'],
+            language=language
+        )
+    
+    return results
+
+
 def get_wikipedia_info(params: WikipediaInput) -> WikipediaPageInfo | str:
     """
     Search Wikipedia and get detailed information including text and images.
@@ -453,6 +833,7 @@ def batch_get_wikipedia_images(
     
     This tool is optimized for processing multiple locations/attractions at once,
     such as getting images for all attractions in a travel itinerary.
+    Pages are resolved with batched requests (see `fetch_wikipedia_pages`).
     
     Args:
         queries: List of search queries (e.g., ["Eiffel Tower", "Louvre Museum", "Notre-Dame"])
@@ -488,13 +869,13 @@ def batch_get_wikipedia_images(
         ...         print(f"{attraction} ({data['title']}): {len(data['images'])} images")
     """
     
+    pages = fetch_wikipedia_pages(queries, language=language, sentences=1, max_images=max_images_per_query)
     results = {}
     
     for query in queries:
-        # Search for the page
-        search_results = _search_wikipedia(query, language, limit=1)
+        page_info = pages.get(query)
         
-        if not search_results:
+        if not page_info:
             results[query] = {
                 "success": False,
                 "title": "",
@@ -503,17 +884,10 @@ def batch_get_wikipedia_images(
             }
             continue
         
-        # Get images
-        images = _get_page_images(
-            page_id=search_results[0]['page_id'],
-            language=language,
-            limit=max_images_per_query
-        )
-        
         results[query] = {
             # "success": True,
-            # "title": search_results[0]['title'],
-            "images": images,
+            # "title": page_info['title'],
+            "images": page_info['images'],
             # "error": None
         }
     
@@ -531,6 +905,8 @@ def batch_get_wikipedia_info(
     
     This tool retrieves full page information (text, images, coordinates) for
     multiple queries at once. Ideal for enriching entire travel itineraries.
+    Pages are resolved with batched requests (see `fetch_wikipedia_pages`), so
+    `extract` holds the intro of each page.
     
     Args:
         queries: List of search queries (e.g., ["Paris", "Rome", "Barcelona"])
@@ -553,41 +929,21 @@ def batch_get_wikipedia_info(
         ...         print(f"{info['title']}: {info['summary'][:100]}...")
     """
     
+    pages = fetch_wikipedia_pages(queries, language=language, sentences=sentences, max_images=max_images)
     results = {}
     
     for query in queries:
-        # Search for the page
-        search_results = _search_wikipedia(query, language, limit=1)
-        
-        if not search_results:
-            results[query] = WikipediaPageInfo(
-                query=query,
-                page_info=None,
-                success=False,
-                error=f"No Wikipedia page found for: {query}"
-            )
-            continue
-        
-        # Get detailed page info
-        page_info = _get_page_info(
-            page_id=search_results[0]['page_id'],
-            language=language,
-            sentences=sentences
-        )
+        page_info = pages.get(query)
         
         if not page_info:
             results[query] = WikipediaPageInfo(
                 query=query,
                 page_info=None,
                 success=False,
-                error=f"Could not retrieve information for: {search_results[0]['title']}"
+                error=f"No Wikipedia page found for: {query}"
             )
             continue
         
-        # Limit images to max_images
-        if page_info['images'] and len(page_info['images']) > max_images:
-            page_info['images'] = page_info['images'][:max_images]
-        
         results[query] = WikipediaPageInfo(
             query=query,
             page_info=page_info,
@@ -596,6 +952,3 @@ def batch_get_wikipedia_info(
         )
     
     return results
-
-
-
@@ -0,0 +1,188 @@
+"""
+Async SSE streaming of a chat agent turn.
+
+`agent_event_stream` runs `agent.astream` (messages + updates modes) in a
+producer task that feeds a bounded queue: a slow client pauses the graph
+instead of buffering the whole answer in memory. Tokens are batched every
+CHAT_STREAM_FLUSH_MS and every event is typed:
+
+    {"type": "token", "token": "..."}
+    {"type": "tool_call", "name": "...", "args": {...}}
+    {"type": "interrupt", "message": "..."}
+    {"type": "itinerary_patch", "patch": [...]}   (JSON Patch from the previous itinerary)
+    {"type": "error", "error": "..."}
+
+When the client disconnects, Starlette cancels the response generator; the
+producer task is cancelled with it, which cancels the LLM request in flight.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import suppress
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import jsonpatch
+
+from utils.itinerary_patch import itinerary_to_dict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+CHAT_STREAM_FLUSH_MS = float(os.getenv("CHAT_STREAM_FLUSH_MS", "30"))
+CHAT_STREAM_QUEUE_SIZE = int(os.getenv("CHAT_STREAM_QUEUE_SIZE", "64"))
+
+_END = ("end", None)
+
+
+def sse_event(payload) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+def _chunk_text(chunk) -> str:
+    """Text of an AI message chunk (providers may send a list of content blocks)"""
+    content = getattr(chunk, "content", None)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+    return ""
+
+
+def _update_events(update, current_itinerary: Optional[dict]) -> tuple[list, Optional[dict]]:
+    """
+    SSE events of one node update and the itinerary after it.
+
+    A node can update the state with a list of dicts, e.g. the ToolNode when
+    the model made parallel tool calls.
+    """
+    events = []
+    for part in update if isinstance(update, (list, tuple)) else (update,):
+        if not isinstance(part, dict):
+            continue
+
+        for message in part.get("messages") or []:
+            for tool_call in getattr(message, "tool_calls", None) or []:
+                events.append(sse_event({"type": "tool_call", "name": tool_call.get("name"), "args": tool_call.get("args")}))
+
+        if part.get("itinerary") is not None:
+            new_itinerary = itinerary_to_dict(part["itinerary"])
+            patch = jsonpatch.make_patch(current_itinerary or {}, new_itinerary).patch
+            if patch:
+                events.append(sse_event({"type": "itinerary_patch", "patch": patch}))
+                current_itinerary = new_itinerary
+    return events, current_itinerary
+
+
+async def _final_itinerary(agent, config: dict) -> Optional[dict]:
+    """Itinerary of the thread checkpoint after the turn"""
+    try:
+        snapshot = await agent.aget_state(config)
+    except Exception as e:
+        print(f"\n\nError reading the agent state: {e}\n\n")
+        return None
+    itinerary = (snapshot.values or {}).get("itinerary")
+    return itinerary_to_dict(itinerary) if itinerary is not None else None
+
+
+async def agent_event_stream(
+    agent,
+    graph_input,
+    config: dict,
+    itinerary: Optional[dict],
+    on_itinerary: Optional[Callable[[dict], Awaitable[Any]]] = None,
+) -> AsyncIterator[str]:
+    """
+    Run one turn of a chat agent and yield its SSE events.
+
+    Args:
+        agent: Compiled chat agent graph
+        graph_input: New input state or a `Command(resume=...)`
+        config: Graph config with the thread id
+        itinerary: Itinerary of the thread before the turn (base of the patches)
+        on_itinerary: Awaited with the new itinerary after the stream, if the
+            thread checkpoint differs from `itinerary`
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CHAT_STREAM_QUEUE_SIZE)
+
+    async def produce():
+        try:
+            async for item in agent.astream(graph_input, config=config, stream_mode=["messages", "updates"]):
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"\n\nError streaming agent message: {e}\n\n")
+            await queue.put(("error", e))
+        await queue.put(_END)
+
+    loop = asyncio.get_running_loop()
+    window = CHAT_STREAM_FLUSH_MS / 1000
+    producer = asyncio.create_task(produce())
+    current_itinerary = itinerary
+    tokens = []
+    last_flush = loop.time()
+
+    try:
+        while True:
+            timeout = max(0.0, last_flush + window - loop.time()) if tokens else None
+            try:
+                mode, payload = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                mode, payload = None, None
+
+            if tokens and (mode != "messages" or loop.time() - last_flush >= window):
+                yield sse_event({"type": "token", "token": "".join(tokens)})
+                tokens = []
+                last_flush = loop.time()
+
+            if mode is None:
+                continue
+
+            if mode == "end":
+                break
+
+            if mode == "error":
+                yield sse_event({"type": "error", "error": str(payload)})
+                continue
+
+            if mode == "messages":
+                chunk, _ = payload
+                if getattr(chunk, "type", None) in ("AIMessageChunk", "ai"):
+                    text = _chunk_text(chunk)
+                    if text:
+                        if not tokens:
+                            last_flush = loop.time()
+                        tokens.append(text)
+                continue
+
+            # mode == "updates": {node: update} after each step
+            for node, update in (payload or {}).items():
+                if node == "__interrupt__":
+                    for interrupt in update or ():
+                        yield sse_event({"type": "interrupt", "message": getattr(interrupt, "value", interrupt)})
+                    continue
+
+                events, current_itinerary = _update_events(update, current_itinerary)
+                for event in events:
+                    yield event
+
+        # The checkpoint is the source of truth: an update the stream did not
+        # carry (or carried in a shape not handled above) is still saved
+        final_itinerary = await _final_itinerary(agent, config)
+        if final_itinerary is not None:
+            patch = jsonpatch.make_patch(current_itinerary or {}, final_itinerary).patch
+            if patch:
+                yield sse_event({"type": "itinerary_patch", "patch": patch})
+                current_itinerary = final_itinerary
+
+        if on_itinerary is not None and current_itinerary is not None and current_itinerary != itinerary:
+            await on_itinerary(current_itinerary)
+
+        yield "data: [DONE]\n\n"
+    finally:
+        if not producer.done():
+            producer.cancel()
+        with suppress(asyncio.CancelledError):
+            await producer
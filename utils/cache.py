@@ -0,0 +1,208 @@
+"""
+Small key/value caches with TTL and LRU eviction.
+
+Values must be JSON serializable. Entries can be tagged with a `group` so
+callers can scan related entries (e.g. candidates for a similarity lookup)
+without reading the whole cache.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, group: Optional[str] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, group, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Values of the `keys` that are cached (missing and expired keys are left out)"""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, values: Dict[str, Any], group: Optional[str] = None) -> None:
+        for key, value in values.items():
+            self.set(key, value, group)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def items_in_group(self, group: str) -> List[Tuple[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value)
+                for key, (expires_at, entry_group, value) in self._entries.items()
+                if entry_group == group and expires_at >= now
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache:
+    """Persistent cache on a local SQLite file, with TTL and LRU eviction.
+
+    Recency is tracked with a `last_access` column, so the least recently
+    read entries are dropped first once `max_entries` is reached.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: float = 86400, table: str = "cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                grp TEXT,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_grp ON {self.table} (grp)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_access ON {self.table} (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, group: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, grp, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, group, json.dumps(value, default=str), now + self.ttl_seconds, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Values of the `keys` that are cached, read in one transaction (missing and expired keys are left out)"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        rows = []
+        with self._lock:
+            # Chunked below SQLite's limit of bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, value, expires_at FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            fresh = [key for key, _, expires_at in rows if expires_at >= now]
+            expired = [key for key, _, expires_at in rows if expires_at < now]
+            self._conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", [(now, key) for key in fresh])
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in expired])
+            self._conn.commit()
+        return {key: json.loads(value) for key, value, expires_at in rows if expires_at >= now}
+
+    def set_many(self, values: Dict[str, Any], group: Optional[str] = None) -> None:
+        """Store several entries in one transaction"""
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, grp, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, group, json.dumps(value, default=str), now + self.ttl_seconds, now) for key, value in values.items()],
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def items_in_group(self, group: str) -> List[Tuple[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE grp = ? AND expires_at >= ?", (group, time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
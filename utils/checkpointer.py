@@ -0,0 +1,272 @@
+"""
+Checkpointers for the LangGraph chat agents.
+
+The backend is chosen with CHECKPOINTER_BACKEND:
+  - postgres (default): threads are stored in the app database (same
+    connection settings as `database.engine`), so they survive restarts and
+    are shared by every worker.
+  - memory: in-process `MemorySaver`, for local development and tests.
+
+If the Postgres checkpointer cannot be created the app fails at startup,
+unless CHECKPOINTER_ALLOW_MEMORY_FALLBACK=true opts into a `MemorySaver`
+(threads are then lost on restart and not shared between workers).
+
+Old threads are removed every CHECKPOINT_PRUNE_INTERVAL_HOURS by a background
+thread started with the app (`start_checkpoint_pruning`), or on demand with
+scripts/prune_checkpoints.py.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from itertools import islice
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "postgres").lower()
+CHECKPOINTER_POOL_MIN_SIZE = int(os.getenv("CHECKPOINTER_POOL_MIN_SIZE", "1"))
+CHECKPOINTER_POOL_MAX_SIZE = int(os.getenv("CHECKPOINTER_POOL_MAX_SIZE", "10"))
+CHECKPOINTER_ALLOW_MEMORY_FALLBACK = os.getenv("CHECKPOINTER_ALLOW_MEMORY_FALLBACK", "false").lower() in ("1", "true", "yes", "on")
+CHECKPOINT_TTL_DAYS = float(os.getenv("CHECKPOINT_TTL_DAYS", "30"))
+CHECKPOINT_PRUNE_INTERVAL_HOURS = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL_HOURS", "24"))
+
+
+def _postgres_conninfo() -> str:
+    """libpq connection string built from the SQLAlchemy engine URL"""
+    from database import engine
+
+    url = engine.url.set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+def _create_postgres_checkpointer():
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+    from langgraph.checkpoint.postgres import PostgresSaver
+
+    class PooledPostgresSaver(PostgresSaver):
+        """PostgresSaver on a connection pool, usable from sync and async graph calls"""
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    pool = ConnectionPool(
+        _postgres_conninfo(),
+        min_size=CHECKPOINTER_POOL_MIN_SIZE,
+        max_size=CHECKPOINTER_POOL_MAX_SIZE,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        name="langgraph-checkpointer",
+        open=True,
+    )
+    checkpointer = PooledPostgresSaver(pool)
+    try:
+        checkpointer.setup()  # Creates/migrates the checkpoint tables (idempotent)
+    except Exception:
+        pool.close()
+        raise
+    return checkpointer
+
+
+def create_checkpointer(backend: Optional[str] = None, allow_memory_fallback: Optional[bool] = None):
+    backend = (backend or CHECKPOINTER_BACKEND).lower()
+    allow_memory_fallback = CHECKPOINTER_ALLOW_MEMORY_FALLBACK if allow_memory_fallback is None else allow_memory_fallback
+
+    if backend == "postgres":
+        try:
+            return _create_postgres_checkpointer()
+        except Exception as e:
+            if not allow_memory_fallback:
+                raise RuntimeError(
+                    f"Could not create the Postgres checkpointer ({e}). "
+                    "Set CHECKPOINTER_ALLOW_MEMORY_FALLBACK=true to run with in-memory chat threads"
+                ) from e
+            print(f"\n\n⚠️ Could not create the Postgres checkpointer ({e}). Falling back to MemorySaver: chat threads will NOT persist\n\n")
+    elif backend != "memory":
+        raise ValueError(f"Unknown checkpointer backend: {backend}")
+
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
+
+
+def _namespaced_saver(saver, namespace: str):
+    """Wrap `saver` so the thread ids of a graph are stored as `<namespace>:<thread_id>`.
+
+    Both chat agents are called with the same thread ids; the prefix keeps
+    their threads apart in the shared store, as separate savers did before.
+    """
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+
+    prefix = f"{namespace}:"
+
+    def wrap(config):
+        if not config or "thread_id" not in config.get("configurable", {}):
+            return config
+        configurable = {**config["configurable"], "thread_id": prefix + str(config["configurable"]["thread_id"])}
+        return {**config, "configurable": configurable}
+
+    def unwrap(config):
+        if not config or "thread_id" not in config.get("configurable", {}):
+            return config
+        thread_id = str(config["configurable"]["thread_id"])
+        if thread_id.startswith(prefix):
+            thread_id = thread_id[len(prefix):]
+        return {**config, "configurable": {**config["configurable"], "thread_id": thread_id}}
+
+    def in_namespace(checkpoint_tuple):
+        return str(checkpoint_tuple.config["configurable"]["thread_id"]).startswith(prefix)
+
+    def unwrap_tuple(checkpoint_tuple):
+        if checkpoint_tuple is None:
+            return None
+        return checkpoint_tuple._replace(config=unwrap(checkpoint_tuple.config), parent_config=unwrap(checkpoint_tuple.parent_config))
+
+    class NamespacedSaver(BaseCheckpointSaver):
+        def __init__(self):
+            super().__init__(serde=saver.serde)
+            self.saver = saver
+
+        def get_tuple(self, config):
+            return unwrap_tuple(saver.get_tuple(wrap(config)))
+
+        def list(self, config, *, filter=None, before=None, limit=None):
+            if config and "thread_id" in config.get("configurable", {}):
+                for item in saver.list(wrap(config), filter=filter, before=wrap(before), limit=limit):
+                    yield unwrap_tuple(item)
+                return
+            # Without a thread the store lists every graph: keep the ones of this namespace
+            items = (item for item in saver.list(config, filter=filter, before=wrap(before)) if in_namespace(item))
+            for item in islice(items, limit):
+                yield unwrap_tuple(item)
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            return unwrap(saver.put(wrap(config), checkpoint, metadata, new_versions))
+
+        def put_writes(self, config, writes, task_id, task_path=""):
+            return saver.put_writes(wrap(config), writes, task_id, task_path)
+
+        def delete_thread(self, thread_id):
+            return saver.delete_thread(prefix + str(thread_id))
+
+        async def aget_tuple(self, config):
+            return unwrap_tuple(await saver.aget_tuple(wrap(config)))
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            if config and "thread_id" in config.get("configurable", {}):
+                async for item in saver.alist(wrap(config), filter=filter, before=wrap(before), limit=limit):
+                    yield unwrap_tuple(item)
+                return
+            listed = 0
+            async for item in saver.alist(config, filter=filter, before=wrap(before)):
+                if limit is not None and listed >= limit:
+                    break
+                if in_namespace(item):
+                    listed += 1
+                    yield unwrap_tuple(item)
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return unwrap(await saver.aput(wrap(config), checkpoint, metadata, new_versions))
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await saver.aput_writes(wrap(config), writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await saver.adelete_thread(prefix + str(thread_id))
+
+        def get_next_version(self, current, channel):
+            return saver.get_next_version(current, channel)
+
+    return NamespacedSaver()
+
+
+_checkpointer: Optional[Any] = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer(namespace: Optional[str] = None):
+    """Return the process wide checkpointer (one pool shared by the chat agents).
+
+    Pass a `namespace` (the graph name) to keep the threads of each graph apart.
+    """
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = create_checkpointer()
+    if namespace:
+        return _namespaced_saver(_checkpointer, namespace)
+    return _checkpointer
+
+
+def prune_checkpoints(max_age_days: Optional[float] = None, batch_size: int = 500) -> dict:
+    """Delete every thread whose last checkpoint is older than `max_age_days`.
+
+    Returns a dict with the number of pruned threads and deleted rows per table.
+    """
+    from psycopg import Connection
+
+    max_age_days = CHECKPOINT_TTL_DAYS if max_age_days is None else max_age_days
+    report = {"threads": 0, "checkpoints": 0, "checkpoint_blobs": 0, "checkpoint_writes": 0}
+
+    with Connection.connect(_postgres_conninfo(), autocommit=True) as conn:
+        thread_ids = [
+            row[0]
+            for row in conn.execute(
+                """
+                SELECT thread_id
+                FROM checkpoints
+                GROUP BY thread_id
+                HAVING max((checkpoint->>'ts')::timestamptz) < now() - make_interval(secs => %s)
+                """,
+                (max_age_days * 86400,),
+            ).fetchall()
+        ]
+
+        for start in range(0, len(thread_ids), batch_size):
+            batch = thread_ids[start:start + batch_size]
+            with conn.transaction():
+                for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                    cursor = conn.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (batch,))
+                    report[table] += cursor.rowcount
+
+    report["threads"] = len(thread_ids)
+    return report
+
+
+def start_checkpoint_pruning(interval_hours: Optional[float] = None) -> Optional[threading.Thread]:
+    """Prune old threads now and then every `interval_hours` in a background thread.
+
+    Does nothing with the memory backend or when the interval is 0.
+    """
+    interval_hours = CHECKPOINT_PRUNE_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if CHECKPOINTER_BACKEND != "postgres" or interval_hours <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                report = prune_checkpoints()
+                print(f"\n\n🧹 Pruned {report['threads']} inactive chat threads\n\n")
+            except Exception as e:
+                print(f"\n\n⚠️ Could not prune the chat threads: {e}\n\n")
+            time.sleep(interval_hours * 3600)
+
+    thread = threading.Thread(target=run, name="checkpoint-pruning", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,119 @@
+"""
+Offline gazetteer used to validate generated itineraries without network calls.
+
+Bundles the ISO 3166-1 alpha-2 country codes (with Spanish and English names)
+and the coordinates of the most common tourist cities. Lookups ignore case,
+accents and spacing, and the data file is loaded once on first use.
+"""
+
+import json
+import math
+import os
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer.json")
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def normalize_name(value: str) -> str:
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.replace(".", " ").replace("-", " ").replace(",", " ")
+    return " ".join(text.lower().split())
+
+
+@lru_cache(maxsize=1)
+def _load() -> dict:
+    with open(GAZETTEER_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    country_names: Dict[str, str] = {}
+    for code, names in data["countries"].items():
+        for name in names:
+            country_names[normalize_name(name)] = code
+
+    cities: Dict[str, List[dict]] = {}
+    for city in data["cities"]:
+        for name in [city["name"], *city.get("aliases", [])]:
+            cities.setdefault(normalize_name(name), []).append(city)
+
+    return {"countries": data["countries"], "country_names": country_names, "cities": cities}
+
+
+def is_valid_country_code(code: Optional[str]) -> bool:
+    return bool(code) and code.upper() in _load()["countries"]
+
+
+def country_code_for(name: Optional[str]) -> Optional[str]:
+    """ISO code of a country name (Spanish or English), or None if unknown"""
+    if not name:
+        return None
+    normalized = normalize_name(name)
+    if normalized.upper() in _load()["countries"]:
+        return normalized.upper()
+    return _load()["country_names"].get(normalized)
+
+
+def country_name(code: str) -> Optional[str]:
+    names = _load()["countries"].get((code or "").upper())
+    return names[0] if names else None
+
+
+def find_cities(name: Optional[str]) -> List[dict]:
+    """Every gazetteer city matching the name or one of its aliases"""
+    if not name:
+        return []
+    cities = _load()["cities"]
+    normalized = normalize_name(name)
+    if normalized in cities:
+        return list(cities[normalized])
+    # "Roma, Italia" / "Cusco (Perú)": try the part before the qualifier
+    for separator in (",", "("):
+        if separator in name:
+            head = normalize_name(name.split(separator, 1)[0])
+            if head in cities:
+                return list(cities[head])
+    return []
+
+
+def find_city(name: Optional[str], country_code: Optional[str] = None) -> Optional[dict]:
+    """Best gazetteer match for a city, preferring the given country when the name is ambiguous"""
+    matches = find_cities(name)
+    if not matches:
+        return None
+    if country_code:
+        for city in matches:
+            if city["country"] == country_code.upper():
+                return city
+    return matches[0] if len(matches) == 1 else None
+
+
+def parse_coordinates(value) -> Optional[Tuple[float, float]]:
+    """Parse "lat, lon" (also "lat lon" or "(lat, lon)") into a valid (lat, lon) pair"""
+    if not value:
+        return None
+    text = str(value).strip().strip("()[]")
+    parts = text.replace(";", ",").split(",") if "," in text or ";" in text else text.split()
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def format_coordinates(lat: float, lon: float) -> str:
+    return f"{lat:.4f}, {lon:.4f}"
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
@@ -0,0 +1,180 @@
+"""
+Response cache for the main itinerary generation.
+
+Requests are keyed on a normalized `ItineraryGenerate` (case, accents,
+whitespace and list order do not matter). When there is no exact match, an
+optional similarity fallback reuses a cached itinerary for the same
+destination, duration and traveler profile whose preferences are close enough
+(Jaccard similarity over the preference tokens).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from schemas.itinerary import ItineraryGenerate
+from states.itinerary import ViajeState
+from utils.cache import MemoryCache, SQLiteCache
+
+load_dotenv()
+
+
+def _normalize_text(value) -> str:
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+
+def _normalize_value(value):
+    if isinstance(value, list):
+        return sorted(_normalize_text(item) for item in value if item)
+    if isinstance(value, str):
+        return _normalize_text(value)
+    return value
+
+
+def normalize_request(itinerary_data: ItineraryGenerate) -> dict:
+    """Canonical dict of the request, ignoring case, accents, spacing and list order"""
+    data = itinerary_data.model_dump(exclude_none=True)
+    preferences = data.pop("preferences", None) or {}
+    normalized = {key: _normalize_value(value) for key, value in data.items() if value not in ("", [])}
+    normalized["preferences"] = {
+        key: _normalize_value(value) for key, value in preferences.items() if value not in (None, "", [])
+    }
+    return normalized
+
+
+def _hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def request_key(normalized: dict) -> str:
+    return _hash(normalized)
+
+
+def request_group(normalized: dict) -> str:
+    """Requests in the same group differ only in their preferences"""
+    return _hash({key: value for key, value in normalized.items() if key != "preferences"})
+
+
+def preference_tokens(normalized: dict) -> set:
+    tokens = set()
+    for key, value in normalized["preferences"].items():
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if key in ("notes", "goal"):
+                tokens.update(f"{key}:{word}" for word in str(item).split())
+            else:
+                tokens.add(f"{key}:{item}")
+    return tokens
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class ItineraryCache:
+    """Caches validated `ViajeState` results and keeps hit/miss counters"""
+
+    def __init__(self, backend, similarity_threshold: float = 0.0):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "similar_hits": 0, "misses": 0, "stores": 0}
+
+    def get(self, itinerary_data: ItineraryGenerate) -> Optional[ViajeState]:
+        normalized = normalize_request(itinerary_data)
+        key = request_key(normalized)
+
+        entry = self.backend.get(key)
+        if entry is not None:
+            self._count("hits")
+            return ViajeState.model_validate(entry["state"])
+
+        if self.similarity_threshold > 0:
+            tokens = preference_tokens(normalized)
+            best_key, best_entry, best_score = None, None, 0.0
+            for candidate_key, candidate in self.backend.items_in_group(request_group(normalized)):
+                score = jaccard(tokens, set(candidate["tokens"]))
+                if score > best_score:
+                    best_key, best_entry, best_score = candidate_key, candidate, score
+            if best_entry is not None and best_score >= self.similarity_threshold:
+                # Read through the backend so the entry is refreshed in the LRU order
+                entry = self.backend.get(best_key) or best_entry
+                self._count("similar_hits")
+                print(f"\n\nItinerary cache: similar hit ({best_score:.2f}) for {itinerary_data.trip_name}\n\n")
+                return ViajeState.model_validate(entry["state"])
+
+        self._count("misses")
+        return None
+
+    def set(self, itinerary_data: ItineraryGenerate, viaje_state: ViajeState) -> None:
+        normalized = normalize_request(itinerary_data)
+        entry = {
+            "tokens": sorted(preference_tokens(normalized)),
+            "state": viaje_state.model_dump(mode="json"),
+        }
+        self.backend.set(request_key(normalized), entry, group=request_group(normalized))
+        self._count("stores")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["similar_hits"]) / lookups, 4) if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        stats["evictions"] = self.backend.evictions
+        stats["backend"] = type(self.backend).__name__
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+def create_itinerary_cache() -> Optional[ItineraryCache]:
+    """Build the cache from the ITINERARY_CACHE_* environment variables"""
+    backend_name = os.getenv("ITINERARY_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("", "none", "off", "disabled"):
+        return None
+
+    ttl_seconds = float(os.getenv("ITINERARY_CACHE_TTL_SECONDS", "86400"))
+    max_entries = int(os.getenv("ITINERARY_CACHE_MAX_ENTRIES", "500"))
+    if backend_name == "sqlite":
+        backend = SQLiteCache(
+            os.getenv("ITINERARY_CACHE_SQLITE_PATH", ".cache/itinerary_cache.sqlite3"),
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            table="itinerary_cache",
+        )
+    else:
+        backend = MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    similarity_threshold = float(os.getenv("ITINERARY_CACHE_SIMILARITY_THRESHOLD", "0") or 0)
+    return ItineraryCache(backend, similarity_threshold=similarity_threshold)
+
+
+_itinerary_cache: Optional[ItineraryCache] = None
+_itinerary_cache_initialized = False
+_itinerary_cache_lock = threading.Lock()
+
+
+def get_itinerary_cache() -> Optional[ItineraryCache]:
+    """Return the process wide itinerary cache (None when disabled)"""
+    global _itinerary_cache, _itinerary_cache_initialized
+    with _itinerary_cache_lock:
+        if not _itinerary_cache_initialized:
+            _itinerary_cache = create_itinerary_cache()
+            _itinerary_cache_initialized = True
+    return _itinerary_cache
@@ -0,0 +1,274 @@
+"""
+Compact itinerary serialization for the chat agent prompts.
+
+The agents used to inject the Python repr of the whole itinerary on every turn.
+`compact_itinerary` writes minified JSON with short keys (plus a legend of the
+keys it used), without enrichment fields and empty values. When the result is
+over CHAT_ITINERARY_TOKEN_BUDGET, only the days referenced in the latest user
+messages (by number or by city) keep their full detail; the rest are reduced
+to their title and activity names.
+
+`build_itinerary_prompt` builds the agent prompt and keeps per-agent counters of
+the prompt size of each user turn (exposed in /api/metrics/chat-prompts). The
+ReAct loop rebuilds the prompt on every model call; only the first call of the
+turn (the one answering the user message) is recorded.
+
+`summarized_days` tells which days the model only saw summarized, so a tool can
+reject edits of a day whose activities it never saw.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from langchain_core.messages.utils import count_tokens_approximately
+
+from utils.gazetteer import normalize_name
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+CHAT_ITINERARY_TOKEN_BUDGET = int(os.getenv("CHAT_ITINERARY_TOKEN_BUDGET", "3000"))
+CHAT_FOCUS_MESSAGES = int(os.getenv("CHAT_FOCUS_MESSAGES", "4"))
+
+SHORT_KEYS = {
+    "nombre_viaje": "nv",
+    "cantidad_dias": "cd",
+    "destino_general": "dg",
+    "ruta_elegida": "re",
+    "justificacion_ruta_elegida": "jr",
+    "resumen_viaje": "rv",
+    "destinos": "d",
+    "transportes_entre_destinos": "t",
+    "itinerario_diario": "it",
+    "resumen_itinerario": "ri",
+    "recomendaciones_generales": "rg",
+    "actividades_extras": "ae",
+    "ciudad": "c",
+    "pais": "p",
+    "pais_codigo": "pc",
+    "coordenadas": "co",
+    "dias_en_destino": "dd",
+    "sugerencias_alojamiento": "sa",
+    "ciudad_origen": "o",
+    "ciudad_destino": "de",
+    "tipo_transporte": "tt",
+    "justificacion": "j",
+    "alternativas": "al",
+    "dia": "n",
+    "titulo": "ti",
+    "actividades_mañana": "am",
+    "actividades_tarde": "at",
+    "actividades_noche": "an",
+    "descripcion": "ds",
+    "horarios": "h",
+    "precio": "pr",
+    "requisitos_reserva": "rr",
+    "enlace": "l",
+    "ubicacion": "u",
+    "transporte_recomendado": "tr",
+}
+
+# Key of a summarized day: only the activity titles
+SUMMARY_KEY = "res"
+
+# Added by the enrichment stage, not useful for the conversation
+DROPPED_KEYS = {"latitud", "longitud", "direccion_completa", "imagenes"}
+
+ACTIVITY_SLOTS = ("actividades_mañana", "actividades_tarde", "actividades_noche")
+
+_DAY_REFERENCE = re.compile(r"\b(?:d[ií]as?|days?)\s+((?:\d+)(?:\s*(?:,|y|e|and|-|a|al|to)\s*\d+)*)", re.IGNORECASE)
+_DAY_RANGE = re.compile(r"(\d+)\s*(?:-|a|al|to)\s*(\d+)")
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _shorten(value, used_keys: Set[str]):
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key in DROPPED_KEYS or _is_empty(item):
+                continue
+            short = SHORT_KEYS.get(key, key)
+            if short != key:
+                used_keys.add(key)
+            compacted[short] = _shorten(item, used_keys)
+        return compacted
+    if isinstance(value, list):
+        return [_shorten(item, used_keys) for item in value if not _is_empty(item)]
+    return value
+
+
+def _summarize_day(day: dict, used_keys: Set[str]) -> dict:
+    used_keys.update(key for key in ("dia", "ciudad", "titulo") if day.get(key))
+    summary = {SHORT_KEYS[key]: day[key] for key in ("dia", "ciudad", "titulo") if day.get(key)}
+    summary[SUMMARY_KEY] = [
+        activity.get("titulo")
+        for slot in ACTIVITY_SLOTS
+        for activity in (day.get(slot) or [])
+        if activity.get("titulo")
+    ]
+    return summary
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _legend(used_keys: Set[str], summarized: bool) -> str:
+    pairs = [f"{SHORT_KEYS[key]}={key}" for key in SHORT_KEYS if key in used_keys]
+    if summarized:
+        pairs.append(f"{SUMMARY_KEY}=titulos de las actividades del dia (dia resumido)")
+    return "Claves: " + ", ".join(pairs) + ". Las herramientas usan los nombres completos y los mismos indices."
+
+
+def count_tokens(text: str) -> int:
+    return count_tokens_approximately([{"role": "system", "content": text}])
+
+
+def referenced_days(messages: Iterable, itinerary: dict, last_n: Optional[int] = None) -> Set[str]:
+    """Days (`dia` values) mentioned in the last user messages, by number or by city"""
+    days = itinerary.get("itinerario_diario") or []
+    if not days:
+        return set()
+
+    texts = []
+    for message in reversed(list(messages or [])):
+        role = getattr(message, "type", None) or (message.get("role") if isinstance(message, dict) else None)
+        if role in ("human", "user"):
+            content = getattr(message, "content", None) if not isinstance(message, dict) else message.get("content")
+            texts.append(content if isinstance(content, str) else str(content))
+        if len(texts) >= (last_n or CHAT_FOCUS_MESSAGES):
+            break
+    if not texts:
+        return set()
+
+    text = " ".join(texts)
+    numbers: Set[int] = set()
+    for match in _DAY_REFERENCE.finditer(text):
+        group = match.group(1)
+        for start, end in _DAY_RANGE.findall(group):
+            numbers.update(range(int(start), int(end) + 1))
+        numbers.update(int(number) for number in re.findall(r"\d+", group))
+
+    normalized_text = " " + normalize_name(re.sub(r"[^\w\s]", " ", text)) + " "
+    focus = set()
+    for day in days:
+        day_key = str(day.get("dia")).strip()
+        if day_key.isdigit() and int(day_key) in numbers:
+            focus.add(day_key)
+        city = normalize_name(day.get("ciudad") or "")
+        if city and f" {city} " in normalized_text:
+            focus.add(day_key)
+    return focus
+
+
+def _over_budget(full_text: str, itinerary: dict, token_budget: Optional[int]) -> bool:
+    return bool(itinerary.get("itinerario_diario")) and count_tokens(full_text) > (token_budget or CHAT_ITINERARY_TOKEN_BUDGET)
+
+
+def summarized_days(itinerary: dict, messages: Iterable, token_budget: Optional[int] = None) -> Set[str]:
+    """Days (`dia` values) that `build_itinerary_prompt` shows summarized for these messages"""
+    if not _over_budget(_dumps(_shorten(itinerary, set())), itinerary, token_budget):
+        return set()
+    all_days = {str(day.get("dia")).strip() for day in itinerary["itinerario_diario"]}
+    return all_days - referenced_days(messages, itinerary)
+
+
+def compact_itinerary(itinerary: dict, focus_days: Optional[Set[str]] = None, token_budget: Optional[int] = None) -> str:
+    """
+    Compact text of the itinerary for a system prompt.
+
+    Args:
+        itinerary: details_itinerary / ViajeState as a dict
+        focus_days: Days (`dia`) that keep their full detail when the itinerary is over budget
+        token_budget: Max approximate tokens before summarizing days (defaults to CHAT_ITINERARY_TOKEN_BUDGET)
+    """
+    used_keys: Set[str] = set()
+    full = _dumps(_shorten(itinerary, used_keys))
+    if not _over_budget(full, itinerary, token_budget):
+        return f"{_legend(used_keys, False)}\n{full}"
+
+    focus_days = focus_days or set()
+    used_keys = set()
+    windowed = _shorten({key: value for key, value in itinerary.items() if key != "itinerario_diario"}, used_keys)
+    used_keys.add("itinerario_diario")
+    windowed[SHORT_KEYS["itinerario_diario"]] = [
+        _shorten(day, used_keys) if str(day.get("dia")).strip() in focus_days else _summarize_day(day, used_keys)
+        for day in itinerary["itinerario_diario"]
+    ]
+    return f"{_legend(used_keys, True)}\n{_dumps(windowed)}"
+
+
+class PromptTokenMetrics:
+    """Approximate prompt tokens per turn of each chat agent"""
+
+    def __init__(self, window: int = 1000):
+        self._agents: Dict[str, dict] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, prompt_tokens: int, itinerary_tokens: int) -> None:
+        with self._lock:
+            stats = self._agents.setdefault(agent, {
+                "turns": 0, "total_tokens": 0, "max_tokens": 0, "last_tokens": 0,
+                "last_itinerary_tokens": 0, "recent": deque(maxlen=self._window),
+            })
+            stats["turns"] += 1
+            stats["total_tokens"] += prompt_tokens
+            stats["max_tokens"] = max(stats["max_tokens"], prompt_tokens)
+            stats["last_tokens"] = prompt_tokens
+            stats["last_itinerary_tokens"] = itinerary_tokens
+            stats["recent"].append(prompt_tokens)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for agent, stats in self._agents.items():
+                recent = sorted(stats["recent"])
+                result[agent] = {
+                    "turns": stats["turns"],
+                    "avg_tokens": round(stats["total_tokens"] / stats["turns"], 1),
+                    "p95_tokens": recent[min(len(recent) - 1, int(len(recent) * 0.95))],
+                    "max_tokens": stats["max_tokens"],
+                    "last_tokens": stats["last_tokens"],
+                    "last_itinerary_tokens": stats["last_itinerary_tokens"],
+                }
+            return result
+
+
+prompt_token_metrics = PromptTokenMetrics()
+
+
+def _is_user_turn_start(messages: List) -> bool:
+    """The last message is the user's: first model call of the turn (later calls follow a tool result)"""
+    if not messages:
+        return False
+    last = messages[-1]
+    role = getattr(last, "type", None) or (last.get("role") if isinstance(last, dict) else None)
+    return role in ("human", "user")
+
+
+def build_itinerary_prompt(agent: str, base_prompt: str, itinerary, messages: List) -> List:
+    """System message with the compact itinerary + conversation, recording the prompt size once per user turn"""
+    from utils.itinerary_patch import itinerary_to_dict
+    from utils.llm import cacheable_system_message
+
+    itinerary_dict = itinerary_to_dict(itinerary)
+    itinerary_text = compact_itinerary(itinerary_dict, referenced_days(messages, itinerary_dict))
+    # Static instructions in their own message (cacheable prefix), the itinerary changes every turn
+    prompt_messages = [
+        cacheable_system_message(base_prompt, "chat"),
+        {"role": "system", "content": f"El itinerario actual es:\n{itinerary_text}"},
+    ] + list(messages)
+
+    if _is_user_turn_start(messages):
+        prompt_token_metrics.record(agent, count_tokens_approximately(prompt_messages), count_tokens(itinerary_text))
+
+    return prompt_messages
@@ -0,0 +1,139 @@
+"""
+Server-side application of partial itinerary edits made by the chat agents.
+
+Instead of re-emitting the whole `ViajeState`, the agents send either JSON
+Patch operations (RFC 6902) or the full content of only the days they changed.
+The edit is applied to a copy of the current itinerary and the result is
+validated before it is accepted, so a bad edit never replaces a good itinerary.
+"""
+
+import copy
+from typing import Any, Dict, Iterable, List, Optional
+
+import jsonpatch
+from pydantic import BaseModel, ValidationError
+
+from states.daily_activities import ActivityItineraryOutput, DailyItineraryOutput
+from states.itinerary import ViajeState
+
+ACTIVITY_SLOTS = ("actividades_mañana", "actividades_tarde", "actividades_noche")
+
+# Paths the activities agent may touch (the route is already confirmed)
+DAILY_ITINERARY_PATH = "/itinerario_diario"
+
+
+class ItineraryPatchError(ValueError):
+    """The edit cannot be applied or leaves the itinerary invalid"""
+
+
+def itinerary_to_dict(itinerary) -> Dict[str, Any]:
+    """Copy of the agent state itinerary (a ViajeState or the stored dict) as plain JSON"""
+    if isinstance(itinerary, BaseModel):
+        return itinerary.model_dump(mode="json")
+    return copy.deepcopy(dict(itinerary or {}))
+
+
+def apply_itinerary_patch(itinerary, operations: Iterable[dict], allowed_prefixes: Optional[List[str]] = None) -> ViajeState:
+    """
+    Apply JSON Patch operations to a copy of the itinerary and validate the result.
+
+    Args:
+        itinerary: Current itinerary (ViajeState or dict)
+        operations: JSON Patch operations, e.g. {"op": "replace", "path": "/destinos/1/dias_en_destino", "value": 3}
+        allowed_prefixes: If given, every operation path must start with one of them
+
+    Raises:
+        ItineraryPatchError: If an operation is out of scope, cannot be applied or the result is invalid
+    """
+    operations = [dict(operation) for operation in operations]
+    if not operations:
+        raise ItineraryPatchError("No operations to apply")
+
+    if allowed_prefixes:
+        for operation in operations:
+            for path in (operation.get("path"), operation.get("from")):
+                if path is not None and not any(path == prefix or path.startswith(prefix + "/") for prefix in allowed_prefixes):
+                    raise ItineraryPatchError(f"Path '{path}' is not allowed (allowed: {', '.join(allowed_prefixes)})")
+
+    try:
+        patched = jsonpatch.apply_patch(itinerary_to_dict(itinerary), operations)
+    except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException, TypeError, KeyError) as e:
+        raise ItineraryPatchError(f"Could not apply patch: {e}") from e
+
+    for index, day in enumerate(patched.get("itinerario_diario") or []):
+        _validate_day(day, f"itinerario_diario[{index}]")
+
+    try:
+        return ViajeState.model_validate(patched)
+    except ValidationError as e:
+        raise ItineraryPatchError(f"Patched itinerary is invalid: {e}") from e
+
+
+def replace_itinerary_days(itinerary, days: Iterable, keep_cities: bool = True) -> ViajeState:
+    """
+    Replace whole days of `itinerario_diario`, matched by their `dia` number.
+
+    Enrichment fields (coordinates, images) of activities that keep the same
+    title are carried over from the previous version of the day.
+
+    Args:
+        itinerary: Current itinerary (ViajeState or dict)
+        days: New content of each changed day (DailyItineraryOutput or dict)
+        keep_cities: Reject days whose city differs from the current one
+
+    Raises:
+        ItineraryPatchError: If a day does not exist, changes city or is invalid
+    """
+    itinerary_dict = itinerary_to_dict(itinerary)
+    daily = itinerary_dict.get("itinerario_diario") or []
+    positions = {str(day.get("dia")).strip(): index for index, day in enumerate(daily)}
+
+    new_days = [day.model_dump(mode="json") if isinstance(day, BaseModel) else dict(day) for day in days]
+    if not new_days:
+        raise ItineraryPatchError("No days to replace")
+
+    for new_day in new_days:
+        _validate_day(new_day, f"dia {new_day.get('dia')}")
+        key = str(new_day["dia"]).strip()
+        if key not in positions:
+            raise ItineraryPatchError(f"Day {key} does not exist in the itinerary")
+
+        current = daily[positions[key]]
+        if keep_cities and current.get("ciudad") and current["ciudad"] != new_day["ciudad"]:
+            raise ItineraryPatchError(
+                f"Day {key} belongs to {current['ciudad']}, it cannot be moved to {new_day['ciudad']}"
+            )
+        daily[positions[key]] = _carry_over_enrichment(current, new_day)
+
+    itinerary_dict["itinerario_diario"] = daily
+    try:
+        return ViajeState.model_validate(itinerary_dict)
+    except ValidationError as e:
+        raise ItineraryPatchError(f"Updated itinerary is invalid: {e}") from e
+
+
+def _validate_day(day: dict, label: str) -> None:
+    try:
+        DailyItineraryOutput.model_validate(day)
+    except ValidationError as e:
+        raise ItineraryPatchError(f"{label} is invalid: {e}") from e
+
+
+def _carry_over_enrichment(current: dict, new_day: dict) -> dict:
+    """Keep the extra fields of unchanged activities (same title) from the current day"""
+    known_fields = set(ActivityItineraryOutput.model_fields)
+    previous = {
+        activity.get("titulo"): activity
+        for slot in ACTIVITY_SLOTS
+        for activity in (current.get(slot) or [])
+    }
+
+    merged = {**new_day}
+    for slot in ACTIVITY_SLOTS:
+        activities = []
+        for activity in new_day.get(slot) or []:
+            old = previous.get(activity.get("titulo")) or {}
+            extra = {key: value for key, value in old.items() if key not in known_fields}
+            activities.append({**extra, **activity})
+        merged[slot] = activities
+    return merged
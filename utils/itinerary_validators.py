@@ -3,8 +3,29 @@ Utilidades de validación para itinerarios generados por IA.
 Asegura que los datos cumplan con las reglas de negocio.
 """
 
-from typing import List, Optional
-from states.itinerary import ViajeState, TransporteEntreDestinosState, DestinoState, TrasnportEnum
+import os
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from states.itinerary import ViajeState, TransporteEntreDestinosState, DestinoState, TrasnportEnum, DestinosRepairState
+from utils.gazetteer import (
+    country_code_for,
+    country_name,
+    find_cities,
+    format_coordinates,
+    haversine_km,
+    is_valid_country_code,
+    normalize_name,
+    parse_coordinates,
+)
+
+load_dotenv()
+
+# Distancia maxima (km) entre las coordenadas generadas y las del gazetteer antes de reemplazarlas
+ITINERARY_MAX_COORDINATE_DISTANCE_KM = float(os.getenv("ITINERARY_MAX_COORDINATE_DISTANCE_KM", "100"))
+# Re-preguntar a la IA solo por los campos que no se pudieron corregir localmente
+ITINERARY_LLM_REPAIR_ENABLED = os.getenv("ITINERARY_LLM_REPAIR_ENABLED", "true").lower() in ("1", "true", "yes")
 
 
 def validate_transportes_secuenciales(viaje_state: ViajeState) -> tuple[bool, List[str]]:
@@ -93,7 +114,8 @@ def auto_fix_transportes_secuenciales(viaje_state: ViajeState) -> tuple[ViajeSta
         return viaje_state, hubo_cambios
     
     transportes_corregidos = []
-    hubo_cambios = False
+    # Sobrantes o faltantes tambien son un cambio, aunque los que quedan ya fueran correctos
+    hubo_cambios = len(transportes_originales) != len(destinos) - 1
     
     for i in range(len(destinos) - 1):
         origen = destinos[i]
@@ -156,15 +178,258 @@ def auto_fix_transportes_secuenciales(viaje_state: ViajeState) -> tuple[ViajeSta
     return viaje_state, hubo_cambios
 
 
-def validate_and_fix_itinerary(viaje_state: ViajeState) -> ViajeState:
+def fix_destinos_duplicados(viaje_state: ViajeState) -> tuple[ViajeState, List[str]]:
+    """
+    Une los destinos consecutivos que repiten la misma ciudad.
+
+    Los dias de estadia se suman en el primero y se quita el transporte entre
+    las dos estadias (una ciudad hacia si misma). Una ciudad que vuelve a
+    aparecer mas adelante (ej. volver a la ciudad de llegada) es valida y solo
+    se informa.
+
+    Returns:
+        tuple[ViajeState, List[str]]: (viaje_corregido, cambios_realizados)
+    """
+    cambios = []
+    destinos_unidos: List[DestinoState] = []
+    ciudades_unidas: Set[str] = set()
+
+    for destino in viaje_state.destinos or []:
+        anterior = destinos_unidos[-1] if destinos_unidos else None
+        if anterior and normalize_name(anterior.ciudad) == normalize_name(destino.ciudad):
+            anterior.dias_en_destino += destino.dias_en_destino
+            ciudades_unidas.add(normalize_name(destino.ciudad))
+            cambios.append(f"🔧 Destino duplicado '{destino.ciudad}' unido al anterior ({anterior.dias_en_destino} días)")
+            continue
+        destinos_unidos.append(destino)
+
+    if ciudades_unidas and viaje_state.transportes_entre_destinos:
+        transportes = [
+            t for t in viaje_state.transportes_entre_destinos
+            if not (normalize_name(t.ciudad_origen) == normalize_name(t.ciudad_destino) and normalize_name(t.ciudad_origen) in ciudades_unidas)
+        ]
+        quitados = len(viaje_state.transportes_entre_destinos) - len(transportes)
+        if quitados:
+            cambios.append(f"🔧 Eliminados {quitados} transporte(s) entre destinos duplicados unidos")
+        viaje_state.transportes_entre_destinos = transportes
+
+    vistos = set()
+    for destino in destinos_unidos:
+        clave = normalize_name(destino.ciudad)
+        if clave in vistos:
+            print(f"ℹ️ La ciudad '{destino.ciudad}' aparece más de una vez en la ruta (no consecutiva)")
+        vistos.add(clave)
+
+    viaje_state.destinos = destinos_unidos
+    return viaje_state, cambios
+
+
+def fix_suma_dias(viaje_state: ViajeState, cantidad_dias_esperada: Optional[int] = None) -> tuple[ViajeState, List[str]]:
+    """
+    Reconcilia la suma de `dias_en_destino` con la duracion total del viaje.
+
+    Cada destino conserva al menos 1 dia. Los dias que sobran se quitan de las
+    estadias mas largas y los que faltan se agregan a las estadias mas largas,
+    de a uno, para respetar la distribucion que eligio la IA.
+
+    Args:
+        viaje_state: Estado del viaje a corregir
+        cantidad_dias_esperada: Duracion pedida por el usuario (si no se indica se usa `cantidad_dias`)
+
+    Returns:
+        tuple[ViajeState, List[str]]: (viaje_corregido, cambios_realizados)
+
+    Raises:
+        ValueError: Si hay mas destinos que dias disponibles
+    """
+    cambios = []
+    destinos = viaje_state.destinos or []
+    total_esperado = cantidad_dias_esperada or viaje_state.cantidad_dias
+
+    if viaje_state.cantidad_dias != total_esperado:
+        cambios.append(f"🔧 cantidad_dias {viaje_state.cantidad_dias} → {total_esperado}")
+        viaje_state.cantidad_dias = total_esperado
+
+    if not destinos:
+        return viaje_state, cambios
+
+    if len(destinos) > total_esperado:
+        raise ValueError(
+            f"❌ ERROR DE DÍAS: Hay {len(destinos)} destinos para un viaje de {total_esperado} días"
+        )
+
+    for destino in destinos:
+        if destino.dias_en_destino < 1:
+            cambios.append(f"🔧 {destino.ciudad}: dias_en_destino {destino.dias_en_destino} → 1")
+            destino.dias_en_destino = 1
+
+    diferencia = total_esperado - sum(destino.dias_en_destino for destino in destinos)
+    if diferencia == 0:
+        return viaje_state, cambios
+
+    dias_originales = [destino.dias_en_destino for destino in destinos]
+    while diferencia != 0:
+        paso = 1 if diferencia > 0 else -1
+        candidatos = [destino for destino in destinos if paso > 0 or destino.dias_en_destino > 1]
+        # Estadia mas larga primero; ante empate, el primer destino de la ruta
+        destino = max(candidatos, key=lambda d: d.dias_en_destino)
+        destino.dias_en_destino += paso
+        diferencia -= paso
+
+    for destino, dias in zip(destinos, dias_originales):
+        if destino.dias_en_destino != dias:
+            cambios.append(f"🔧 {destino.ciudad}: dias_en_destino {dias} → {destino.dias_en_destino}")
+
+    return viaje_state, cambios
+
+
+def fix_paises(viaje_state: ViajeState) -> tuple[ViajeState, List[str], Dict[int, Set[str]]]:
+    """
+    Valida `pais_codigo` contra ISO 3166-1 alpha-2 y lo corrige con el gazetteer.
+
+    El codigo esperado sale de la ciudad (si esta en el gazetteer) o del nombre
+    del pais. Si no hay forma de deducirlo y el codigo es invalido, el campo
+    queda pendiente para la re-consulta a la IA.
+
+    Returns:
+        tuple[ViajeState, List[str], Dict[int, Set[str]]]: (viaje_corregido, cambios_realizados, campos_pendientes)
+    """
+    cambios = []
+    pendientes: Dict[int, Set[str]] = {}
+
+    for i, destino in enumerate(viaje_state.destinos or []):
+        codigo = (destino.pais_codigo or "").strip().upper()
+        codigo_por_nombre = country_code_for(destino.pais)
+        ciudades = find_cities(destino.ciudad)
+
+        ciudad = next((c for c in ciudades if c["country"] == codigo_por_nombre), None)
+        ciudad = ciudad or next((c for c in ciudades if c["country"] == codigo), None)
+        if ciudad is None and len(ciudades) == 1:
+            ciudad = ciudades[0]
+
+        esperado = ciudad["country"] if ciudad else codigo_por_nombre
+
+        if esperado is None:
+            if is_valid_country_code(codigo):
+                destino.pais_codigo = codigo
+            else:
+                pendientes.setdefault(i, set()).add("pais_codigo")
+            continue
+
+        if destino.pais_codigo != esperado:
+            cambios.append(f"🔧 {destino.ciudad}: pais_codigo '{destino.pais_codigo}' → '{esperado}'")
+            destino.pais_codigo = esperado
+        if codigo_por_nombre and codigo_por_nombre != esperado:
+            cambios.append(f"🔧 {destino.ciudad}: pais '{destino.pais}' → '{country_name(esperado)}'")
+            destino.pais = country_name(esperado)
+
+    return viaje_state, cambios, pendientes
+
+
+def fix_coordenadas(viaje_state: ViajeState) -> tuple[ViajeState, List[str], Dict[int, Set[str]]]:
+    """
+    Verifica que las coordenadas sean validas y esten cerca de la ciudad.
+
+    Si la ciudad esta en el gazetteer, coordenadas invalidas o a mas de
+    ITINERARY_MAX_COORDINATE_DISTANCE_KM se reemplazan por las del gazetteer.
+    Si no esta y las coordenadas son invalidas, el campo queda pendiente.
+
+    Returns:
+        tuple[ViajeState, List[str], Dict[int, Set[str]]]: (viaje_corregido, cambios_realizados, campos_pendientes)
+    """
+    cambios = []
+    pendientes: Dict[int, Set[str]] = {}
+
+    for i, destino in enumerate(viaje_state.destinos or []):
+        coordenadas = parse_coordinates(destino.coordenadas)
+        ciudad = next((c for c in find_cities(destino.ciudad) if c["country"] == destino.pais_codigo), None)
+
+        if ciudad is None:
+            if coordenadas is None:
+                pendientes.setdefault(i, set()).add("coordenadas")
+            continue
+
+        referencia = (ciudad["lat"], ciudad["lon"])
+        if coordenadas is None or haversine_km(coordenadas, referencia) > ITINERARY_MAX_COORDINATE_DISTANCE_KM:
+            nuevas = format_coordinates(*referencia)
+            cambios.append(f"🔧 {destino.ciudad}: coordenadas '{destino.coordenadas}' → '{nuevas}'")
+            destino.coordenadas = nuevas
+
+    return viaje_state, cambios, pendientes
+
+
+def repair_campos_con_llm(viaje_state: ViajeState, pendientes: Dict[int, Set[str]]) -> List[str]:
+    """
+    Re-pregunta a la IA solo por los campos que no se pudieron corregir localmente.
+
+    Se envian unicamente la ciudad y el pais de cada destino roto, y se usa el
+    modelo economico, en lugar de regenerar el itinerario completo. Las
+    respuestas se validan con las mismas reglas antes de aplicarse.
+
+    Returns:
+        List[str]: cambios_realizados
+    """
+    if not pendientes or not ITINERARY_LLM_REPAIR_ENABLED:
+        return []
+
+    from utils.llm import get_llm
+
+    print(f"🤖 Re-consultando a la IA solo por {sum(len(c) for c in pendientes.values())} campo(s) pendiente(s)...")
+    destinos = viaje_state.destinos or []
+    lineas = [
+        f"- indice {i}: {destinos[i].ciudad}, {destinos[i].pais} → corregir: {', '.join(sorted(campos))}"
+        for i, campos in sorted(pendientes.items())
+    ]
+    prompt = (
+        "Corrige solo los campos indicados de estos destinos de viaje.\n"
+        "- pais_codigo: codigo ISO 3166-1 alpha-2 del pais (ej. 'AR', 'ES')\n"
+        "- coordenadas: centro de la ciudad en formato 'latitud, longitud' con 4 decimales\n"
+        "Devuelve un elemento por destino con su mismo indice y deja en null los campos no pedidos.\n\n"
+        + "\n".join(lineas)
+    )
+
+    try:
+        respuesta = get_llm("cheap").with_structured_output(DestinosRepairState).invoke(prompt)
+    except Exception as e:
+        print(f"⚠️ No se pudo re-consultar a la IA por los campos pendientes: {e}")
+        return []
+
+    cambios = []
+    for reparado in respuesta.destinos:
+        campos = pendientes.get(reparado.indice)
+        if not campos:
+            continue
+        destino = destinos[reparado.indice]
+        if "pais_codigo" in campos and is_valid_country_code(reparado.pais_codigo):
+            cambios.append(f"🤖 {destino.ciudad}: pais_codigo '{destino.pais_codigo}' → '{reparado.pais_codigo.upper()}'")
+            destino.pais_codigo = reparado.pais_codigo.upper()
+        coordenadas = parse_coordinates(reparado.coordenadas)
+        if "coordenadas" in campos and coordenadas is not None:
+            cambios.append(f"🤖 {destino.ciudad}: coordenadas '{destino.coordenadas}' → '{format_coordinates(*coordenadas)}'")
+            destino.coordenadas = format_coordinates(*coordenadas)
+
+    return cambios
+
+
+def validate_and_fix_itinerary(viaje_state: ViajeState, cantidad_dias_esperada: Optional[int] = None, reparar_con_llm: bool = True) -> ViajeState:
     """
     Función principal que valida y corrige automáticamente un itinerario.
     
     Esta función debe ser llamada después de que la IA genere un itinerario,
     antes de guardarlo en la base de datos.
+
+    Las reglas se aplican en orden y corrigen localmente, sin invocar a la IA:
+    1. Destinos duplicados consecutivos
+    2. Suma de días por destino vs duración del viaje
+    3. Códigos de país ISO 3166-1 alpha-2
+    4. Coordenadas válidas y cercanas a la ciudad (gazetteer offline)
+    5. Transportes secuenciales
+    Solo los campos que no se pueden deducir localmente se re-preguntan a la IA.
     
     Args:
         viaje_state: Estado del viaje generado por la IA
+        cantidad_dias_esperada: Duración pedida por el usuario
+        reparar_con_llm: Re-preguntar a la IA por los campos que no se pueden corregir localmente
         
     Returns:
         ViajeState: Viaje validado y corregido si fue necesario
@@ -175,7 +440,29 @@ def validate_and_fix_itinerary(viaje_state: ViajeState) -> ViajeState:
     print("\n" + "="*80)
     print("🔍 INICIANDO VALIDACIÓN DE ITINERARIO")
     print("="*80)
-    
+
+    cambios = []
+
+    viaje_state, cambios_destinos = fix_destinos_duplicados(viaje_state)
+    cambios += cambios_destinos
+
+    viaje_state, cambios_dias = fix_suma_dias(viaje_state, cantidad_dias_esperada)
+    cambios += cambios_dias
+
+    viaje_state, cambios_paises, pendientes = fix_paises(viaje_state)
+    cambios += cambios_paises
+
+    viaje_state, cambios_coordenadas, pendientes_coordenadas = fix_coordenadas(viaje_state)
+    cambios += cambios_coordenadas
+    for i, campos in pendientes_coordenadas.items():
+        pendientes.setdefault(i, set()).update(campos)
+
+    if reparar_con_llm:
+        cambios += repair_campos_con_llm(viaje_state, pendientes)
+
+    for cambio in cambios:
+        print(f"   {cambio}")
+
     # Validar transportes secuenciales
     es_valido, errores = validate_transportes_secuenciales(viaje_state)
     
@@ -205,6 +492,24 @@ def validate_and_fix_itinerary(viaje_state: ViajeState) -> ViajeState:
     return viaje_state_corregido
 
 
+def validate_city_daily_itinerary(itinerario_diario: list, dias_esperados: int, ciudad: str) -> None:
+    """
+    Valida la estructura del itinerario diario generado para una ciudad.
+
+    Los días sobrantes se descartan al unir las ciudades, pero faltar días o
+    tener días sin actividades no se puede corregir localmente.
+
+    Raises:
+        ValueError: Si faltan días o algún día no tiene actividades
+    """
+    if len(itinerario_diario) < dias_esperados:
+        raise ValueError(f"{ciudad}: se esperaban {dias_esperados} días y se generaron {len(itinerario_diario)}")
+
+    for numero, dia in enumerate(itinerario_diario[:dias_esperados], start=1):
+        if not (dia.actividades_mañana or dia.actividades_tarde or dia.actividades_noche):
+            raise ValueError(f"{ciudad}: el día {numero} no tiene actividades")
+
+
 # Función de utilidad para logging detallado
 def log_itinerary_structure(viaje_state: ViajeState):
     """Imprime la estructura del itinerario para debugging"""
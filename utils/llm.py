@@ -1,23 +1,240 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
+"""
+Central registry of chat models.
+
+Models are built lazily the first time a profile is requested and then reused,
+so importing a graph does not open connections. The models of a provider share
+one pooled client: OpenAI and Anthropic models one httpx pool (sync and async),
+Gemini models one gRPC channel. Every model gets the same timeout and retry
+settings. Tests can swap any profile for a fake model with `override_llm`.
+
+Static prompt prefixes should be sent with `cacheable_system_message` as the
+first message, so the provider can reuse its prompt cache (OpenAI and Gemini
+cache repeated prefixes automatically, Anthropic needs an explicit breakpoint).
+Every model reports its cached / uncached input tokens to `utils.llm_usage`.
+
+    from utils.llm import get_llm
+    get_llm("main").invoke(...)
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from functools import cached_property
+from typing import Any, Dict, Optional
+
+import httpx
 from dotenv import load_dotenv
 load_dotenv()
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-pro",
-    temperature=0.4,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
-
-# llm = ChatOpenAI(model="gpt-5")
-# llm_cheap = ChatOpenAI(model="gpt-5-mini")
-
-llm_cheap = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.4,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
\ No newline at end of file
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_PROMPT_CACHE_ENABLED = os.getenv("LLM_PROMPT_CACHE_ENABLED", "true").lower() == "true"
+LLM_ANTHROPIC_MAX_TOKENS = int(os.getenv("LLM_ANTHROPIC_MAX_TOKENS", "16000"))
+
+# Model profiles used across the app. The model name of a profile can be
+# overridden with LLM_<PROFILE>_MODEL (e.g. LLM_MAIN_MODEL=gemini-2.5-flash)
+# and its provider with LLM_<PROFILE>_PROVIDER (google_genai, openai, anthropic)
+LLM_PROFILES: Dict[str, Dict[str, Any]] = {
+    "main": {"provider": "google_genai", "model": "gemini-2.5-pro", "temperature": 0.4},
+    "cheap": {"provider": "google_genai", "model": "gemini-2.5-flash", "temperature": 0.4},
+    "chat": {"provider": "openai", "model": "gpt-4o"},
+    "openai_mini": {"provider": "openai", "model": "gpt-5-mini"},
+    "openai_fast": {"provider": "openai", "model": "gpt-4o-mini"},
+}
+
+WEB_SEARCH_MODEL = os.getenv("WEB_SEARCH_MODEL", "gpt-5-mini")
+
+
+_models: Dict[str, Any] = {}
+_overrides: Dict[str, Any] = {}
+_http_clients: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def _pool_settings():
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+    return limits, timeout
+
+
+def _openai_http_clients():
+    """Pooled httpx clients shared by every OpenAI model and the raw OpenAI client"""
+    with _lock:
+        if "openai" not in _http_clients:
+            from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+            limits, timeout = _pool_settings()
+            _http_clients["openai"] = DefaultHttpxClient(limits=limits, timeout=timeout)
+            _http_clients["openai_async"] = DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+        return _http_clients["openai"], _http_clients["openai_async"]
+
+
+def _anthropic_http_clients():
+    """Pooled httpx clients shared by every Anthropic model"""
+    with _lock:
+        if "anthropic" not in _http_clients:
+            from anthropic import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+            limits, timeout = _pool_settings()
+            _http_clients["anthropic"] = DefaultHttpxClient(limits=limits, timeout=timeout)
+            _http_clients["anthropic_async"] = DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+        return _http_clients["anthropic"], _http_clients["anthropic_async"]
+
+
+def _google_genai_client(model):
+    """Generative service client (one gRPC channel) shared by every Gemini model.
+
+    Built from the credentials of the first model. The async client stays per
+    model: gRPC asyncio channels are bound to the event loop that created them.
+    """
+    with _lock:
+        if "google_genai" not in _http_clients:
+            from langchain_google_genai import _genai_extension as genaix
+
+            api_key = model.google_api_key.get_secret_value() if model.google_api_key and not model.credentials else None
+            _http_clients["google_genai"] = genaix.build_generative_service(
+                credentials=model.credentials,
+                api_key=api_key,
+                client_options=model.client_options,
+                transport=model.transport,
+            )
+        return _http_clients["google_genai"]
+
+
+def get_llm_provider(profile: str) -> str:
+    try:
+        return os.getenv(f"LLM_{profile.upper()}_PROVIDER", LLM_PROFILES[profile]["provider"])
+    except KeyError:
+        raise ValueError(f"Unknown LLM profile: {profile}")
+
+
+def _build_llm(profile: str):
+    from utils.llm_usage import llm_usage_callback
+
+    provider = get_llm_provider(profile)
+    config = dict(LLM_PROFILES[profile])
+    config.pop("provider")
+    config["model"] = os.getenv(f"LLM_{profile.upper()}_MODEL", config["model"])
+    config["callbacks"] = [llm_usage_callback]
+
+    if provider == "google_genai":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        model = ChatGoogleGenerativeAI(
+            max_tokens=None,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+            **config,
+        )
+        model.client = _google_genai_client(model)
+        return model
+
+    if provider == "anthropic":
+        import anthropic
+        from langchain_anthropic import ChatAnthropic
+        http_client, http_async_client = _anthropic_http_clients()
+
+        class PooledChatAnthropic(ChatAnthropic):
+            """ChatAnthropic on the shared connection pool"""
+
+            @cached_property
+            def _client(self):
+                return anthropic.Client(**self._client_params, http_client=http_client)
+
+            @cached_property
+            def _async_client(self):
+                return anthropic.AsyncClient(**self._client_params, http_client=http_async_client)
+
+        return PooledChatAnthropic(
+            max_tokens=LLM_ANTHROPIC_MAX_TOKENS,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+            **config,
+        )
+
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = _openai_http_clients()
+        return ChatOpenAI(
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **config,
+        )
+
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def get_llm(profile: str = "main"):
+    """Return the (cached) chat model of a profile, building it on first use"""
+    with _lock:
+        if profile in _overrides:
+            return _overrides[profile]
+        if profile not in _models:
+            _models[profile] = _build_llm(profile)
+        return _models[profile]
+
+
+def cacheable_system_message(content: str, profile: str = "main"):
+    """
+    System message for a static prompt prefix (instructions that do not depend on the request).
+
+    It must be the first message and byte-identical across calls; request data goes
+    in later messages. Anthropic only caches up to an explicit `cache_control`
+    breakpoint, the other providers cache the prefix on their own.
+    """
+    from langchain_core.messages import SystemMessage
+
+    if LLM_PROMPT_CACHE_ENABLED and get_llm_provider(profile) == "anthropic":
+        return SystemMessage(content=[{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}])
+    return SystemMessage(content=content)
+
+
+def get_openai_client():
+    """Raw OpenAI client (Responses API) on the shared connection pool"""
+    with _lock:
+        if "openai_client" not in _http_clients:
+            from openai import OpenAI
+            http_client, _ = _openai_http_clients()
+            _http_clients["openai_client"] = OpenAI(http_client=http_client, max_retries=LLM_MAX_RETRIES)
+        return _http_clients["openai_client"]
+
+
+def set_llm(profile: str, model) -> None:
+    """Replace the model of a profile (e.g. with a fake chat model in tests)"""
+    with _lock:
+        _overrides[profile] = model
+
+
+@contextmanager
+def override_llm(profile: str, model):
+    """Temporarily replace the model of a profile"""
+    with _lock:
+        previous = _overrides.get(profile)
+        _overrides[profile] = model
+    try:
+        yield model
+    finally:
+        with _lock:
+            if previous is None:
+                _overrides.pop(profile, None)
+            else:
+                _overrides[profile] = previous
+
+
+def reset_llms() -> None:
+    """Drop cached models and overrides (next `get_llm` builds them again)"""
+    with _lock:
+        _models.clear()
+        _overrides.clear()
+
+
+def __getattr__(name: str):
+    # Backwards compatibility: `from utils.llm import llm, llm_cheap`
+    if name == "llm":
+        return get_llm("main")
+    if name == "llm_cheap":
+        return get_llm("cheap")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
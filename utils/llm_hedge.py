@@ -0,0 +1,410 @@
+"""
+Deadlines, hedged requests and circuit breakers for the LLM calls.
+
+`hedged_invoke` runs a call with the model of a profile under a hard deadline.
+If it has not answered after the p95 latency of that profile (or
+LLM_HEDGE_DELAY_SECONDS until there are enough samples), the same call is
+fired with the fallback profile on another provider, and the first success
+wins. A primary failure fires the fallback right away.
+
+Each provider has a circuit breaker: after LLM_BREAKER_FAILURES consecutive
+failures its calls go straight to the fallback for LLM_BREAKER_RESET_SECONDS,
+then one trial call decides whether it closes again.
+
+Models come from `utils.llm.get_llm`, so the behaviour can be tested with fake
+chat models:
+
+    with override_llm("main", SlowFakeModel()), override_llm("openai_mini", FakeModel()):
+        result, model = hedged_invoke("main", lambda model: model.invoke("hola"))
+
+`ahedged_invoke` is the same for async callers (`lambda model: model.ainvoke(...)`):
+the calls are tasks of the event loop instead of executor threads.
+
+Inside `call`, `serving_profile()` is the profile of the model making that
+request (the primary or the fallback), e.g. to build provider specific messages.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.llm import get_llm, get_llm_provider
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "150"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "60"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_WORKERS = int(os.getenv("LLM_HEDGE_MAX_WORKERS", "16"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "60"))
+
+# Profile fired as hedge / fallback of each profile (on a different provider).
+# Override with LLM_<PROFILE>_FALLBACK, or set it to "none" to disable.
+LLM_FALLBACK_PROFILES: Dict[str, str] = {
+    "main": "openai_mini",
+    "cheap": "openai_fast",
+}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """No model answered before the deadline of the call"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker of one provider (closed -> open -> half open)"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """The call let through by `allow` never ran (cancelled before it started)"""
+        with self._lock:
+            self.trial_running = False
+
+
+class HedgeMetrics:
+    """Latencies per profile and counters of hedged calls"""
+
+    def __init__(self, window: int = 500):
+        self._latencies: Dict[str, deque] = {}
+        self._counters: Dict[str, int] = {"calls": 0, "hedged": 0, "fallback_wins": 0, "deadline_exceeded": 0, "breaker_skips": 0}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record_latency(self, profile: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(profile, deque(maxlen=self._window)).append(seconds)
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def p95(self, profile: str) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(profile) or [])
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            profiles = list(self._latencies)
+        return {
+            **counters,
+            "p95_latency_seconds": {profile: self.p95(profile) for profile in profiles},
+        }
+
+
+hedge_metrics = HedgeMetrics()
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge")
+_serving_profile: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_serving_profile", default=None)
+
+
+def serving_profile() -> Optional[str]:
+    """Profile of the model serving the current hedged call (None outside of one)"""
+    return _serving_profile.get()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        return _breakers[provider]
+
+
+def breaker_states() -> Dict[str, dict]:
+    with _breakers_lock:
+        return {provider: {"state": breaker.state, "failures": breaker.failures} for provider, breaker in _breakers.items()}
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def get_fallback_profile(profile: str) -> Optional[str]:
+    fallback = os.getenv(f"LLM_{profile.upper()}_FALLBACK", LLM_FALLBACK_PROFILES.get(profile))
+    if not fallback or fallback.lower() == "none" or fallback == profile:
+        return None
+    return fallback
+
+
+def _hedge_delay(profile: str) -> float:
+    return hedge_metrics.p95(profile) or LLM_HEDGE_DELAY_SECONDS
+
+
+def _next_allowed(pending_profiles: list) -> Optional[str]:
+    """Pop the next profile whose provider breaker lets the call through"""
+    while pending_profiles:
+        candidate = pending_profiles.pop(0)
+        if get_breaker(get_llm_provider(candidate)).allow():
+            return candidate
+        hedge_metrics.increment("breaker_skips")
+    return None
+
+
+class _HedgedCall:
+    """One submitted call: its outcome goes to the provider breaker unless the call was abandoned"""
+
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.provider = get_llm_provider(profile)
+        self.finished = False
+        self.abandoned = False
+        self._lock = threading.Lock()
+
+    def finish(self, success: bool) -> None:
+        with self._lock:
+            self.finished = True
+            if self.abandoned:
+                return
+        if success:
+            get_breaker(self.provider).record_success()
+        else:
+            get_breaker(self.provider).record_failure()
+
+    def abandon(self) -> bool:
+        """Stop waiting for the call; True if it was still running (a miss of its provider)"""
+        with self._lock:
+            if self.finished:
+                return False
+            self.abandoned = True
+            return True
+
+
+def _first_candidate(profile: str) -> Tuple[str, list]:
+    """Profile of the first call and the profiles left to hedge with"""
+    fallback = get_fallback_profile(profile) if LLM_HEDGE_ENABLED else None
+    candidates = [profile] + ([fallback] if fallback else [])
+
+    pending_profiles = list(candidates)
+    # If every provider has an open breaker, the last candidate is tried anyway
+    return _next_allowed(pending_profiles) or candidates[-1], pending_profiles
+
+
+def _submit(profile: str, call: Callable[[Any], Any]):
+    model = get_llm(profile)
+    hedged_call = _HedgedCall(profile)
+    context = contextvars.copy_context()  # keep the LangChain / LangGraph run context in the worker thread
+
+    def run():
+        _serving_profile.set(profile)  # Runs in its own copy of the context
+        start = time.perf_counter()
+        try:
+            result = call(model)
+        except Exception:
+            hedged_call.finish(success=False)
+            raise
+        hedge_metrics.record_latency(profile, time.perf_counter() - start)
+        hedged_call.finish(success=True)
+        return result, model
+
+    return _executor.submit(context.run, run), hedged_call
+
+
+def hedged_invoke(profile: str, call: Callable[[Any], Any], deadline_seconds: Optional[float] = None) -> Tuple[Any, Any]:
+    """
+    Run `call(model)` with the model of `profile`, hedging with its fallback profile.
+
+    Args:
+        profile: LLM profile of the primary call
+        call: Receives a chat model and makes the request (e.g. `lambda model: model.invoke(prompt)`)
+        deadline_seconds: Hard limit for the whole call (defaults to LLM_CALL_DEADLINE_SECONDS)
+
+    Returns:
+        (result, model) of the first call that succeeded
+
+    Raises:
+        LLMDeadlineExceeded: If no call finished before the deadline
+        Exception: The error of the last failed call when every candidate failed
+    """
+    hedge_metrics.increment("calls")
+    deadline = time.monotonic() + (deadline_seconds or LLM_CALL_DEADLINE_SECONDS)
+
+    first, pending_profiles = _first_candidate(profile)
+    future, hedged_call = _submit(first, call)
+    futures = {future: hedged_call}
+    hedge_at = time.monotonic() + _hedge_delay(first)
+
+    last_error: Optional[BaseException] = None
+    while futures:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        timeout = deadline - now
+        if pending_profiles:
+            timeout = max(0.0, min(timeout, hedge_at - now))
+
+        done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            candidate = futures.pop(future).profile
+            try:
+                result, model = future.result()
+            except Exception as e:
+                print(f"⚠️ LLM {candidate} falló: {e}")
+                last_error = e
+                continue
+            if candidate != profile:
+                hedge_metrics.increment("fallback_wins")
+            return result, model
+
+        # Fire the hedge when the primary is slow, or right away if it failed
+        if pending_profiles and (not futures or time.monotonic() >= hedge_at):
+            hedge = _next_allowed(pending_profiles)
+            if hedge is None:
+                continue
+            print(f"🔀 LLM {first}: sin respuesta o con error, disparando {hedge}")
+            hedge_metrics.increment("hedged")
+            future, hedged_call = _submit(hedge, call)
+            futures[future] = hedged_call
+
+    if futures:
+        for future, hedged_call in futures.items():
+            if future.cancel():
+                # Still queued behind other calls: the provider was never asked
+                get_breaker(hedged_call.provider).release_trial()
+            elif hedged_call.abandon():
+                # It keeps running until its HTTP timeout; the miss is counted now and its late outcome ignored
+                get_breaker(hedged_call.provider).record_failure()
+        hedge_metrics.increment("deadline_exceeded")
+        raise LLMDeadlineExceeded(f"LLM {profile}: sin respuesta en {deadline_seconds or LLM_CALL_DEADLINE_SECONDS}s")
+    raise last_error
+
+
+def _start(profile: str, acall: Callable[[Any], Awaitable[Any]]):
+    """Async `_submit`: the call runs as a task of the running event loop"""
+    model = get_llm(profile)
+    hedged_call = _HedgedCall(profile)
+
+    async def run():
+        _serving_profile.set(profile)  # Local to the task
+        start = time.perf_counter()
+        try:
+            result = await acall(model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            hedged_call.finish(success=False)
+            raise
+        hedge_metrics.record_latency(profile, time.perf_counter() - start)
+        hedged_call.finish(success=True)
+        return result, model
+
+    return asyncio.ensure_future(run()), hedged_call
+
+
+async def ahedged_invoke(profile: str, acall: Callable[[Any], Awaitable[Any]], deadline_seconds: Optional[float] = None) -> Tuple[Any, Any]:
+    """
+    Async `hedged_invoke`: `await acall(model)` without holding a thread during the request.
+
+    At the deadline the calls still running are cancelled, which cancels their HTTP requests.
+
+    Args:
+        profile: LLM profile of the primary call
+        acall: Receives a chat model and awaits the request (e.g. `lambda model: model.ainvoke(prompt)`)
+        deadline_seconds: Hard limit for the whole call (defaults to LLM_CALL_DEADLINE_SECONDS)
+    """
+    hedge_metrics.increment("calls")
+    deadline = time.monotonic() + (deadline_seconds or LLM_CALL_DEADLINE_SECONDS)
+
+    first, pending_profiles = _first_candidate(profile)
+    task, hedged_call = _start(first, acall)
+    tasks = {task: hedged_call}
+    hedge_at = time.monotonic() + _hedge_delay(first)
+
+    last_error: Optional[BaseException] = None
+    try:
+        while tasks:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if pending_profiles:
+                timeout = max(0.0, min(timeout, hedge_at - now))
+
+            done, _ = await asyncio.wait(list(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                candidate = tasks.pop(task).profile
+                try:
+                    result, model = task.result()
+                except Exception as e:
+                    print(f"⚠️ LLM {candidate} falló: {e}")
+                    last_error = e
+                    continue
+                if candidate != profile:
+                    hedge_metrics.increment("fallback_wins")
+                return result, model
+
+            # Fire the hedge when the primary is slow, or right away if it failed
+            if pending_profiles and (not tasks or time.monotonic() >= hedge_at):
+                hedge = _next_allowed(pending_profiles)
+                if hedge is None:
+                    continue
+                print(f"🔀 LLM {first}: sin respuesta o con error, disparando {hedge}")
+                hedge_metrics.increment("hedged")
+                task, hedged_call = _start(hedge, acall)
+                tasks[task] = hedged_call
+
+        if tasks:
+            for task, hedged_call in tasks.items():
+                task.cancel()
+                if hedged_call.abandon():
+                    get_breaker(hedged_call.provider).record_failure()
+            tasks.clear()
+            hedge_metrics.increment("deadline_exceeded")
+            raise LLMDeadlineExceeded(f"LLM {profile}: sin respuesta en {deadline_seconds or LLM_CALL_DEADLINE_SECONDS}s")
+        raise last_error
+    finally:
+        # Losing calls (or all of them if the caller was cancelled) stop here instead of running on
+        for task, hedged_call in tasks.items():
+            task.cancel()
+            if hedged_call.abandon():
+                get_breaker(hedged_call.provider).release_trial()
@@ -0,0 +1,228 @@
+"""
+Tiered model routing for the structured generations.
+
+Short trips with few preferences are generated with the cheap model first. The
+result goes through the route validators; a structural failure (the output
+could not be parsed or the validators raised ValueError), a missed deadline or a
+provider error escalates the request to the main model. Latency, estimated cost,
+escalations and failures by kind are recorded per route and tier (exposed in
+/api/metrics/llm-routing).
+
+    from utils.llm_router import choose_tier, invoke_structured
+    tier = choose_tier(duration_days, preferences)
+    result = invoke_structured("main_itinerary", ViajeState, prompt, validate=..., tier=tier)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from utils.llm_hedge import ahedged_invoke, hedged_invoke, serving_profile
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+# Requests up to this many days (and with few preferences) start with the cheap model
+LLM_ROUTING_CHEAP_MAX_DAYS = int(os.getenv("LLM_ROUTING_CHEAP_MAX_DAYS", "7"))
+LLM_ROUTING_CHEAP_MAX_PREFERENCES = int(os.getenv("LLM_ROUTING_CHEAP_MAX_PREFERENCES", "5"))
+LLM_ROUTING_CHEAP_MAX_NOTES_CHARS = int(os.getenv("LLM_ROUTING_CHEAP_MAX_NOTES_CHARS", "300"))
+
+# USD per 1M tokens (input, output), used to estimate the cost of each call
+LLM_PRICES_PER_MILLION = {
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gpt-4o": (2.50, 10.0),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-5-mini": (0.25, 2.0),
+}
+
+TIER_ESCALATION = {"cheap": "main"}
+
+
+def choose_tier(duration_days: Optional[int], preferences: Optional[dict] = None) -> str:
+    """Profile to start with: `cheap` for short and simple requests, `main` otherwise"""
+    if not LLM_ROUTING_ENABLED or not duration_days:
+        return "main"
+    if duration_days > LLM_ROUTING_CHEAP_MAX_DAYS:
+        return "main"
+
+    preferences = preferences or {}
+    if sum(1 for value in preferences.values() if value) > LLM_ROUTING_CHEAP_MAX_PREFERENCES:
+        return "main"
+    if len(str(preferences.get("notes") or "")) > LLM_ROUTING_CHEAP_MAX_NOTES_CHARS:
+        return "main"
+    return "cheap"
+
+
+def estimate_cost(model: str, usage: Optional[dict]) -> float:
+    if not usage:
+        return 0.0
+    input_price, output_price = LLM_PRICES_PER_MILLION.get(model.split("/")[-1], (0.0, 0.0))
+    return (usage.get("input_tokens", 0) * input_price + usage.get("output_tokens", 0) * output_price) / 1_000_000
+
+
+class RouteMetrics:
+    """Calls, latency, cost and escalations per route and tier"""
+
+    def __init__(self, window: int = 1000):
+        self._routes: Dict[str, dict] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, route: str, tier: str, latency_seconds: float, cost: float, failed: bool, escalated: bool,
+               error_kind: Optional[str] = None) -> None:
+        with self._lock:
+            route_stats = self._routes.setdefault(route, {"requests": 0, "escalations": 0, "tiers": {}})
+            if escalated:
+                route_stats["escalations"] += 1
+            stats = route_stats["tiers"].setdefault(tier, {
+                "calls": 0, "failures": 0, "errors": {}, "cost_usd": 0.0, "latencies": deque(maxlen=self._window),
+            })
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            if error_kind:
+                stats["errors"][error_kind] = stats["errors"].get(error_kind, 0) + 1
+            stats["cost_usd"] += cost
+            stats["latencies"].append(latency_seconds)
+
+    def record_request(self, route: str) -> None:
+        with self._lock:
+            self._routes.setdefault(route, {"requests": 0, "escalations": 0, "tiers": {}})["requests"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for route, route_stats in self._routes.items():
+                tiers = {}
+                for tier, stats in route_stats["tiers"].items():
+                    latencies = sorted(stats["latencies"])
+                    tiers[tier] = {
+                        "calls": stats["calls"],
+                        "failures": stats["failures"],
+                        "errors": dict(stats["errors"]),
+                        "cost_usd": round(stats["cost_usd"], 6),
+                        "avg_latency_seconds": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                        "p95_latency_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+                    }
+                requests = route_stats["requests"]
+                result[route] = {
+                    "requests": requests,
+                    "escalations": route_stats["escalations"],
+                    "escalation_rate": round(route_stats["escalations"] / requests, 3) if requests else 0.0,
+                    "cost_usd": round(sum(tier["cost_usd"] for tier in tiers.values()), 6),
+                    "tiers": tiers,
+                }
+            return result
+
+
+route_metrics = RouteMetrics()
+
+
+def invoke_structured(route: str, schema, prompt, validate: Optional[Callable[[Any], Any]] = None, tier: str = "main",
+                      on_parsed: Optional[Callable[[str, Any], Any]] = None):
+    """
+    Structured output with the model of `tier`, escalating on structural failures.
+
+    Args:
+        route: Name of the generation, used for the metrics
+        schema: Pydantic model of the structured output
+        prompt: Messages (or text) sent to the model, or a function that builds them for the profile
+            serving the call (the tier or its hedge fallback), e.g. for `cacheable_system_message`
+        validate: Receives the parsed output and returns the validated one; raises ValueError when invalid
+        tier: Profile to start with (see `choose_tier`)
+        on_parsed: Receives (tier, parsed output) of every attempt that could be parsed, before `validate`
+
+    Raises:
+        ValueError: If the output of the last tier is also invalid
+        LLMDeadlineExceeded: If the last tier also misses its deadline
+        Exception: The provider error of the last tier
+    """
+    route_metrics.record_request(route)
+
+    while True:
+        attempt = _Attempt(tier)
+        try:
+            # Deadline + hedge with the fallback provider; the model that answered first is returned
+            response, model = hedged_invoke(tier, lambda model: model.with_structured_output(schema, include_raw=True).invoke(_messages(prompt)))
+        except Exception as e:
+            tier = attempt.escalate(route, e)
+            continue
+        try:
+            result = attempt.result(response, model, validate, on_parsed)
+        except ValueError as e:
+            tier = attempt.escalate(route, e)
+            continue
+        return attempt.succeeded(route, result)
+
+
+async def ainvoke_structured(route: str, schema, prompt, validate: Optional[Callable[[Any], Any]] = None, tier: str = "main",
+                             on_parsed: Optional[Callable[[str, Any], Any]] = None):
+    """Async `invoke_structured`: the requests are awaited (`ainvoke`), no thread waits for the model"""
+    route_metrics.record_request(route)
+
+    while True:
+        attempt = _Attempt(tier)
+        try:
+            response, model = await ahedged_invoke(tier, lambda model: model.with_structured_output(schema, include_raw=True).ainvoke(_messages(prompt)))
+        except Exception as e:
+            tier = attempt.escalate(route, e)
+            continue
+        try:
+            result = attempt.result(response, model, validate, on_parsed)
+        except ValueError as e:
+            tier = attempt.escalate(route, e)
+            continue
+        return attempt.succeeded(route, result)
+
+
+def _messages(prompt):
+    """Prompt of the current hedged call, built for its serving profile when `prompt` is a builder"""
+    return prompt(serving_profile()) if callable(prompt) else prompt
+
+
+def _error_kind(error: Exception) -> str:
+    if isinstance(error, TimeoutError):  # LLMDeadlineExceeded and client timeouts
+        return "deadline"
+    if isinstance(error, ValueError):
+        return "validation"
+    return "provider"
+
+
+class _Attempt:
+    """One tier of a structured generation: parsing, validation and its metrics"""
+
+    def __init__(self, tier: str):
+        self.tier = tier
+        self.model_name = tier
+        self.usage = None
+        self.start = time.perf_counter()
+
+    def result(self, response: dict, model, validate, on_parsed):
+        self.model_name = getattr(model, "model_name", None) or getattr(model, "model", None) or self.tier
+        self.usage = getattr(response.get("raw"), "usage_metadata", None)
+        if response.get("parsed") is None:
+            raise ValueError(f"No se pudo interpretar la salida estructurada: {response.get('parsing_error')}")
+        if on_parsed:
+            on_parsed(self.tier, response["parsed"])
+        return validate(response["parsed"]) if validate else response["parsed"]
+
+    def escalate(self, route: str, error: Exception) -> str:
+        """Record the failure and return the next tier (re-raises `error` on the last one)"""
+        next_tier = TIER_ESCALATION.get(self.tier)
+        kind = _error_kind(error)
+        route_metrics.record(route, self.tier, time.perf_counter() - self.start, estimate_cost(self.model_name, self.usage),
+                             failed=True, escalated=next_tier is not None, error_kind=kind)
+        if next_tier is None:
+            raise error
+        print(f"⬆️ {route}: {self.tier} falló ({kind}: {error}). Escalando a {next_tier}")
+        return next_tier
+
+    def succeeded(self, route: str, result):
+        latency = time.perf_counter() - self.start
+        route_metrics.record(route, self.tier, latency, estimate_cost(self.model_name, self.usage), failed=False, escalated=False)
+        print(f"🧭 {route}: generado con {self.tier} ({self.model_name}) en {latency:.1f}s")
+        return result
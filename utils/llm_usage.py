@@ -0,0 +1,76 @@
+"""
+Prompt cache instrumentation of the chat models.
+
+Every model built by `utils.llm` gets `llm_usage_callback`, which reads the
+usage metadata of each response and records, per model, how many input tokens
+were served from the provider prompt cache (exposed in /api/metrics/llm-usage).
+"""
+
+import threading
+from typing import Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class LLMUsageMetrics:
+    """Cached vs. uncached input tokens per model"""
+
+    def __init__(self):
+        self._models: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, input_tokens: int, cached_tokens: int, cache_write_tokens: int) -> None:
+        with self._lock:
+            stats = self._models.setdefault(model, {
+                "calls": 0, "input_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0, "cache_hits": 0,
+            })
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["cache_write_tokens"] += cache_write_tokens
+            if cached_tokens:
+                stats["cache_hits"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                model: {
+                    **stats,
+                    "uncached_tokens": stats["input_tokens"] - stats["cached_tokens"],
+                    "cached_ratio": round(stats["cached_tokens"] / stats["input_tokens"], 3) if stats["input_tokens"] else 0.0,
+                }
+                for model, stats in self._models.items()
+            }
+
+
+llm_usage_metrics = LLMUsageMetrics()
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """Records the input token usage of every model response"""
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        llm_output = response.llm_output or {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+
+                details = usage.get("input_token_details") or {}
+                input_tokens = usage.get("input_tokens", 0) or 0
+                cached_tokens = details.get("cache_read", 0) or 0
+                cache_write_tokens = details.get("cache_creation", 0) or 0
+                model = (
+                    (message.response_metadata or {}).get("model_name")
+                    or llm_output.get("model_name")
+                    or "unknown"
+                )
+
+                llm_usage_metrics.record(model, input_tokens, cached_tokens, cache_write_tokens)
+                print(f"💾 {model}: {input_tokens} input tokens ({cached_tokens} cached, {input_tokens - cached_tokens} uncached)")
+
+
+llm_usage_callback = LLMUsageCallback()
@@ -0,0 +1,47 @@
+"""
+Keyset (cursor) pagination of the itinerary lists.
+
+The lists are ordered by (created_at, itinerary_id) newest first. The cursor
+is the key of the last row of a page, so the next page is a range condition on
+that index instead of an OFFSET scan that gets slower page after page:
+
+    page = await service.get_public_itineraries(limit=20)
+    cursor = next_cursor(page, 20)   # None on the last page
+    page = await service.get_public_itineraries(cursor=decode_cursor(cursor), limit=20)
+"""
+
+import base64
+import uuid
+from datetime import datetime
+from typing import NamedTuple, Optional, Sequence
+
+
+class ListCursor(NamedTuple):
+    created_at: datetime
+    itinerary_id: uuid.UUID
+
+
+def encode_cursor(itinerary) -> str:
+    """Opaque cursor pointing after `itinerary`"""
+    raw = f"{itinerary.created_at.isoformat()}|{itinerary.itinerary_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ListCursor:
+    """
+    Raises:
+        ValueError: If the cursor was not produced by `encode_cursor`
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, itinerary_id = raw.split("|")
+        return ListCursor(datetime.fromisoformat(created_at), uuid.UUID(itinerary_id))
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def next_cursor(page: Sequence, limit: int) -> Optional[str]:
+    """Cursor of the next page, or None when `page` is the last one"""
+    if len(page) < limit or not page:
+        return None
+    return encode_cursor(page[-1])
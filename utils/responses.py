@@ -0,0 +1,54 @@
+"""
+orjson responses for the itinerary routes.
+
+The itinerary router uses `ORJSONResponse` as its default response class, so
+the `response_model` output is rendered by orjson instead of the stdlib json.
+
+`itinerary_response` goes one step further for the routes that return a whole
+itinerary: the stored columns (the `details_itinerary` JSON included) are
+dumped as they are, without validating them again through `ItineraryResponse`.
+The fields and their JSON form are the same; set ITINERARY_RAW_RESPONSES=false
+to go back to the validated `response_model` path.
+"""
+
+import os
+from typing import Optional
+
+import orjson
+from fastapi.responses import Response
+
+from schemas.itinerary import ItineraryResponse
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+ITINERARY_RAW_RESPONSES = os.getenv("ITINERARY_RAW_RESPONSES", "true").lower() == "true"
+
+# Same keys (and order) as the validated ItineraryResponse
+ITINERARY_RESPONSE_FIELDS = tuple(ItineraryResponse.model_fields)
+
+# UUIDs, dates and enums are native to orjson (datetimes as isoformat(), like the schema json_encoders)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def itinerary_to_response_dict(itinerary) -> dict:
+    """Fields of `ItineraryResponse` read straight from an Itinerary row"""
+    return {field: getattr(itinerary, field, None) for field in ITINERARY_RESPONSE_FIELDS}
+
+
+def dumps_itinerary(itinerary) -> bytes:
+    return orjson.dumps(itinerary_to_response_dict(itinerary), option=ORJSON_OPTIONS)
+
+
+def itinerary_response(itinerary, status_code: int = 200, headers: Optional[dict] = None):
+    """
+    Response of a route declared with `response_model=ItineraryResponse`.
+
+    Returns a raw orjson `Response` (which FastAPI sends as it is) or, when raw
+    responses are disabled, the row itself to be validated by the route.
+    """
+    if not ITINERARY_RAW_RESPONSES:
+        return itinerary
+    return Response(dumps_itinerary(itinerary), status_code=status_code, headers=headers, media_type="application/json")
+
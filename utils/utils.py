@@ -1,4 +1,5 @@
-import json
+import orjson
+from pydantic import BaseModel
 from pydantic.json import pydantic_encoder
 
 def extract_chatbot_message(state_info):
@@ -52,13 +53,20 @@ def detect_hil_mode(agent,config):
     
     return is_hil_mode, hil_message, None
 
+def _orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, tuple):
+        return list(obj)  # NamedTuples (StateSnapshot, PregelTask) are not serialized natively by orjson
+    return pydantic_encoder(obj)
+
 def state_to_json(state):
     """Convert the state to a JSON string"""
-    return json.dumps(state, default=pydantic_encoder)
+    return orjson.dumps(state, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
 
 def state_to_dict(state):
-    """Convert the state to a dictionary"""
-    return json.loads(state_to_json(state))
+    """Convert the state to a dictionary (orjson round trip: the same output as json + pydantic_encoder, several times faster)"""
+    return orjson.loads(orjson.dumps(state, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS))
 
 def update_activities_day(itinerary_dict: dict, new_activities_day_dict: dict, titulo_dia: str) -> dict | bool:
     """